@@ -0,0 +1,65 @@
+"""Микробенчмарк парсинга дат API на странице из 80 000 записей.
+
+Сравнивает прежний перебор трех форматов strptime с parse_date_string из models.py.
+Запуск: python benchmarks/bench_dates.py
+"""
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from models import parse_date_string  # noqa: E402
+
+PAGE_SIZE = 80000
+REPEAT = 5
+
+
+def legacy_parse_date_string(date_str):
+    """Прежняя реализация: перебор форматов с перехватом ValueError"""
+    formats = [
+        '%Y-%m-%dT%H:%M:%S.%fZ',
+        '%Y-%m-%dT%H:%M:%S',
+        '%Y-%m-%dT%H:%M:%SZ'
+    ]
+    for fmt in formats:
+        try:
+            return datetime.strptime(date_str, fmt)
+        except ValueError:
+            continue
+    return datetime.now()
+
+
+def make_page():
+    """Синтетическая страница дат в формате API (в основном без пояса, как в /supplier/orders)"""
+    random.seed(42)
+    start = datetime(2025, 3, 1)
+    dates = []
+    for _ in range(PAGE_SIZE):
+        value = start + timedelta(seconds=random.randint(0, 30 * 86400))
+        if random.random() < 0.9:
+            dates.append(value.strftime('%Y-%m-%dT%H:%M:%S'))
+        else:
+            dates.append(value.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z')
+    return dates
+
+
+def main():
+    dates = make_page()
+    # Проверяем, что оба парсера дают одинаковое время на часах
+    for date_str in dates[:1000]:
+        assert parse_date_string(date_str).replace(tzinfo=None) == legacy_parse_date_string(date_str)
+
+    legacy = min(timeit.repeat(lambda: [legacy_parse_date_string(d) for d in dates], number=1, repeat=REPEAT))
+    fast = min(timeit.repeat(lambda: [parse_date_string(d) for d in dates], number=1, repeat=REPEAT))
+
+    print(f"Записей на странице: {PAGE_SIZE}")
+    print(f"strptime (3 формата): {legacy * 1000:8.1f} мс  ({legacy / PAGE_SIZE * 1e6:.2f} мкс/дата)")
+    print(f"parse_date_string:    {fast * 1000:8.1f} мс  ({fast / PAGE_SIZE * 1e6:.2f} мкс/дата)")
+    print(f"Ускорение: x{legacy / fast:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Сквозной бенчмарк: проверка заказов или выкупов от запроса к API до доставки в Telegram.
+
+Каждый сценарий запускает локальную замену API Wildberries и Telegram (fake_api.py)
+и отдельный процесс бота, который выполняет check_orders_async или check_sales_async
+и check_feedbacks_async через WildberriesAPI и ждет доставки всех уведомлений.
+Отчет: событий в секунду, задержка уведомления p50/p99 (от ответа API до доставки
+в Telegram), пиковый RSS процесса бота.
+
+Запуск: python benchmarks/bench_pipeline.py [сценарий ...] [--replay rows.json] [--json result.json]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fake_api  # noqa: E402
+
+# rows - строк в выборке, page_size - строк в ответе (MAX_ORDERS_PER_REQUEST),
+# rate_limit_every/retry_after - ответы 429, delay - задержка ответа статистики
+SCENARIOS = {
+    'orders-5': {'stream': 'orders', 'rows': 5, 'page_size': 80000},
+    'orders-1k': {'stream': 'orders', 'rows': 1000, 'page_size': 80000},
+    'orders-10k': {'stream': 'orders', 'rows': 10000, 'page_size': 80000},
+    'orders-80k': {'stream': 'orders', 'rows': 80000, 'page_size': 80000},
+    'orders-80k-paged': {'stream': 'orders', 'rows': 80000, 'page_size': 10000},
+    'sales-10k': {'stream': 'sales', 'rows': 10000, 'page_size': 80000},
+    'orders-10k-429': {'stream': 'orders', 'rows': 10000, 'page_size': 2000, 'rate_limit_every': 2, 'retry_after': 1},
+    'orders-1k-slow': {'stream': 'orders', 'rows': 1000, 'page_size': 250, 'delay': 1.0},
+}
+
+TIMEOUT = 600  # Предельное время сценария (в секундах)
+
+
+class LatencyRecorder:
+    """Точные значения задержки вместо гистограммы бота: ее корзины рассчитаны на минуты"""
+
+    def __init__(self):
+        self.values = []
+
+    def observe(self, value, **labels):
+        self.values.append(value)
+
+    def quantile(self, q):
+        if not self.values:
+            return None
+        values = sorted(self.values)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_bot_side(config, base_url, results):
+    """Процесс бота: настройки через окружение, затем импорт main"""
+    workdir = tempfile.mkdtemp(prefix='wb-bench-')
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:BENCH',
+        'TELEGRAM_CHAT_ID': '1',
+        'TELEGRAM_API_URL': base_url,
+        'TELEGRAM_CHAT_RATE': '1000',
+        'TELEGRAM_GLOBAL_RATE': '1000',
+        'WB_API_TOKEN': 'bench-stats-token',
+        'WB_FEEDBACK_TOKEN': 'bench-feedback-token',
+        'WB_API_BASE_URL': base_url,
+        'WB_FEEDBACK_API_URL': base_url,
+        'WB_STATS_REQUESTS_PER_MINUTE': '6000',
+        'MAX_ORDERS_PER_REQUEST': str(config['page_size']),
+        'PAGINATION_DELAY': '0',
+        'DIGEST_THRESHOLD': '10',
+        'STATE_DB_PATH': os.path.join(workdir, 'state.db'),
+        'HISTORY_DB_PATH': os.path.join(workdir, 'history.db'),
+        'METRICS_PORT': '0',
+    })
+    results.put(asyncio.run(_run_bot_side(config)))
+
+
+async def _run_bot_side(config):
+    import main
+    from storage import StateStore
+
+    latency = main.ALERT_LAG_SECONDS = LatencyRecorder()
+    stream = config['stream']
+    store = StateStore(main.STATE_DB_PATH)
+    # Курсор на начало данных: первая проверка забирает всю выборку
+    store.set_cursor(stream, fake_api.DATA_START.strftime(fake_api.DATE_FORMAT))
+    history = main.open_history()
+    wb_api = main.WildberriesAPI(main.WB_API_TOKEN, main.WB_FEEDBACK_TOKEN, store, history=history)
+    telegram_bot = main.TelegramBot(main.TELEGRAM_BOT_TOKEN, [wb_api], store)
+    await telegram_bot.app.bot.initialize()
+    delivery_task = asyncio.create_task(telegram_bot.run_delivery_worker())
+
+    check = main.check_orders_async if stream == 'orders' else main.check_sales_async
+    started = time.perf_counter()
+    try:
+        events, feedbacks = await asyncio.gather(
+            check(telegram_bot, wb_api),
+            main.check_feedbacks_async(telegram_bot, wb_api)
+        )
+        while store.outbox_size():
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    finally:
+        delivery_task.cancel()
+        await asyncio.gather(delivery_task, return_exceptions=True)
+        await wb_api.close()
+        await telegram_bot.app.bot.shutdown()
+        store.close()
+        history.close()
+
+    return {
+        'events': events + feedbacks,
+        'seconds': elapsed,
+        'events_per_second': (events + feedbacks) / elapsed if elapsed else 0.0,
+        'wb_requests': main.WB_REQUEST_SECONDS.count(),
+        'rate_limited': wb_api.last_poll[stream]['rate_limited'],
+        'messages': main.TELEGRAM_SEND_SECONDS.count(result='ok'),
+        'latency_p50': latency.quantile(0.5),
+        'latency_p99': latency.quantile(0.99),
+        # ru_maxrss в Linux - в килобайтах
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_scenario(name, replay=None):
+    """Сценарий в двух новых процессах: замена API и бот (метрики и RSS не смешиваются)"""
+    context = multiprocessing.get_context('spawn')
+    config = dict(SCENARIOS[name], replay=replay)
+    queue = context.Queue()
+    server = context.Process(target=fake_api.serve, args=(config, queue), daemon=True)
+    server.start()
+    try:
+        port = queue.get(timeout=120)
+        bot = context.Process(target=run_bot_side, args=(config, f'http://127.0.0.1:{port}', queue))
+        bot.start()
+        try:
+            result = queue.get(timeout=TIMEOUT)
+        finally:
+            bot.join(timeout=10)
+            if bot.is_alive():
+                bot.terminate()
+    finally:
+        server.terminate()
+        server.join()
+    return result
+
+
+def format_latency(value):
+    return "   нет" if value is None else f"{value * 1000:6.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк проверок на локальной замене API")
+    parser.add_argument('scenarios', nargs='*', help=f"сценарии (по умолчанию все): {', '.join(SCENARIOS)}")
+    parser.add_argument('--replay', help="JSON-массив записанных строк API вместо синтетических")
+    parser.add_argument('--json', help="сохранить результаты в файл для сравнения между запусками")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+
+    results = {}
+    print(f"{'Сценарий':<18} {'событий':>8} {'сек':>7} {'событий/с':>10} "
+          f"{'запр. WB':>8} {'сообщ.':>6} {'p50 мс':>7} {'p99 мс':>7} {'RSS МБ':>7}")
+    for name in args.scenarios or SCENARIOS:
+        result = results[name] = run_scenario(name, args.replay)
+        print(f"{name:<18} {result['events']:>8} {result['seconds']:>7.2f} "
+              f"{result['events_per_second']:>10.0f} {result['wb_requests']:>8} {result['messages']:>6} "
+              f"{format_latency(result['latency_p50']):>7} {format_latency(result['latency_p99']):>7} "
+              f"{result['peak_rss_mb']:>7.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
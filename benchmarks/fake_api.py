@@ -0,0 +1,228 @@
+"""Локальная замена API Wildberries и Telegram Bot API для бенчмарков.
+
+Один HTTP-сервер обслуживает все адреса:
+  /api/v1/supplier/orders, /api/v1/supplier/sales - страницы строк начиная с dateFrom
+    (с flag=1 - все строки за день dateFrom);
+  /api/v1/feedbacks, /api/v1/questions - неотвеченные отзывы и вопросы (FEEDBACKS на запрос);
+  /ping - проверка доступности;
+  /bot<token>/getMe, /bot<token>/sendMessage - минимальный Bot API;
+  /stats - счетчики запросов и принятых сообщений (JSON).
+
+Поле date каждой строки (и createdDate отзыва) заполняется временем отдачи страницы, поэтому задержка
+уведомления, которую измеряет бот, считается от ответа API до доставки в Telegram.
+"""
+import asyncio
+import bisect
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from models import MOSCOW_TZ  # noqa: E402
+
+# Начало синтетических данных: курсор бота ставится на эту дату
+DATA_START = datetime(2025, 3, 1, tzinfo=MOSCOW_TZ)
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+ARTICLES = 200
+WAREHOUSES = ['Коледино', 'Подольск', 'Электросталь', 'Казань', 'Краснодар', 'Екатеринбург']
+REGIONS = ['Московская', 'Ленинградская', 'Свердловская', 'Краснодарский край', 'Татарстан']
+
+# Отзывов с оценками и вопросов в каждом ответе API отзывов
+FEEDBACKS = 5
+
+
+def make_rows(stream, count):
+    """Синтетические строки /supplier/orders или /supplier/sales: lastChangeDate растет на секунду"""
+    rows = []
+    for i in range(count):
+        price = 500 + i % 50 * 37
+        row = {
+            'lastChangeDate': (DATA_START + timedelta(seconds=i)).strftime(DATE_FORMAT),
+            'srid': f'bench-{i}',
+            'supplierArticle': f'ART-{i % ARTICLES}',
+            'nmId': 100000 + i % ARTICLES,
+            'warehouseName': WAREHOUSES[i % len(WAREHOUSES)],
+            'warehouseType': 'Склад WB',
+            'regionName': REGIONS[i % len(REGIONS)],
+            'oblastOkrugName': 'Центральный федеральный округ',
+            'totalPrice': price * 2,
+            'priceWithDisc': price,
+            'finishedPrice': price
+        }
+        if stream == 'sales':
+            row['saleID'] = f'S{i}'
+            row['forPay'] = round(price * 0.8, 2)
+            row['feeWB'] = round(price * 0.2, 2)
+        rows.append(row)
+    return rows
+
+
+def load_rows(path, stream, count):
+    """Записанные строки API из JSON-файла, повторенные до count строк.
+
+    Даты lastChangeDate переписываются по порядку, ключи повторов получают суффикс,
+    чтобы постраничная выборка и дедупликация работали как на синтетических данных.
+    """
+    with open(path, encoding='utf-8') as f:
+        recorded = json.load(f)
+    if not recorded:
+        raise ValueError(f"В файле {path} нет строк")
+    key_field = 'saleID' if stream == 'sales' else 'srid'
+    rows = []
+    for i in range(count):
+        row = dict(recorded[i % len(recorded)])
+        row.pop('date', None)  # Заполняется временем отдачи страницы
+        row['lastChangeDate'] = (DATA_START + timedelta(seconds=i)).strftime(DATE_FORMAT)
+        if i >= len(recorded):
+            row[key_field] = f"{row.get(key_field)}-{i // len(recorded)}"
+        rows.append(row)
+    return rows
+
+
+class FakeAPI:
+    """Состояние сервера: данные потока, режим ответов и счетчики.
+
+    config: stream ('orders' или 'sales'), rows (число строк), page_size (строк в ответе),
+    rate_limit_every (каждый N-й запрос статистики получает 429, 0 - никогда),
+    retry_after (пауза в заголовке X-Ratelimit-Retry), delay (задержка ответа статистики
+    в секундах), replay (путь к записанным строкам или None).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.stream = config['stream']
+        if config.get('replay'):
+            rows = load_rows(config['replay'], self.stream, config['rows'])
+        else:
+            rows = make_rows(self.stream, config['rows'])
+        self.dates = [row['lastChangeDate'] for row in rows]
+        # Строки заранее сериализованы без поля date: его подставляем при отдаче страницы
+        self.encoded = [json.dumps(row, ensure_ascii=False)[1:].encode('utf-8') for row in rows]
+        self.stats_requests = 0
+        self.requests = {}
+        self.messages = 0
+        self.message_id = 0
+
+    async def route(self, method, path, query, body):
+        """Ответ на запрос: (код, заголовки, тело)"""
+        self.requests[path] = self.requests.get(path, 0) + 1
+        if path in ('/api/v1/supplier/orders', '/api/v1/supplier/sales'):
+            return await self.statistics(path, query)
+        if path in ('/api/v1/feedbacks', '/api/v1/questions'):
+            return self.feedbacks(path.rsplit('/', 1)[-1], query)
+        if path == '/ping':
+            return self.json(200, {'TS': datetime.now(MOSCOW_TZ).isoformat(), 'Status': 'OK'})
+        if path == '/stats':
+            return self.json(200, {'requests': self.requests, 'messages': self.messages})
+        if path.startswith('/bot'):
+            return self.telegram(path.rsplit('/', 1)[-1], body)
+        return self.json(404, {'error': 'not found'})
+
+    async def statistics(self, path, query):
+        self.stats_requests += 1
+        if self.config.get('delay'):
+            await asyncio.sleep(self.config['delay'])
+        every = self.config.get('rate_limit_every')
+        if every and self.stats_requests % every == 0:
+            status, headers, body = self.json(429, {'title': 'too many requests'})
+            headers['X-Ratelimit-Retry'] = str(self.config.get('retry_after', 1))
+            return status, headers, body
+        if not path.endswith(self.stream):
+            return self.json(200, [])
+
+        date_from = query.get('dateFrom', [''])[0]
+        if query.get('flag', ['0'])[0] == '1':
+            # Все строки за день: даты в ISO 8601, после 'T' любого времени этого дня идет 'U'
+            day = date_from[:10]
+            page = self.encoded[bisect.bisect_left(self.dates, day):bisect.bisect_left(self.dates, day + 'U')]
+        else:
+            start = bisect.bisect_left(self.dates, date_from)
+            page = self.encoded[start:start + self.config['page_size']]
+        served_at = datetime.now(MOSCOW_TZ).strftime('%Y-%m-%dT%H:%M:%S.%f').encode('ascii')
+        prefix = b'{"date":"' + served_at + b'",'
+        body = b'[' + b','.join(prefix + row for row in page) + b']'
+        return 200, {'Content-Type': 'application/json'}, body
+
+    def feedbacks(self, stream, query):
+        """Страница skip/take из FEEDBACKS записей, созданных в момент ответа"""
+        created = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        records = [
+            {
+                'id': f'{stream}-{i}',
+                'text': 'Синтетический отзыв для бенчмарка' if stream == 'feedbacks' else 'Есть другой размер?',
+                'productValuation': i % 5 + 1,
+                'createdDate': created,
+                'productDetails': {'supplierArticle': f'ART-{i}', 'productName': 'Товар', 'nmId': 100000 + i}
+            }
+            for i in range(FEEDBACKS)
+        ]
+        skip = int(query.get('skip', ['0'])[0])
+        take = int(query.get('take', ['5000'])[0])
+        return self.json(200, {'data': {stream: records[skip:skip + take]}, 'error': False})
+
+    def telegram(self, method, body):
+        if method == 'getMe':
+            return self.json(200, {'ok': True, 'result': {
+                'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'
+            }})
+        if method == 'sendMessage':
+            fields = parse_qs(body.decode('utf-8'))
+            self.messages += 1
+            self.message_id += 1
+            chat_id = int(fields.get('chat_id', ['0'])[0])
+            return self.json(200, {'ok': True, 'result': {
+                'message_id': self.message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': fields.get('text', [''])[0]
+            }})
+        return self.json(200, {'ok': True, 'result': True})
+
+    @staticmethod
+    def json(status, data):
+        return status, {'Content-Type': 'application/json'}, json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    async def handle(self, reader, writer):
+        """Минимальный HTTP/1.1 с keep-alive"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode('latin-1').strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                url = urlsplit(target)
+                status, response_headers, payload = await self.route(method, url.path, parse_qs(url.query), body)
+                head = f'HTTP/1.1 {status} Bench\r\nContent-Length: {len(payload)}\r\n'
+                head += ''.join(f'{name}: {value}\r\n' for name, value in response_headers.items())
+                writer.write(head.encode('latin-1') + b'\r\n' + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve(config, ready):
+    api = FakeAPI(config)
+    server = await asyncio.start_server(api.handle, '127.0.0.1', 0)
+    ready.put(server.sockets[0].getsockname()[1])
+    async with server:
+        await server.serve_forever()
+
+
+def serve(config, ready):
+    """Запуск сервера в отдельном процессе: номер порта передается в очередь ready"""
+    asyncio.run(_serve(config, ready))
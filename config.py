@@ -7,18 +7,135 @@ load_dotenv()
 # Настройки Telegram
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+# ID пользователей с правом на служебные команды (/backfill) через запятую.
+# Если не заданы, команды доступны всем пользователям из чатов кабинетов
+ADMIN_IDS = os.getenv('ADMIN_IDS', '')
+
+# Лимиты отправки сообщений Telegram (сообщений в секунду)
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))  # В личный чат
+TELEGRAM_GROUP_RATE = float(os.getenv('TELEGRAM_GROUP_RATE', str(20 / 60)))  # В группу: 20 в минуту
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))  # Всего по боту
+
+# Адрес Bot API (можно указать локальный сервер для тестов)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+
+# Режим webhook: если задан внешний адрес, Telegram присылает обновления во встроенный
+# HTTP-сервер бота вместо постоянного long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Например, https://bot.example.com
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')  # Адрес встроенного сервера
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+# Секретный токен для проверки запросов от Telegram (если не задан, создается при запуске)
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
 
 # Настройки Wildberries API
 WB_API_TOKEN = os.getenv('WB_API_TOKEN')  # Токен для статистики
 WB_FEEDBACK_TOKEN = os.getenv('WB_FEEDBACK_TOKEN')  # Токен для отзывов и вопросов
-WB_API_BASE_URL = 'https://statistics-api.wildberries.ru'
-WB_FEEDBACK_API_URL = 'https://feedbacks-api.wildberries.ru'
+# Адреса API (можно указать локальный сервер для тестов и бенчмарков)
+WB_API_BASE_URL = os.getenv('WB_API_BASE_URL', 'https://statistics-api.wildberries.ru')
+WB_FEEDBACK_API_URL = os.getenv('WB_FEEDBACK_API_URL', 'https://feedbacks-api.wildberries.ru')
+
+# Файл с кабинетами продавцов (JSON-массив) для работы с несколькими кабинетами
+# в одном процессе. Если не задан, используется один кабинет из WB_API_TOKEN,
+# WB_FEEDBACK_TOKEN и TELEGRAM_CHAT_ID
+SELLERS_FILE = os.getenv('SELLERS_FILE')
+
+# Сколько проверок (по всем кабинетам и потокам) может выполняться одновременно
+MAX_CONCURRENT_POLLS = int(os.getenv('MAX_CONCURRENT_POLLS', '4'))
+
+# Загрузка истории за прошедшие дни (backfill): сколько дневных окон запрашивать
+# одновременно (темп запросов все равно задает квота API) и по сколько строк писать в историю
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '4'))
+BACKFILL_BATCH_SIZE = int(os.getenv('BACKFILL_BATCH_SIZE', '5000'))
+
+# Режим работы процесса:
+#   all      - бот Telegram и проверки Wildberries в одном процессе (по умолчанию)
+#   frontend - только бот Telegram и доставка уведомлений из общей очереди
+#   worker   - только проверки Wildberries (таких процессов может быть несколько)
+BOT_MODE = os.getenv('BOT_MODE', 'all')
+
+# Срок аренды кабинета обработчиком в раздельном режиме (в секундах):
+# через это время кабинеты остановившегося обработчика забирают другие
+LEASE_TTL = int(os.getenv('LEASE_TTL', '60'))
 
 # Интервал проверки новых данных (в секундах)
 CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', '1800'))  # 30 минут по умолчанию
 
+# Интервалы проверки выкупов и отзывов (в секундах), по умолчанию как у заказов
+SALES_CHECK_INTERVAL = int(os.getenv('SALES_CHECK_INTERVAL', str(CHECK_INTERVAL)))
+FEEDBACK_CHECK_INTERVAL = int(os.getenv('FEEDBACK_CHECK_INTERVAL', str(CHECK_INTERVAL)))
+
+# Границы адаптивного интервала проверки (в секундах): интервал сокращается,
+# когда проверки приносят данные, и растет при пустых ответах или ограничении частоты
+ORDERS_MIN_INTERVAL = int(os.getenv('ORDERS_MIN_INTERVAL', '300'))
+ORDERS_MAX_INTERVAL = int(os.getenv('ORDERS_MAX_INTERVAL', '3600'))
+SALES_MIN_INTERVAL = int(os.getenv('SALES_MIN_INTERVAL', '600'))
+SALES_MAX_INTERVAL = int(os.getenv('SALES_MAX_INTERVAL', '3600'))
+FEEDBACK_MIN_INTERVAL = int(os.getenv('FEEDBACK_MIN_INTERVAL', '300'))
+FEEDBACK_MAX_INTERVAL = int(os.getenv('FEEDBACK_MAX_INTERVAL', '3600'))
+
+# Квота API статистики на токен: запросов в минуту ко всем методам (/orders, /sales) вместе
+WB_STATS_REQUESTS_PER_MINUTE = int(os.getenv('WB_STATS_REQUESTS_PER_MINUTE', '1'))
+
+# Квота API отзывов и вопросов: запросов в секунду
+WB_FEEDBACK_REQUESTS_PER_SECOND = float(os.getenv('WB_FEEDBACK_REQUESTS_PER_SECOND', '3'))
+
+# Повторы запросов к API Wildberries при ответах 429 и 5xx:
+# максимальное число повторов и предельная пауза между ними (в секундах)
+WB_MAX_RETRIES = int(os.getenv('WB_MAX_RETRIES', '3'))
+WB_MAX_BACKOFF = int(os.getenv('WB_MAX_BACKOFF', '300'))
+
 # Максимальное количество заказов/продаж в одном ответе API
 MAX_ORDERS_PER_REQUEST = int(os.getenv('MAX_ORDERS_PER_REQUEST', '80000'))
 
 # Задержка между запросами при пагинации (в секундах)
-PAGINATION_DELAY = int(os.getenv('PAGINATION_DELAY', '1')) 
\ No newline at end of file
+PAGINATION_DELAY = int(os.getenv('PAGINATION_DELAY', '1'))
+
+# Размер пула HTTP-соединений к каждому хосту API Wildberries
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '4'))
+
+# Время жизни неактивного keep-alive соединения (в секундах)
+HTTP_KEEPALIVE_EXPIRY = int(os.getenv('HTTP_KEEPALIVE_EXPIRY', '300'))
+
+# Путь к базе SQLite с состоянием бота (обработанные заказы и продажи)
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'wb_bot_state.db')
+
+# Путь к базе SQLite с историей заказов и выкупов (пусто - история не ведется)
+HISTORY_DB_PATH = os.getenv('HISTORY_DB_PATH', 'wb_history.db')
+
+# Срок хранения отметок об обработанных заказах/продажах (в днях)
+DEDUP_RETENTION_DAYS = int(os.getenv('DEDUP_RETENTION_DAYS', '30'))
+
+# Срок хранения связей заказов с выкупами, возвратами и отменами (в днях)
+ORDER_INDEX_RETENTION_DAYS = int(os.getenv('ORDER_INDEX_RETENTION_DAYS', '90'))
+
+# Окно перекрытия при повторной выборке от сохраненного курсора (в минутах)
+# Защищает от пропуска записей, пришедших с запоздавшим lastChangeDate
+CURSOR_OVERLAP_MINUTES = int(os.getenv('CURSOR_OVERLAP_MINUTES', '30'))
+
+# Порог количества событий за проверку, после которого вместо отдельных
+# уведомлений отправляются сводки по артикулам и складам (0 - без сводок)
+DIGEST_THRESHOLD = int(os.getenv('DIGEST_THRESHOLD', '10'))
+
+# Очередь исходящих уведомлений: максимальное число попыток доставки
+# и предельная пауза между повторами (в секундах)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '20'))
+OUTBOX_MAX_BACKOFF = int(os.getenv('OUTBOX_MAX_BACKOFF', '600'))
+
+# Журнал: уровень (DEBUG, INFO, WARNING, ERROR), файл со строками JSON (пусто - только консоль)
+# и ротация по размеру (LOG_MAX_BYTES) или по времени (LOG_ROTATE_WHEN, например midnight)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN') or None
+
+# HTTP-сервер метрик в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics
+# (0 - сервер отключен, метрики доступны только командой /metrics)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+# Проверка состояния API (/status): сколько секунд результат общий для всех пользователей
+# и сколько секунд считаются свежими данные регулярных проверок (после этого - запрос /ping)
+STATUS_CACHE_TTL = int(os.getenv('STATUS_CACHE_TTL', '30'))
+STATUS_HEALTH_MAX_AGE = int(os.getenv('STATUS_HEALTH_MAX_AGE', '900'))
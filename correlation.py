@@ -0,0 +1,167 @@
+from collections import OrderedDict
+
+from models import to_timestamp
+
+
+# Исходы заказа и счетчики статистики артикула, которые они увеличивают
+OUTCOME_COUNTERS = {'sale': 1, 'return': 2, 'cancel': 3}
+
+
+class OrderIndex:
+    """Связь заказа с выкупом, возвратом или отменой по srid для одного кабинета.
+
+    Все связи хранятся в базе состояния, в памяти - только последние использованные
+    (не больше capacity). По каждому артикулу ведутся счетчики заказов, выкупов, возвратов
+    и отмен: событие меняет их за O(1), а повтор того же события ничего не меняет.
+    Возвращенный заказ перестает считаться выкупом. Записи копятся до вызова flush():
+    неизвестные в памяти заказы пачки читаются из базы одним запросом, а изменения
+    записываются одной транзакцией.
+    """
+
+    def __init__(self, store, seller='', capacity=10000):
+        self.store = store
+        self.seller = seller
+        self.capacity = capacity
+        self._links = OrderedDict()  # srid -> [время заказа, артикул, исход, время исхода]
+        self._stats = {}  # Артикул -> [заказов, выкупов, возвратов, отмен]
+        self._pending = []  # Записи до flush(): (srid, saleID или None, время, артикул, отмена, время отмены)
+        self._dirty_links = set()
+        self._dirty_stats = set()
+
+    @property
+    def pending(self):
+        """Сколько записей ждут flush()"""
+        return len(self._pending)
+
+    def _link(self, srid):
+        """Связь заказа из памяти или из базы (или None)"""
+        link = self._links.get(srid)
+        if link is not None:
+            self._links.move_to_end(srid)
+            return link
+        row = self.store.get_order_link(self.seller, srid)
+        if row is None:
+            return None
+        link = self._links[srid] = list(row)
+        return link
+
+    def _article_stats(self, article):
+        stats = self._stats.get(article)
+        if stats is None:
+            row = self.store.get_article_stats(self.seller, article)
+            stats = self._stats[article] = list(row) if row else [0, 0, 0, 0]
+        return stats
+
+    def _count(self, article, counter, delta):
+        self._article_stats(article)[counter] += delta
+        self._dirty_stats.add(article)
+
+    def observe(self, stream, item):
+        """Разобранная запись потока orders (Order) или sales (Sale): учитывается при flush()"""
+        if not item.srid:
+            return
+        if stream == 'orders':
+            self._pending.append((
+                item.srid, None, to_timestamp(item.date), item.supplier_article or '',
+                item.is_cancel, to_timestamp(item.cancel_date)
+            ))
+        elif stream == 'sales':
+            if item.sale_id and item.sale_id[0] in 'SR':
+                self._pending.append((
+                    item.srid, item.sale_id, to_timestamp(item.date), item.supplier_article or '', False, None
+                ))
+
+    def _apply_pending(self):
+        """Учет накопленных записей: недостающие в памяти заказы читаются из базы разом"""
+        pending, self._pending = self._pending, []
+        missing = {item[0] for item in pending if item[0] not in self._links}
+        if missing:
+            for srid, row in self.store.get_order_links(self.seller, missing).items():
+                self._links[srid] = list(row)
+        for srid, sale_id, at, article, cancelled, cancelled_at in pending:
+            if sale_id is None:
+                self.observe_order(srid, at, article, cancelled, cancelled_at)
+            else:
+                self.observe_sale(srid, sale_id, at, article)
+
+    def observe_order(self, srid, ordered_at, article, cancelled=False, cancelled_at=None):
+        """Заказ (при повторном получении с isCancel - его отмена). Время - unix time"""
+        link = self._links.get(srid)
+        if link is None:
+            link = self._links[srid] = [ordered_at, article, None, None]
+            self._count(article, 0, 1)
+            self._dirty_links.add(srid)
+        else:
+            self._links.move_to_end(srid)
+            if link[0] is None and ordered_at is not None:
+                # Выкуп или возврат пришел раньше заказа: теперь заказ известен и учитывается целиком
+                link[0] = ordered_at
+                self._count(link[1], 0, 1)
+                if link[2] is not None:
+                    self._count(link[1], OUTCOME_COUNTERS[link[2]], 1)
+                self._dirty_links.add(srid)
+        if cancelled:
+            self._set_outcome(srid, link, 'cancel', cancelled_at or ordered_at)
+
+    def observe_sale(self, srid, sale_id, sold_at, article):
+        """Выкуп (saleID на S) или возврат (saleID на R) по заказу srid. Время - unix time"""
+        link = self._links.get(srid)
+        if link is None:
+            # Заказ сделан до начала учета: исход запоминаем, но в статистику не включаем
+            link = self._links[srid] = [None, article, None, None]
+        else:
+            self._links.move_to_end(srid)
+        self._set_outcome(srid, link, 'sale' if sale_id[0] == 'S' else 'return', sold_at)
+
+    def _set_outcome(self, srid, link, outcome, at):
+        """Смена исхода заказа с пересчетом счетчиков артикула"""
+        previous = link[2]
+        if previous == outcome or previous == 'return':
+            return  # Повтор события или возврат, после которого исход не меняется
+        if previous == 'sale' and outcome == 'cancel':
+            return  # Выкупленный заказ уже не отменить
+        if link[0] is not None:
+            if previous is not None:
+                # Прежний исход больше не действует: отмена сменилась выкупом, выкуп - возвратом
+                self._count(link[1], OUTCOME_COUNTERS[previous], -1)
+            self._count(link[1], OUTCOME_COUNTERS[outcome], 1)
+        link[2] = outcome
+        link[3] = at
+        self._dirty_links.add(srid)
+
+    def since_order(self, srid, at):
+        """Сколько секунд прошло от заказа srid до момента at (или None, если заказ неизвестен)"""
+        link = self._link(srid) if srid else None
+        if link is None or link[0] is None or at is None:
+            return None
+        return max(0.0, at - link[0])
+
+    def article_stats(self, article):
+        """Счетчики и доли выкупа и отмен по артикулу (доли - от всех учтенных заказов).
+
+        sales - выкупленные и не возвращенные заказы, returns - возвращенные после выкупа.
+        """
+        orders, sales, returns, cancels = self._article_stats(article)
+        return {
+            'orders': orders,
+            'sales': sales,
+            'returns': returns,
+            'cancels': cancels,
+            'buyout_rate': sales / orders if orders else None,
+            'cancel_rate': cancels / orders if orders else None
+        }
+
+    def flush(self):
+        """Учет накопленных записей, запись изменений в базу и вытеснение давно не использованных заказов"""
+        if self._pending:
+            self._apply_pending()
+        if self._dirty_links or self._dirty_stats:
+            self.store.save_correlation(
+                self.seller,
+                [(srid, *self._links[srid]) for srid in self._dirty_links],
+                [(article, *self._stats[article]) for article in self._dirty_stats]
+            )
+            self._dirty_links.clear()
+            self._dirty_stats.clear()
+        while len(self._links) > self.capacity:
+            self._links.popitem(last=False)
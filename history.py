@@ -0,0 +1,348 @@
+import math
+import sqlite3
+
+from models import MOSCOW_TZ, to_timestamp
+
+
+# Столбцы истории по потокам: ключ записи, затем поля, общие для запросов и отчетов
+COLUMNS = {
+    'orders': (
+        'srid', 'date', 'last_change_date', 'supplier_article', 'nm_id', 'warehouse_name',
+        'region_name', 'finished_price', 'price_with_disc', 'is_cancel'
+    ),
+    'sales': (
+        'sale_id', 'srid', 'date', 'last_change_date', 'supplier_article', 'nm_id', 'warehouse_name',
+        'region_name', 'finished_price', 'price_with_disc', 'for_pay', 'fee_wb'
+    )
+}
+
+# Столбцы с индексами: по ним история отвечает на вопросы без полного просмотра таблицы
+INDEXED_COLUMNS = ('date', 'supplier_article', 'nm_id', 'warehouse_name', 'region_name')
+
+# Ключ записи потока в истории
+KEY_COLUMNS = {'orders': 'srid', 'sales': 'sale_id'}
+
+# Потоки запросов к истории: таблица и условие. Возвраты (saleID на R) лежат в sales,
+# но выкупами не считаются - как в агрегатах и в статистике выкупа по артикулам
+QUERY_STREAMS = {
+    'orders': ('orders', None),
+    'sales': ('sales', "substr(sale_id, 1, 1) != 'R'"),
+    'returns': ('sales', "substr(sale_id, 1, 1) = 'R'")
+}
+
+# Агрегаты по часам и по дням (московским) для отчетов: начало периода из даты записи в unix time
+MSK_OFFSET = int(MOSCOW_TZ.utcoffset(None).total_seconds())
+ROLLUPS = {
+    'rollup_hourly': 'CAST({date} / 3600 AS INTEGER) * 3600',
+    'rollup_daily': f'CAST(({{date}} + {MSK_OFFSET}) / 86400 AS INTEGER) * 86400 - {MSK_OFFSET}'
+}
+# Суммы в агрегатах: у заказов нет forPay и feeWB
+ROLLUP_AMOUNTS = {
+    'orders': ('finished_price', '0', '0'),
+    'sales': ('finished_price', 'for_pay', 'fee_wb')
+}
+# Поток агрегата для записи: возвраты (saleID на R) учитываются отдельно от выкупов
+ROLLUP_STREAMS = {
+    'orders': "'orders'",
+    'sales': "CASE WHEN substr({row}.sale_id, 1, 1) = 'R' THEN 'returns' ELSE 'sales' END"
+}
+# Версия агрегатов в PRAGMA user_version: при смене триггеры пересоздаются, а агрегаты пересчитываются
+# (1 - возвраты в отдельном потоке returns)
+ROLLUP_VERSION = 1
+
+
+def order_row(order):
+    """Строка истории из разобранного заказа Order (в порядке COLUMNS['orders'])"""
+    return (
+        order.srid,
+        to_timestamp(order.date),
+        order.last_change_date,
+        order.supplier_article,
+        order.nm_id,
+        order.warehouse_name,
+        order.region_name,
+        order.finished_price,
+        order.price_with_disc,
+        int(order.is_cancel)
+    )
+
+
+def sale_row(sale):
+    """Строка истории из разобранного выкупа Sale (в порядке COLUMNS['sales'])"""
+    return (
+        sale.sale_id,
+        sale.srid,
+        to_timestamp(sale.date),
+        sale.last_change_date,
+        sale.supplier_article,
+        sale.nm_id,
+        sale.warehouse_name,
+        sale.region_name,
+        sale.finished_price,
+        sale.price_with_disc,
+        sale.for_pay,
+        sale.fee_wb
+    )
+
+
+ROW_BUILDERS = {'orders': order_row, 'sales': sale_row}
+
+
+def _rollup_amounts(stream, row):
+    """Выражения сумм для агрегата: столбцы строки row (NEW, OLD или таблицы) или 0"""
+    return [f"{row}.{column}" if column != '0' else '0' for column in ROLLUP_AMOUNTS[stream]]
+
+
+def _rollup_statement(table, stream, row, sign):
+    """Изменение агрегата table на запись row (NEW или OLD) со знаком sign в теле триггера"""
+    bucket = ROLLUPS[table].format(date=f"{row}.date")
+    rollup_stream = ROLLUP_STREAMS[stream].format(row=row)
+    amounts = ', '.join(f"{sign}{value}" for value in _rollup_amounts(stream, row))
+    return f"""
+        INSERT INTO {table} (seller, stream, bucket, supplier_article, warehouse_name,
+                             count, finished_price, for_pay, fee_wb)
+        SELECT {row}.seller, {rollup_stream}, {bucket}, COALESCE({row}.supplier_article, ''),
+               COALESCE({row}.warehouse_name, ''), {sign}1, {amounts}
+        WHERE {row}.date IS NOT NULL
+        ON CONFLICT (seller, stream, bucket, supplier_article, warehouse_name) DO UPDATE SET
+            count = count + excluded.count,
+            finished_price = finished_price + excluded.finished_price,
+            for_pay = for_pay + excluded.for_pay,
+            fee_wb = fee_wb + excluded.fee_wb;
+    """
+
+
+class HistoryStore:
+    """История заказов и выкупов в SQLite: отвечает на вопросы без запросов к API.
+
+    Записи каждой страницы API добавляются одной транзакцией. Повторно полученная запись
+    (например, с обновленным lastChangeDate) заменяет прежнюю по ключу srid или saleID.
+    Агрегаты по часам и дням для отчетов обновляются триггерами в той же транзакции,
+    поэтому отчет не просматривает записи и не обращается к API.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    @property
+    def conn(self):
+        """Ленивое открытие базы: соединение создается при первом обращении"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_schema()
+        return self._conn
+
+    def _create_schema(self):
+        """Создание таблиц и индексов, если их еще нет"""
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS orders (
+                    seller TEXT NOT NULL,
+                    srid TEXT NOT NULL,
+                    date REAL,
+                    last_change_date TEXT,
+                    supplier_article TEXT,
+                    nm_id INTEGER,
+                    warehouse_name TEXT,
+                    region_name TEXT,
+                    finished_price REAL NOT NULL DEFAULT 0,
+                    price_with_disc REAL NOT NULL DEFAULT 0,
+                    is_cancel INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (seller, srid)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sales (
+                    seller TEXT NOT NULL,
+                    sale_id TEXT NOT NULL,
+                    srid TEXT,
+                    date REAL,
+                    last_change_date TEXT,
+                    supplier_article TEXT,
+                    nm_id INTEGER,
+                    warehouse_name TEXT,
+                    region_name TEXT,
+                    finished_price REAL NOT NULL DEFAULT 0,
+                    price_with_disc REAL NOT NULL DEFAULT 0,
+                    for_pay REAL NOT NULL DEFAULT 0,
+                    fee_wb REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (seller, sale_id)
+                )
+                """
+            )
+            for table in COLUMNS:
+                for column in INDEXED_COLUMNS:
+                    self._conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})"
+                    )
+
+            # Базы прежних версий: агрегаты строятся по уже накопленной истории
+            rebuild = self._conn.execute("PRAGMA user_version").fetchone()[0] < ROLLUP_VERSION
+            if rebuild:
+                for stream in COLUMNS:
+                    for event in ('insert', 'update', 'delete'):
+                        self._conn.execute(f"DROP TRIGGER IF EXISTS {stream}_rollup_{event}")
+            for table in ROLLUPS:
+                self._conn.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        seller TEXT NOT NULL,
+                        stream TEXT NOT NULL,
+                        bucket INTEGER NOT NULL,
+                        supplier_article TEXT NOT NULL,
+                        warehouse_name TEXT NOT NULL,
+                        count INTEGER NOT NULL DEFAULT 0,
+                        finished_price REAL NOT NULL DEFAULT 0,
+                        for_pay REAL NOT NULL DEFAULT 0,
+                        fee_wb REAL NOT NULL DEFAULT 0,
+                        PRIMARY KEY (seller, stream, bucket, supplier_article, warehouse_name)
+                    ) WITHOUT ROWID
+                    """
+                )
+            for stream in COLUMNS:
+                insert = ''.join(_rollup_statement(table, stream, 'NEW', '') for table in ROLLUPS)
+                delete = ''.join(_rollup_statement(table, stream, 'OLD', '-') for table in ROLLUPS)
+                self._conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {stream}_rollup_insert AFTER INSERT ON {stream} BEGIN {insert} END"
+                )
+                self._conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {stream}_rollup_update AFTER UPDATE ON {stream} BEGIN {delete} {insert} END"
+                )
+                self._conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {stream}_rollup_delete AFTER DELETE ON {stream} BEGIN {delete} END"
+                )
+            if rebuild:
+                self._rebuild_rollups()
+                self._conn.execute(f"PRAGMA user_version = {ROLLUP_VERSION}")
+
+    def _rebuild_rollups(self):
+        """Пересчет агрегатов по всем записям истории"""
+        for table, bucket_expression in ROLLUPS.items():
+            self._conn.execute(f"DELETE FROM {table}")
+            for stream in COLUMNS:
+                bucket = bucket_expression.format(date='date')
+                rollup_stream = ROLLUP_STREAMS[stream].format(row=stream)
+                amounts = ', '.join(f"SUM({value})" for value in _rollup_amounts(stream, stream))
+                self._conn.execute(
+                    f"""
+                    INSERT INTO {table} (seller, stream, bucket, supplier_article, warehouse_name,
+                                         count, finished_price, for_pay, fee_wb)
+                    SELECT seller, {rollup_stream}, {bucket}, COALESCE(supplier_article, ''),
+                           COALESCE(warehouse_name, ''), COUNT(*), {amounts}
+                    FROM {stream} WHERE date IS NOT NULL
+                    GROUP BY 1, 2, 3, 4, 5
+                    """
+                )
+
+    @staticmethod
+    def row(stream, item):
+        """Строка истории из разобранной записи потока stream (Order или Sale)"""
+        return ROW_BUILDERS[stream](item)
+
+    def ingest(self, stream, seller, rows):
+        """Добавление строк страницы (из row()) одной транзакцией. Возвращает их количество"""
+        columns = COLUMNS[stream]
+        rows = [(seller,) + row for row in rows if row[0]]
+        if rows:
+            placeholders = ', '.join('?' * (len(columns) + 1))
+            updates = ', '.join(f"{column} = excluded.{column}" for column in columns[1:])
+            with self.conn:
+                # Запись без изменений (тот же lastChangeDate) не трогаем: агрегаты не пересчитываются
+                self.conn.executemany(
+                    f"""
+                    INSERT INTO {stream} (seller, {', '.join(columns)}) VALUES ({placeholders})
+                    ON CONFLICT (seller, {KEY_COLUMNS[stream]}) DO UPDATE SET {updates}
+                    WHERE excluded.last_change_date IS NOT {stream}.last_change_date
+                    """,
+                    rows
+                )
+        return len(rows)
+
+    def _where(self, stream, seller, date_from, date_to, filters):
+        """Таблица и условие выборки потока по кабинету, периоду [date_from, date_to) и индексированным полям"""
+        table, condition = QUERY_STREAMS[stream]
+        conditions = ["seller = ?"]
+        params = [seller]
+        if condition:
+            conditions.append(condition)
+        if date_from is not None:
+            conditions.append("date >= ?")
+            params.append(date_from.timestamp())
+        if date_to is not None:
+            conditions.append("date < ?")
+            params.append(date_to.timestamp())
+        for column, value in filters.items():
+            if column not in INDEXED_COLUMNS:
+                raise ValueError(f"Фильтр по полю {column} не поддерживается")
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        return table, " AND ".join(conditions), params
+
+    def find(self, stream, seller='', date_from=None, date_to=None, limit=100, **filters):
+        """Записи потока (orders, sales или returns) за период с фильтрами по артикулу, nmId,
+        складу и региону, новые первыми"""
+        table, where, params = self._where(stream, seller, date_from, date_to, filters)
+        return self.conn.execute(
+            f"SELECT * FROM {table} WHERE {where} ORDER BY date DESC LIMIT ?",
+            params + [limit]
+        ).fetchall()
+
+    def summary(self, stream, seller='', date_from=None, date_to=None, **filters):
+        """Количество записей и сумма finishedPrice за период с теми же фильтрами, что и find()"""
+        table, where, params = self._where(stream, seller, date_from, date_to, filters)
+        count, total = self.conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(finished_price), 0) FROM {table} WHERE {where}",
+            params
+        ).fetchone()
+        return {'count': count, 'finished_price': total}
+
+    def rollup(self, stream, seller, date_from, date_to):
+        """Итоги потока за период [date_from, date_to) по артикулам и складам из агрегатов.
+
+        Потоки: orders, sales (выкупы без возвратов) и returns (возвраты, saleID на R).
+
+        Целые дни берутся из дневных агрегатов, края периода - из часовых (с точностью до часа).
+        Возвращает строки (supplier_article, warehouse_name, count, finished_price, for_pay, fee_wb),
+        самые частые первыми.
+        """
+        start = date_from.timestamp()
+        end = date_to.timestamp()
+        hour_start = start // 3600 * 3600
+        # Границы целых московских дней внутри периода
+        first_day = math.ceil((start + MSK_OFFSET) / 86400) * 86400 - MSK_OFFSET
+        last_day = (end + MSK_OFFSET) // 86400 * 86400 - MSK_OFFSET
+        if first_day >= last_day:
+            first_day = last_day = end  # Целых дней нет: весь период по часам
+        return self.conn.execute(
+            """
+            SELECT supplier_article, warehouse_name, SUM(count) AS count,
+                   SUM(finished_price) AS finished_price, SUM(for_pay) AS for_pay, SUM(fee_wb) AS fee_wb
+            FROM (
+                SELECT * FROM rollup_daily
+                WHERE seller = ? AND stream = ? AND bucket >= ? AND bucket < ?
+                UNION ALL
+                SELECT * FROM rollup_hourly
+                WHERE seller = ? AND stream = ?
+                  AND ((bucket >= ? AND bucket < ?) OR (bucket >= ? AND bucket < ?))
+            )
+            GROUP BY supplier_article, warehouse_name
+            HAVING SUM(count) > 0
+            ORDER BY count DESC, finished_price DESC
+            """,
+            (seller, stream, first_day, last_day,
+             seller, stream, hour_start, first_day, last_day, end)
+        ).fetchall()
+
+    def close(self):
+        """Закрытие соединения с базой"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,91 @@
+import codecs
+import json
+
+
+class JSONArrayParser:
+    """Инкрементальный парсер JSON-массива: отдает элементы по мере поступления байтов"""
+
+    _WHITESPACE = ' \t\n\r'
+    _DELIMITERS = _WHITESPACE + ',]'
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._started = False
+        self._finished = False
+        # Что ожидается дальше: 'first' - элемент или ], 'value' - элемент, 'comma' - запятая или ]
+        self._expect = 'first'
+
+    def feed(self, chunk):
+        """Добавление очередной порции байтов. Генерирует полностью полученные элементы"""
+        self._buffer += self._text_decoder.decode(chunk)
+        yield from self._parse(final=False)
+
+    def close(self):
+        """Завершение разбора: генерирует остаток и проверяет целостность массива"""
+        self._buffer += self._text_decoder.decode(b'', final=True)
+        yield from self._parse(final=True)
+        if not self._finished:
+            if not self._started and not self._buffer.strip():
+                return  # Пустое тело ответа считаем пустым массивом
+            raise ValueError("Ответ обрезан: JSON-массив не завершен")
+
+    def _parse(self, final):
+        buffer = self._buffer
+        pos = 0
+        try:
+            while not self._finished:
+                while pos < len(buffer) and buffer[pos] in self._WHITESPACE:
+                    pos += 1
+                if pos >= len(buffer):
+                    break
+
+                char = buffer[pos]
+                if not self._started:
+                    if char != '[':
+                        raise ValueError(f"Ожидался JSON-массив, получено: {buffer[pos:pos + 50]!r}")
+                    self._started = True
+                    pos += 1
+                elif char == ',':
+                    if self._expect != 'comma':
+                        raise ValueError(f"Лишняя запятая в JSON-массиве: {buffer[pos:pos + 50]!r}")
+                    self._expect = 'value'
+                    pos += 1
+                elif char == ']':
+                    if self._expect == 'value':
+                        raise ValueError("Запятая перед концом JSON-массива")
+                    self._finished = True
+                    pos += 1
+                else:
+                    if self._expect == 'comma':
+                        raise ValueError(f"Пропущена запятая в JSON-массиве: {buffer[pos:pos + 50]!r}")
+                    try:
+                        item, end = self._decoder.raw_decode(buffer, pos)
+                    except json.JSONDecodeError:
+                        if final:
+                            raise
+                        break  # Элемент еще не догружен
+                    # Число или литерал завершен, только если за ним идет разделитель:
+                    # иначе "1." или "1.5e" на границе порции разобрались бы как 1 и 1.5
+                    if not isinstance(item, (dict, list)) and (
+                            end >= len(buffer) or buffer[end] not in self._DELIMITERS):
+                        if not final:
+                            break
+                        if end < len(buffer):
+                            raise ValueError(f"Некорректное значение в JSON-массиве: {buffer[pos:end + 20]!r}")
+                    pos = end
+                    self._expect = 'comma'
+                    yield item
+        finally:
+            self._buffer = buffer[pos:]
+
+
+async def iter_json_array(chunks):
+    """Асинхронно перебирает элементы JSON-массива из потока байтов (например, response.aiter_bytes())"""
+    parser = JSONArrayParser()
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    for item in parser.close():
+        yield item
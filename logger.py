@@ -0,0 +1,82 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+
+
+# Стандартные атрибуты LogRecord: все остальные попадают в JSON как дополнительные поля
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    """Форматирование записи журнала в одну строку JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _PreparedQueueHandler(logging.handlers.QueueHandler):
+    """Обработчик-очередь: в вызывающем потоке только подставляет аргументы в сообщение.
+
+    Форматирование в JSON и запись на диск выполняет фоновый поток QueueListener.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(name, level='INFO', path=None, max_bytes=10 * 1024 * 1024,
+                  backup_count=5, rotate_when=None):
+    """Настройка журнала: вызывающий код только кладет записи в очередь.
+
+    Консоль получает привычные строки с временем, файл path - строки JSON с ротацией
+    по размеру (max_bytes) или по времени (rotate_when, например 'midnight').
+    Возвращает запущенный QueueListener; он останавливается при выходе из процесса.
+    """
+    handlers = []
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter('[%(asctime)s.%(msecs)03d] %(message)s', '%Y-%m-%d %H:%M:%S'))
+    handlers.append(console)
+
+    if path:
+        if rotate_when:
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                path, when=rotate_when, backupCount=backup_count, encoding='utf-8'
+            )
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            )
+        file_handler.setFormatter(JSONFormatter())
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.handlers.clear()
+    logger.addHandler(_PreparedQueueHandler(log_queue))
+    logger.propagate = False
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
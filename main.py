@@ -1,4 +1,5 @@
-import requests
+import argparse
+import httpx
 import asyncio  # Перемещено в начало файла
 import schedule
 import time
@@ -6,42 +7,234 @@ import signal
 import sys
 import traceback  # Добавляем для печати полного стека исключения
 import json  # Добавляем для работы с тестовыми данными
-from datetime import datetime, timedelta, timezone
+import html
+import logging
+import math
+import os
+import random
+import secrets
+import socket
+import sqlite3
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
 from telegram.ext import Application, CommandHandler, CallbackContext, MessageHandler, filters, CallbackQueryHandler
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter, BadRequest, Forbidden
 from config import (
     TELEGRAM_BOT_TOKEN,
+    ADMIN_IDS,
     TELEGRAM_CHAT_ID,
     WB_API_TOKEN,
     WB_FEEDBACK_TOKEN,
     WB_API_BASE_URL,
     WB_FEEDBACK_API_URL,
     CHECK_INTERVAL,
+    SALES_CHECK_INTERVAL,
+    FEEDBACK_CHECK_INTERVAL,
+    ORDERS_MIN_INTERVAL,
+    ORDERS_MAX_INTERVAL,
+    SALES_MIN_INTERVAL,
+    SALES_MAX_INTERVAL,
+    FEEDBACK_MIN_INTERVAL,
+    FEEDBACK_MAX_INTERVAL,
+    WB_STATS_REQUESTS_PER_MINUTE,
+    WB_FEEDBACK_REQUESTS_PER_SECOND,
+    WB_MAX_RETRIES,
+    WB_MAX_BACKOFF,
     MAX_ORDERS_PER_REQUEST,
-    PAGINATION_DELAY
+    PAGINATION_DELAY,
+    HTTP_POOL_SIZE,
+    HTTP_KEEPALIVE_EXPIRY,
+    STATE_DB_PATH,
+    HISTORY_DB_PATH,
+    DEDUP_RETENTION_DAYS,
+    ORDER_INDEX_RETENTION_DAYS,
+    CURSOR_OVERLAP_MINUTES,
+    TELEGRAM_CHAT_RATE,
+    TELEGRAM_GROUP_RATE,
+    TELEGRAM_GLOBAL_RATE,
+    DIGEST_THRESHOLD,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_MAX_BACKOFF,
+    SELLERS_FILE,
+    MAX_CONCURRENT_POLLS,
+    BACKFILL_CONCURRENCY,
+    BACKFILL_BATCH_SIZE,
+    BOT_MODE,
+    LEASE_TTL,
+    TELEGRAM_API_URL,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN,
+    LOG_LEVEL,
+    LOG_FILE,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_ROTATE_WHEN,
+    METRICS_HOST,
+    METRICS_PORT,
+    STATUS_CACHE_TTL,
+    STATUS_HEALTH_MAX_AGE
+)
+from storage import StateStore
+from history import HistoryStore
+from correlation import OrderIndex
+from logger import setup_logging
+from metrics import MetricsRegistry, serve_metrics
+from jsonstream import iter_json_array
+from models import Order, Sale, Feedback, MOSCOW_TZ, parse_date_string
+from ratelimit import TokenBucket, RequestGovernor
+from sellers import Seller, load_sellers, parse_chat_ids
+from scheduler import AdaptiveInterval
+
+logger = logging.getLogger('wb_bot')
+
+# Уровень записи по префиксу сообщения, если он не указан явно
+_LEVEL_PREFIXES = (
+    ('❌', logging.ERROR),
+    ('📋 Стек вызовов', logging.ERROR),
+    ('⚠️', logging.WARNING)
 )
 
 # Функция для улучшенного логирования
-def log(message):
-    """Функция для логирования с временной меткой"""
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}] {message}")
+def log(message, *args, level=None, **fields):
+    """Запись в журнал (без блокировки: вывод выполняет фоновый поток).
+    
+    Аргументы args подставляются в message через % только если уровень включен, поэтому
+    отладочные записи с объемными данными ничего не стоят: log("Ответ: %s", data, level=logging.DEBUG).
+    Именованные fields попадают в JSON-журнал отдельными полями.
+    """
+    if level is None:
+        level = next((lvl for prefix, lvl in _LEVEL_PREFIXES if message.startswith(prefix)), logging.INFO)
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args, extra=fields or None)
+
+# Максимальная длина текста сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Частота запросов /ping к каждому API Wildberries (не больше 3 за 30 секунд)
+WB_PING_RATE = 0.1
+
+# Типы обновлений, которые бот получает от Telegram
+TELEGRAM_ALLOWED_UPDATES = [
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "message_reaction", "message_reaction_count", "callback_query"
+]
+
+# Раздельный режим: шаг цикла обработчика (продление аренды, запросы проверок)
+# и интервал опроса общей очереди процессом бота (в секундах)
+WORKER_TICK = 2
+SPLIT_OUTBOX_POLL_INTERVAL = 1
+
+# Сколько сообщений очереди отправки обрабатывать за один проход
+OUTBOX_BATCH_SIZE = 100
+
+# Как часто проверять очередь отправки при отсутствии событий (в секундах)
+OUTBOX_IDLE_TIMEOUT = 60
+
+# Отзывы и вопросы: записей на странице (skip/take) и предельная длина текста покупателя в уведомлении
+FEEDBACKS_PAGE_SIZE = 5000
+FEEDBACK_TEXT_LIMIT = 1000
+
+# Строк истории и записей индекса заказов в одной транзакции при проверках: память не растет с размером страницы
+HISTORY_BATCH_SIZE = 1000
+
+# /history: период по умолчанию (в днях) и число последних заказов в ответе
+HISTORY_DEFAULT_DAYS = 7
+HISTORY_RECENT_ORDERS = 5
+
+# Отчеты: период для /report и подпись в заголовке
+REPORT_PERIODS = {'today': 'сегодня', 'week': 'неделю', 'month': 'месяц'}
+REPORT_BUTTONS = [
+    InlineKeyboardButton("📈 Сегодня", callback_data="report_today"),
+    InlineKeyboardButton("📈 Неделя", callback_data="report_week"),
+    InlineKeyboardButton("📈 Месяц", callback_data="report_month")
+]
+
+# Метрики процесса: доступны по HTTP (METRICS_PORT) и командой /metrics
+metrics = MetricsRegistry()
+WB_REQUEST_SECONDS = metrics.histogram(
+    'wb_request_duration_seconds', 'Время ответа API Wildberries до получения заголовков',
+    ('endpoint', 'status')
+)
+WB_PAGE_ROWS = metrics.histogram(
+    'wb_page_rows', 'Строк на странице ответа API статистики', ('stream',),
+    buckets=(0, 10, 100, 1000, 10000, 50000, 80000)
+)
+WB_POLL_PAGES = metrics.histogram(
+    'wb_poll_pages', 'Страниц за одну проверку потока', ('stream',), buckets=(0, 1, 2, 3, 5, 10, 20)
+)
+WB_DEDUP = metrics.counter(
+    'wb_dedup_records_total', 'Записи API: уже обработанные (hit) и новые (miss)', ('stream', 'result')
+)
+TELEGRAM_SEND_SECONDS = metrics.histogram(
+    'telegram_send_duration_seconds', 'Время вызова send_message', ('result',)
+)
+OUTBOX_DEPTH = metrics.gauge('outbox_depth', 'Сообщений в очереди отправки')
+ALERT_LAG_SECONDS = metrics.histogram(
+    'alert_lag_seconds', 'Задержка от времени события (date) до доставки уведомления',
+    buckets=(60, 300, 600, 1800, 3600, 7200, 14400, 43200, 86400)
+)
+
+def retry_after_seconds(error):
+    """Время ожидания из ошибки RetryAfter (в разных версиях - число или timedelta)"""
+    delay = error.retry_after
+    if isinstance(delay, timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+def format_check_intervals():
+    """Интервалы проверки потоков данных для сообщений бота"""
+    return (
+        f"заказы - {CHECK_INTERVAL // 60} мин, "
+        f"выкупы - {SALES_CHECK_INTERVAL // 60} мин, "
+        f"отзывы - {FEEDBACK_CHECK_INTERVAL // 60} мин"
+    )
 
 def get_moscow_time():
     """Возвращает текущее московское время (UTC+3)"""
-    return datetime.now(timezone.utc) + timedelta(hours=3)
+    return datetime.now(MOSCOW_TZ)
 
 class WildberriesAPI:
-    def __init__(self, stats_token, feedback_token):
+    def __init__(self, stats_token, feedback_token, store, seller=None, governor=None, history=None):
         log("🔧 Инициализация WildberriesAPI")
+        # Кабинет продавца: его чаты получают уведомления, а курсоры и отметки
+        # об обработке хранятся отдельно для каждого кабинета
+        self.seller = seller or Seller('', stats_token, feedback_token, parse_chat_ids(TELEGRAM_CHAT_ID))
         self.stats_token = stats_token
         self.feedback_token = feedback_token
         self.stats_headers = {'Authorization': stats_token}
         self.feedback_headers = {'Authorization': f'Bearer {feedback_token}'}
-        self._last_order_time = datetime.now(timezone.utc)
-        self._last_sales_time = datetime.now(timezone.utc)
-        self._last_feedback_check = datetime.now(timezone.utc)
-        self._processed_orders = set()  # Множество для хранения обработанных srid
-        self._processed_sales = set()   # Множество для хранения обработанных saleID
+        # Долгоживущие сессии с пулом keep-alive соединений, по одной на каждый хост API
+        self.stats_client = self._create_client(WB_API_BASE_URL, self.stats_headers)
+        self.feedback_client = self._create_client(WB_FEEDBACK_API_URL, self.feedback_headers)
+        # Регулятор квот: очередь запросов по токену и категории API, повторы при 429.
+        # Может быть общим для нескольких кабинетов: квоты все равно считаются по токенам
+        self.governor = governor or RequestGovernor(max_backoff=WB_MAX_BACKOFF)
+        self.stats_rate = WB_STATS_REQUESTS_PER_MINUTE / 60
+        self.feedback_rate = WB_FEEDBACK_REQUESTS_PER_SECOND
+        # Последний результат запроса к каждому API и кеш проверки для /status
+        self.api_health = {}
+        self._status_cache = None  # (время, результат)
+        self._status_task = None
+        # Выполняемая проверка потока, результат которой получают все ожидающие:
+        # одновременно идет не больше одной проверки, поэтому курсоры и отметки не конфликтуют
+        self._inflight = {}
+        self.store = store  # Постоянное хранилище обработанных srid и saleID
+        self.history = history  # История заказов и выкупов (или None)
+        # Связь заказов с выкупами, возвратами и отменами по srid и статистика артикулов
+        self.order_index = OrderIndex(store, self.seller.name)
+        # Отданные потребителю, но еще не подтвержденные записи и курсоры по потокам
+        self._unacked = {stream: set() for stream in ('orders', 'sales', 'feedbacks', 'questions')}
+        self._pending_cursor = {stream: None for stream in ('orders', 'sales', 'feedbacks', 'questions')}
+        # Итоги последней проверки по потокам: число запросов и было ли ограничение частоты.
+        # У загрузки истории свой ключ, чтобы ее запросы не меняли интервалы живых проверок
+        self.last_poll = {
+            stream: {'requests': 0, 'rate_limited': False}
+            for stream in ('orders', 'sales', 'feedbacks', 'status', 'backfill')
+        }
         
         # Проверяем валидность токенов
         if not stats_token or len(stats_token) < 10:
@@ -51,374 +244,697 @@ class WildberriesAPI:
             
         log("✅ WildberriesAPI инициализирован")
     
-    def _parse_date(self, date_str):
-        """Парсинг даты из API с поддержкой разных форматов"""
-        formats = [
-            '%Y-%m-%dT%H:%M:%S.%fZ',  # С миллисекундами
-            '%Y-%m-%dT%H:%M:%S',      # Без миллисекунд
-            '%Y-%m-%dT%H:%M:%SZ'      # С Z, но без миллисекунд
-        ]
+    @staticmethod
+    def _create_client(base_url, headers):
+        """Создание асинхронного HTTP-клиента с пулом соединений для хоста API"""
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(30, connect=10),
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_SIZE,
+                max_keepalive_connections=HTTP_POOL_SIZE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+    
+    async def close(self):
+        """Остановка выполняемых проверок и закрытие HTTP-сессий"""
+        await self.cancel_checks()
+        log("🔄 Закрытие HTTP-сессий WildberriesAPI")
+        await self.stats_client.aclose()
+        await self.feedback_client.aclose()
+        log("✅ HTTP-сессии WildberriesAPI закрыты")
+    
+    async def _send(self, client, token, rate, url, stream, params=None, timeout=None,
+                    stream_response=False, retries=WB_MAX_RETRIES):
+        """Запрос к API через регулятор квот с повторами при 429 и ошибках сервера.
         
-        for fmt in formats:
+        При stream_response=True тело ответа не читается: вызывающий должен закрыть ответ.
+        Последний ответ (в том числе 429) возвращается после исчерпания повторов.
+        """
+        key = self.governor.key(token, self._quota_category(client, url))
+        attempt = 0
+        while True:
+            await self.governor.acquire(key, rate)
+            self.last_poll[stream]['requests'] += 1
+            kwargs = {'params': params}
+            if timeout is not None:
+                kwargs['timeout'] = timeout
+            request = client.build_request('GET', url, **kwargs)
+            started = time.perf_counter()
             try:
-                return datetime.strptime(date_str, fmt)
-            except ValueError:
-                continue
-        # Если ни один формат не подошел, логируем ошибку и возвращаем текущее время
-        log(f"⚠️ Неподдерживаемый формат даты: {date_str}. Используем текущее время.")
-        return datetime.now()
+                response = await client.send(request, stream=stream_response)
+            except httpx.RequestError as e:
+                WB_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=url, status='error')
+                if isinstance(e, httpx.TimeoutException):
+                    error = "Тайм-аут запроса (превышено время ожидания)"
+                elif isinstance(e, httpx.ConnectError):
+                    error = "Ошибка соединения с сервером"
+                else:
+                    error = str(e) or type(e).__name__
+                self._record_health(client, url, error=error)
+                raise
+            elapsed = time.perf_counter() - started
+            WB_REQUEST_SECONDS.observe(elapsed, endpoint=url, status=response.status_code)
+            self._record_health(client, url, response.status_code, elapsed)
+            
+            retry_in = self.governor.observe(key, response)
+            if retry_in is None:
+                return response
+            if response.status_code == 429:
+                self.last_poll[stream]['rate_limited'] = True
+            delay = max(retry_in, self.governor.backoff(attempt + 1))
+            self.governor.block(key, delay)
+            if attempt >= retries:
+                return response
+            
+            await response.aclose()
+            attempt += 1
+            log(f"⏳ Код {response.status_code} от {url}, повтор {attempt}/{retries} через {delay:.0f} сек")
+    
+    def _quota_category(self, client, url):
+        """Категория квоты: у токена общая квота на все методы статистики и на отзывы с вопросами, у /ping - своя"""
+        category = 'statistics' if client is self.stats_client else 'feedbacks'
+        return f"{category}/ping" if url == '/ping' else category
+    
+    @asynccontextmanager
+    async def _stats_stream(self, stream, url, params):
+        """Потоковый запрос к API статистики через регулятор квот"""
+        response = await self._send(
+            self.stats_client, self.stats_token, self.stats_rate, url, stream,
+            params=params, stream_response=True
+        )
+        try:
+            yield response
+        finally:
+            await response.aclose()
+    
+    def _state_key(self, stream):
+        """Имя потока в хранилище: с префиксом кабинета, если кабинет назван"""
+        return f"{self.seller.name}:{stream}" if self.seller.name else stream
+    
+    def _get_date_from(self, stream):
+        """Дата начала выборки: сохраненный курсор минус окно перекрытия"""
+        cursor = self.store.get_cursor(self._state_key(stream))
+        if cursor is None:
+            # Первый запуск: начинаем с текущего московского времени и сразу запоминаем его,
+            # иначе каждая пустая проверка начиналась бы с нового момента и пропускала записи
+            start = get_moscow_time()
+            self.store.set_cursor(self._state_key(stream), start.strftime('%Y-%m-%dT%H:%M:%S'))
+            log(f"🆕 Курсор {stream} не найден, начинаем с {start.strftime('%Y-%m-%dT%H:%M:%S')}")
+        else:
+            # Отступаем назад, чтобы не пропустить записи с запоздавшим lastChangeDate
+            start = parse_date_string(cursor) - timedelta(minutes=CURSOR_OVERLAP_MINUTES)
+        # API ожидает dateFrom по московскому времени
+        return start.astimezone(MOSCOW_TZ).strftime('%Y-%m-%dT%H:%M:%S')
+    
+    def _commit_cursor(self, stream, latest):
+        """Сохранение курсора по максимальному lastChangeDate обработанной страницы"""
+        if not latest:
+            return
+        current = self.store.get_cursor(self._state_key(stream))
+        if current is None or parse_date_string(latest) > parse_date_string(current):
+            self.store.set_cursor(self._state_key(stream), latest)
+            log(f"💾 Курсор {stream} сохранен: {latest}")
+    
+    def _start_poll(self, stream):
+        """Сброс неподтвержденных записей прошлой проверки: они будут получены повторно"""
+        self._unacked[stream].clear()
+        self._pending_cursor[stream] = None
+        self.last_poll[stream] = {'requests': 0, 'rate_limited': False, 'pages': 0}
+    
+    def _record_http_error(self, stream, error):
+        """Учет ошибки HTTP в итогах проверки"""
+        if error.response.status_code == 429:
+            self.last_poll[stream]['rate_limited'] = True
+            log(f"⏳ API ограничил частоту запросов потока {stream}")
+        elif error.response.status_code == 401:
+            log("🔑 Возможно, токен устарел или неверный")
+    
+    def _checkpoint(self, stream, latest):
+        """Контрольная точка после страницы: курсор сохраняется после подтверждения всех записей"""
+        if latest and (self._pending_cursor[stream] is None
+                       or parse_date_string(latest) > parse_date_string(self._pending_cursor[stream])):
+            self._pending_cursor[stream] = latest
+        if not self._unacked[stream]:
+            self.ack(stream)
+    
+    def ack(self, stream):
+        """Подтверждение: отданные записи поставлены в очередь отправки и больше не нужны.
+        
+        Записи отмечаются обработанными, курсор сдвигается до последней завершенной страницы.
+        """
+        if self._unacked[stream]:
+            self.store.mark_processed(self._state_key(stream), self._unacked[stream])
+            self._unacked[stream].clear()
+        if self._pending_cursor[stream]:
+            self._commit_cursor(stream, self._pending_cursor[stream])
+            self._pending_cursor[stream] = None
+    
+    async def _iter_new_records(self, stream, url, date_from, key_field, record_type, page):
+        """Потоковая загрузка одной страницы: отдает необработанные записи (record_type) по мере разбора JSON.
+        
+        Итоги страницы (число строк и повторов, последний и максимальный lastChangeDate) накапливаются в page.
+        Отданные записи считаются обработанными только после вызова ack(stream).
+        Все строки страницы, включая повторы, добавляются в историю пачками по HISTORY_BATCH_SIZE.
+        Каждая запись разбирается один раз: та же модель идет в историю и потребителю.
+        Все строки страницы учитываются и в индексе заказов (повтор заказа с isCancel - это его отмена).
+        """
+        unacked = self._unacked[stream]
+        state_key = self._state_key(stream)
+        history_rows = [] if self.history is not None else None
+        async with self._stats_stream(
+            stream,
+            url,
+            params={
+                'dateFrom': date_from,
+                'flag': 0
+            }
+        ) as response:
+            # Проверяем код ответа
+            response.raise_for_status()
+            
+            async for record in iter_json_array(response.aiter_bytes()):
+                page['rows'] += 1
+                change_date = record.get('lastChangeDate')
+                if change_date:
+                    page['last_change_date'] = change_date
+                    # Даты в одном формате ISO 8601, поэтому сравниваем как строки
+                    if page['max_change_date'] is None or change_date > page['max_change_date']:
+                        page['max_change_date'] = change_date
+                
+                # Пропускаем уже обработанные записи прямо во время разбора
+                key = record.get(key_field)
+                duplicate = bool(key) and (key in unacked or self.store.is_processed(state_key, key))
+                # Запись разбирается один раз: модель нужна индексу заказов, истории и уведомлению
+                item = record_type.from_api(record)
+                self.order_index.observe(stream, item)
+                if self.order_index.pending >= HISTORY_BATCH_SIZE:
+                    self._save_order_index()
+                if history_rows is not None:
+                    history_rows.append(self.history.row(stream, item))
+                    if len(history_rows) >= HISTORY_BATCH_SIZE:
+                        self._save_history(stream, history_rows)
+                        history_rows = []
+                if duplicate:
+                    page['duplicates'] += 1
+                    continue
+                
+                if key:
+                    unacked.add(key)
+                yield item
+        
+        # Страница разобрана целиком
+        self.last_poll[stream]['pages'] += 1
+        if history_rows:
+            self._save_history(stream, history_rows)
+        self._save_order_index()
+        WB_PAGE_ROWS.observe(page['rows'], stream=stream)
+        WB_DEDUP.inc(page['duplicates'], stream=stream, result='hit')
+        WB_DEDUP.inc(page['rows'] - page['duplicates'], stream=stream, result='miss')
     
-    def get_new_orders(self):
-        """Получение новых заказов с Wildberries с поддержкой пагинации"""
-        log(f"🔄 Получение новых заказов с {self._last_order_time.strftime('%Y-%m-%dT%H:%M:%S')}")
-        all_orders = []
-        next_date_from = self._last_order_time.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    def _save_history(self, stream, rows):
+        """Запись пачки строк в историю. Ошибка истории не мешает уведомлениям"""
+        try:
+            self.history.ingest(stream, self.seller.name, rows)
+        except sqlite3.Error as e:
+            log(f"⚠️ Не удалось сохранить {len(rows)} записей {stream} в историю: {e}")
+    
+    def _save_order_index(self):
+        """Запись изменений индекса заказов. Ошибка индекса не мешает уведомлениям"""
+        try:
+            self.order_index.flush()
+        except sqlite3.Error as e:
+            log(f"⚠️ Не удалось сохранить индекс заказов: {e}")
+    
+    async def backfill(self, date_from, date_to, streams=('orders', 'sales')):
+        """Загрузка заказов и выкупов за дни с date_from по date_to в историю без уведомлений.
+        
+        Каждый день - отдельное окно с flag=1 (все записи за дату). Окна всех потоков
+        запрашиваются одновременно (не больше BACKFILL_CONCURRENCY), темп задает регулятор квот.
+        Строки пишутся в историю и индекс заказов, а отметки об обработке и курсоры проверок
+        не меняются. После каждого окна сохраняется контрольная точка: повторный запуск того же
+        диапазона продолжает со дня после последнего непрерывно загруженного.
+        Возвращает итоги по потокам: {'rows': строк, 'days': загружено дней, 'failed': дней с ошибкой}.
+        """
+        slots = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+        results = {stream: {'rows': 0, 'days': 0, 'failed': 0} for stream in streams}
+        
+        async def load_stream(stream):
+            done = self._backfill_checkpoint(stream, date_from, date_to)
+            first = date_from if done is None else done + timedelta(days=1)
+            days = [first + timedelta(days=i) for i in range((date_to - first).days + 1)]
+            if done is not None:
+                if not days:
+                    log(f"✅ {stream} за этот период уже загружены (контрольная точка)")
+                    return
+                log(f"⏩ Загрузка {stream} продолжается с {first.isoformat()} (контрольная точка)")
+            finished = set()
+            watermark = first - timedelta(days=1)
+            
+            async def load_day(day):
+                nonlocal watermark
+                try:
+                    async with slots:
+                        rows = await self._backfill_day(stream, day)
+                except Exception as e:
+                    results[stream]['failed'] += 1
+                    log(f"❌ Не удалось загрузить {stream} за {day.isoformat()}: {e}")
+                    return
+                results[stream]['rows'] += rows
+                results[stream]['days'] += 1
+                log(f"📥 {stream} за {day.isoformat()}: {rows} записей")
+                # Окна завершаются в любом порядке: точка двигается только по непрерывной цепочке дней
+                finished.add(day)
+                previous = watermark
+                while watermark + timedelta(days=1) in finished:
+                    watermark += timedelta(days=1)
+                    finished.discard(watermark)
+                if watermark != previous:
+                    self._save_backfill_checkpoint(stream, date_from, date_to, watermark)
+            
+            await asyncio.gather(*(load_day(day) for day in days))
+        
+        await asyncio.gather(*(load_stream(stream) for stream in streams))
+        return results
+    
+    async def _backfill_day(self, stream, day):
+        """Все записи потока за день (flag=1) в историю и индекс заказов. Возвращает число строк"""
+        url = f"/api/v1/supplier/{stream}"
+        record_type = Order if stream == 'orders' else Sale
+        count = 0
+        rows = []
+        async with self._stats_stream('backfill', url, params={'dateFrom': day.isoformat(), 'flag': 1}) as response:
+            response.raise_for_status()
+            async for record in iter_json_array(response.aiter_bytes()):
+                count += 1
+                item = record_type.from_api(record)
+                self.order_index.observe(stream, item)
+                if self.order_index.pending >= BACKFILL_BATCH_SIZE:
+                    self.order_index.flush()
+                if self.history is not None:
+                    rows.append(self.history.row(stream, item))
+                    # Пачками, чтобы память не росла с размером дня
+                    if len(rows) >= BACKFILL_BATCH_SIZE:
+                        self.history.ingest(stream, self.seller.name, rows)
+                        rows = []
+        if rows:
+            self.history.ingest(stream, self.seller.name, rows)
+        self.order_index.flush()
+        return count
+    
+    def _backfill_checkpoint(self, stream, date_from, date_to):
+        """Последний непрерывно загруженный день диапазона (или None)"""
+        value = self.store.get_cursor(self._state_key(f'backfill_{stream}'))
+        if value:
+            saved = json.loads(value)
+            if saved['from'] == date_from.isoformat() and saved['to'] == date_to.isoformat():
+                return date.fromisoformat(saved['done'])
+        return None
+    
+    def _save_backfill_checkpoint(self, stream, date_from, date_to, done):
+        self.store.set_cursor(self._state_key(f'backfill_{stream}'), json.dumps({
+            'from': date_from.isoformat(), 'to': date_to.isoformat(), 'done': done.isoformat()
+        }))
+    
+    async def get_new_orders(self):
+        """Получение новых заказов с Wildberries с поддержкой пагинации.
+        
+        Асинхронный генератор: заказы отдаются по одному, не дожидаясь загрузки всей страницы.
+        """
+        self._start_poll('orders')
+        next_date_from = self._get_date_from('orders')
+        log(f"🔄 Получение новых заказов с {next_date_from}")
         
         try:
             while True:
                 try:
-                    url = f"{WB_API_BASE_URL}/api/v1/supplier/orders"
-                    log(f"🔄 Запрос заказов: {url} с dateFrom={next_date_from}")
-                    
-                    response = requests.get(
-                        url,
-                        headers=self.stats_headers,
-                        params={
-                            'dateFrom': next_date_from,
-                            'flag': 0  # 0 - новые заказы
-                        },
-                        timeout=30  # Добавляем таймаут
-                    )
+                    url = "/api/v1/supplier/orders"
+                    log(f"🔄 Запрос заказов: {WB_API_BASE_URL}{url} с dateFrom={next_date_from}")
                     
-                    # Проверяем код ответа
-                    response.raise_for_status()
+                    page = {'rows': 0, 'duplicates': 0, 'last_change_date': None, 'max_change_date': None}
+                    new_count = 0
+                    async for order in self._iter_new_records('orders', url, next_date_from, 'srid', Order, page):
+                        new_count += 1
+                        yield order
                     
-                    # Получаем данные
-                    orders = response.json()
-                    log(f"📦 Получено {len(orders)} заказов от API")
+                    log(f"📦 Получено {page['rows']} заказов от API")
+                    log(f"📬 Найдено {new_count} новых заказов")
                     
-                    # Если нет заказов, прерываем цикл
-                    if not orders:
+                    # Если нет заказов, курсор не двигается: он сдвигается только до lastChangeDate
+                    # полученных записей, иначе запоздавшие записи с прошлым lastChangeDate пропали бы
+                    if not page['rows']:
                         break
                     
-                    # Добавляем только необработанные заказы
-                    new_orders = [
-                        order for order in orders 
-                        if order.get('srid') not in self._processed_orders
-                    ]
-                    log(f"📬 Найдено {len(new_orders)} новых заказов")
-                    all_orders.extend(new_orders)
-                    
-                    # Обновляем множество обработанных заказов
-                    self._processed_orders.update(order.get('srid') for order in new_orders)
+                    # Контрольная точка курсора после каждой страницы
+                    self._checkpoint('orders', page['max_change_date'])
                     
                     # Если получили меньше максимального количества, значит это последняя страница
-                    if len(orders) < MAX_ORDERS_PER_REQUEST:
+                    if page['rows'] < MAX_ORDERS_PER_REQUEST:
                         break
                         
                     # Берем дату последнего заказа для следующего запроса
-                    if orders:
-                        next_date_from = orders[-1]['lastChangeDate']
-                        log(f"🔄 Следующий запрос с dateFrom={next_date_from}")
+                    next_date_from = page['last_change_date']
+                    log(f"🔄 Следующий запрос с dateFrom={next_date_from}")
                     
                     # Добавляем задержку между запросами
                     log(f"⏱ Ожидание {PAGINATION_DELAY} сек перед следующим запросом")
-                    time.sleep(PAGINATION_DELAY)
+                    await asyncio.sleep(PAGINATION_DELAY)
                     
-                except requests.exceptions.HTTPError as e:
+                except httpx.HTTPStatusError as e:
                     log(f"❌ Ошибка HTTP при получении заказов: {e}")
-                    if e.response.status_code == 401:
-                        log("🔑 Возможно, токен устарел или неверный")
+                    self._record_http_error('orders', e)
                     break
-                except requests.exceptions.Timeout as e:
+                except httpx.TimeoutException as e:
                     log(f"⏱ Превышено время ожидания запроса: {e}")
                     break
-                except requests.exceptions.RequestException as e:
+                except httpx.RequestError as e:
                     log(f"❌ Ошибка при получении заказов: {e}")
                     break
                 except Exception as e:
                     log(f"❌ Неожиданная ошибка при получении заказов: {e}")
                     break
         finally:
-            # Обновляем время последней проверенного заказа на текущее время
-            self._last_order_time = datetime.now(timezone.utc)
-            log(f"⏱ Время последней проверки заказов обновлено: {self._last_order_time.strftime('%Y-%m-%dT%H:%M:%S')}")
-            
-        return all_orders
+            # Курсор сдвигается только по фактически обработанным страницам
+            log(f"⏱ Курсор заказов: {self.store.get_cursor(self._state_key('orders'))}")
+            WB_POLL_PAGES.observe(self.last_poll['orders']['pages'], stream='orders')
 
-    def check_new_feedbacks(self):
-        """Проверка наличия новых отзывов и вопросов"""
-        log(f"🔄 Проверка отзывов с {self._last_feedback_check.strftime('%Y-%m-%dT%H:%M:%S')}")
+    async def get_new_feedbacks(self):
+        """Новые неотвеченные отзывы и вопросы с момента курсоров.
+        
+        Возвращает список Feedback: сначала отзывы от низкой оценки к высокой, затем вопросы.
+        Отданные записи считаются обработанными только после вызова ack('feedbacks') и ack('questions').
+        """
+        self.last_poll['feedbacks'] = {'requests': 0, 'rate_limited': False}
+        items = []
+        for stream, kind in (('feedbacks', 'feedback'), ('questions', 'question')):
+            items.extend(await self._get_new_feedback_records(stream, kind))
+        items.sort(key=lambda item: (item.kind != 'feedback', item.rating or 0, event_time(item) or 0))
+        return items
+    
+    async def _get_new_feedback_records(self, stream, kind):
+        """Неотвеченные отзывы или вопросы (stream) страницами skip/take начиная с курсора.
+        
+        Курсор - время создания (createdDate) самой новой записи; выборка идет от него минус окно
+        перекрытия, а уже обработанные id пропускаются. При ошибке возвращаются записи
+        полностью полученных страниц.
+        """
+        self._unacked[stream].clear()
+        self._pending_cursor[stream] = None
+        state_key = self._state_key(stream)
+        cursor = self.store.get_cursor(state_key)
+        if cursor is None:
+            # Первый запуск: начинаем с текущего момента и сразу запоминаем его
+            date_from = datetime.now(timezone.utc)
+            self.store.set_cursor(state_key, date_from.isoformat())
+            log(f"🆕 Курсор {stream} не найден, начинаем с {date_from.strftime('%Y-%m-%dT%H:%M:%S')}")
+        else:
+            date_from = parse_date_string(cursor) - timedelta(minutes=CURSOR_OVERLAP_MINUTES)
         
+        url = f"/api/v1/{stream}"
+        items = []
+        skip = 0
         try:
-            url = f"{WB_FEEDBACK_API_URL}/api/v1/new-feedbacks-questions"
-            log(f"🔄 Запрос отзывов: {url}")
-            
-            response = requests.get(url, headers=self.feedback_headers, timeout=30)
-            
-            # Проверяем код ответа
-            response.raise_for_status()
-            
-            result = response.json()
-            log(f"📊 Получен ответ по отзывам: {result}")
-
-            # Проверяем наличие ошибок
-            if result.get('error'):
-                log(f"❌ Ошибка при проверке отзывов: {result.get('errorText')}")
-                if result.get('additionalErrors'):
-                    log(f"❌ Дополнительные ошибки: {', '.join(result['additionalErrors'])}")
-                return None
-
-            # Получаем данные из ответа
-            data = result.get('data', {})
-            
-            # Форматируем информацию о новых отзывах и вопросах
-            feedback_info = {
-                'has_new_feedbacks': data.get('hasNewFeedbacks', False),
-                'has_new_questions': data.get('hasNewQuestions', False),
-                'feedbacks_count': data.get('feedbacksCount', 0),
-                'questions_count': data.get('questionsCount', 0)
-            }
-            
-            log(f"📊 Результат проверки отзывов: {feedback_info}")
-            
-            # Обновляем время последней проверки
-            self._last_feedback_check = datetime.now(timezone.utc)
-            log(f"⏱ Время последней проверки отзывов обновлено: {self._last_feedback_check.strftime('%Y-%m-%dT%H:%M:%S')}")
-            
-            return feedback_info
-
-        except requests.exceptions.HTTPError as e:
-            log(f"❌ Ошибка HTTP при проверке отзывов: {e}")
-            if e.response.status_code == 401:
-                log("🔑 Возможно, токен устарел или неверный")
-            return None
-        except requests.exceptions.Timeout as e:
-            log(f"⏱ Превышено время ожидания запроса отзывов: {e}")
-            return None
-        except requests.exceptions.RequestException as e:
-            log(f"❌ Ошибка при проверке отзывов и вопросов: {e}")
-            return None
+            while True:
+                log(f"🔄 Запрос {stream}: {WB_FEEDBACK_API_URL}{url} с dateFrom={int(date_from.timestamp())}, skip={skip}")
+                response = await self._send(
+                    self.feedback_client, self.feedback_token, self.feedback_rate, url, 'feedbacks',
+                    params={
+                        'isAnswered': 'false',
+                        'take': FEEDBACKS_PAGE_SIZE,
+                        'skip': skip,
+                        'order': 'dateAsc',
+                        'dateFrom': int(date_from.timestamp())
+                    }
+                )
+                response.raise_for_status()
+                result = response.json()
+                
+                # Проверяем наличие ошибок
+                if result.get('error'):
+                    log(f"❌ Ошибка при получении {stream}: {result.get('errorText')}")
+                    if result.get('additionalErrors'):
+                        log(f"❌ Дополнительные ошибки: {', '.join(result['additionalErrors'])}")
+                    break
+                
+                records = (result.get('data') or {}).get(stream) or []
+                latest = None
+                for record in records:
+                    created = record.get('createdDate')
+                    if created and (latest is None or parse_date_string(created) > parse_date_string(latest)):
+                        latest = created
+                    key = record.get('id')
+                    if not key or key in self._unacked[stream] or self.store.is_processed(state_key, key):
+                        continue
+                    self._unacked[stream].add(key)
+                    items.append(Feedback.from_api(record, kind))
+                log(f"📬 Получено {len(records)} записей {stream}, новых всего: {len(items)}")
+                
+                # Контрольная точка курсора после каждой страницы
+                self._checkpoint(stream, latest)
+                if len(records) < FEEDBACKS_PAGE_SIZE:
+                    break
+                skip += FEEDBACKS_PAGE_SIZE
+        
+        except httpx.HTTPStatusError as e:
+            log(f"❌ Ошибка HTTP при получении {stream}: {e}")
+            self._record_http_error('feedbacks', e)
+        except httpx.TimeoutException as e:
+            log(f"⏱ Превышено время ожидания запроса {stream}: {e}")
+        except httpx.RequestError as e:
+            log(f"❌ Ошибка при получении {stream}: {e}")
         except Exception as e:
-            log(f"❌ Неожиданная ошибка при проверке отзывов: {e}")
-            return None
+            log(f"❌ Неожиданная ошибка при получении {stream}: {e}")
+        return items
 
-    def get_sales(self):
-        """Получение данных о новых продажах с Wildberries с поддержкой пагинации"""
-        log(f"🔄 Получение новых продаж с {self._last_sales_time.strftime('%Y-%m-%dT%H:%M:%S')}")
-        all_sales = []
-        date_from = self._last_sales_time.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    async def get_sales(self):
+        """Получение данных о новых продажах с Wildberries с поддержкой пагинации.
+        
+        Асинхронный генератор: продажи отдаются по одной, не дожидаясь загрузки всей страницы.
+        """
+        self._start_poll('sales')
+        date_from = self._get_date_from('sales')
+        log(f"🔄 Получение новых продаж с {date_from}")
         
         try:
             while True:
                 try:
-                    url = f"{WB_API_BASE_URL}/api/v1/supplier/sales"
-                    log(f"🔄 Запрос продаж: {url} с dateFrom={date_from}")
-                    
-                    response = requests.get(
-                        url,
-                        headers=self.stats_headers,
-                        params={
-                            'dateFrom': date_from,
-                            'flag': 0  # 0 - все продажи
-                        },
-                        timeout=30  # Таймаут 30 секунд
-                    )
+                    url = "/api/v1/supplier/sales"
+                    log(f"🔄 Запрос продаж: {WB_API_BASE_URL}{url} с dateFrom={date_from}")
                     
-                    # Проверяем код ответа
-                    response.raise_for_status()
+                    page = {'rows': 0, 'duplicates': 0, 'last_change_date': None, 'max_change_date': None}
+                    new_count = 0
+                    async for sale in self._iter_new_records('sales', url, date_from, 'saleID', Sale, page):
+                        new_count += 1
+                        yield sale
                     
-                    # Получаем данные
-                    sales = response.json()
-                    log(f"📦 Получено {len(sales)} продаж от API")
+                    log(f"📦 Получено {page['rows']} продаж от API")
+                    log(f"📬 Найдено {new_count} новых продаж")
                     
-                    # Если нет продаж, прерываем цикл
-                    if not sales:
+                    # Если нет продаж, курсор не двигается: он сдвигается только до lastChangeDate
+                    # полученных записей, иначе запоздавшие записи с прошлым lastChangeDate пропали бы
+                    if not page['rows']:
                         break
                     
-                    # Добавляем только необработанные продажи
-                    new_sales = [
-                        sale for sale in sales 
-                        if sale.get('saleID') not in self._processed_sales
-                    ]
-                    log(f"📬 Найдено {len(new_sales)} новых продаж")
-                    all_sales.extend(new_sales)
-                    
-                    # Обновляем множество обработанных продаж
-                    self._processed_sales.update(sale.get('saleID') for sale in new_sales if sale.get('saleID'))
+                    # Контрольная точка курсора после каждой страницы
+                    self._checkpoint('sales', page['max_change_date'])
                     
                     # Если получили меньше максимального количества, значит это последняя страница
-                    if len(sales) < MAX_ORDERS_PER_REQUEST:
+                    if page['rows'] < MAX_ORDERS_PER_REQUEST:
                         break
                         
                     # Берем дату последней продажи для следующего запроса
-                    if sales:
-                        date_from = sales[-1]['lastChangeDate']
-                        log(f"🔄 Следующий запрос с dateFrom={date_from}")
+                    date_from = page['last_change_date']
+                    log(f"🔄 Следующий запрос с dateFrom={date_from}")
                     
                     # Добавляем задержку между запросами
                     log(f"⏱ Ожидание {PAGINATION_DELAY} сек перед следующим запросом")
-                    time.sleep(PAGINATION_DELAY)
+                    await asyncio.sleep(PAGINATION_DELAY)
                     
-                except requests.exceptions.HTTPError as e:
+                except httpx.HTTPStatusError as e:
                     log(f"❌ Ошибка HTTP при получении продаж: {e}")
-                    if e.response.status_code == 401:
-                        log("🔑 Возможно, токен устарел или неверный")
+                    self._record_http_error('sales', e)
                     break
-                except requests.exceptions.Timeout:
+                except httpx.TimeoutException:
                     log("❌ Превышено время ожидания ответа от сервера (таймаут).")
                     break
-                except requests.exceptions.ConnectionError:
+                except httpx.ConnectError:
                     log("❌ Ошибка соединения с сервером.")
                     break
-                except requests.exceptions.RequestException as e:
+                except httpx.RequestError as e:
                     log(f"❌ Ошибка при получении продаж: {e}")
                     break
                 except Exception as e:
                     log(f"❌ Неожиданная ошибка при получении продаж: {e}")
                     break
         finally:
-            # Обновляем время последней проверки продаж на текущее время
-            self._last_sales_time = datetime.now(timezone.utc)
-            log(f"⏱ Время последней проверки продаж обновлено: {self._last_sales_time.strftime('%Y-%m-%dT%H:%M:%S')}")
-            
-        return all_sales
+            # Курсор сдвигается только по фактически обработанным страницам
+            log(f"⏱ Курсор продаж: {self.store.get_cursor(self._state_key('sales'))}")
+            WB_POLL_PAGES.observe(self.last_poll['sales']['pages'], stream='sales')
 
-    def check_api_status(self):
-        """Проверка работоспособности API"""
-        log("🔍 Запуск проверки API")
-        results = {}
+    async def single_flight(self, stream, check):
+        """Проверка потока, общая для одновременных вызовов.
         
-        # Проверка API статистики
-        try:
-            log("🔄 Проверка API статистики...")
-            url = f"{WB_API_BASE_URL}/api/v1/supplier/orders"
-            date_from = (datetime.now() - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
-            log(f"🔤 URL запроса: {url}")
-            log(f"🔤 Параметры: dateFrom={date_from}, flag=0")
-            log(f"🔤 Заголовки: Authorization={self.stats_token[:10]}...")
-            
-            start_time = datetime.now()
-            response = requests.get(
-                url,
-                headers=self.stats_headers,
-                params={
-                    'dateFrom': date_from,
-                    'flag': 0
-                },
-                timeout=10
-            )
-            elapsed_time = (datetime.now() - start_time).total_seconds()
-            
-            log(f"📊 Статус ответа API статистики: {response.status_code}")
-            log(f"⏱ Время ответа: {elapsed_time:.2f} сек")
-            
-            # Проверяем содержимое ответа
-            try:
-                response_data = response.json()
-                log(f"📋 Количество полученных записей: {len(response_data) if isinstance(response_data, list) else 'Не массив'}")
-            except ValueError:
-                log("❌ Ответ не содержит валидного JSON")
-            
-            # Если ответ не 200, проверяем содержимое на наличие ошибок
-            if response.status_code != 200:
-                log(f"⚠️ Код ответа не 200. Содержимое: {response.text[:200]}...")
-            
-            results['statistics_api'] = {
-                'status': 'OK' if response.status_code == 200 else 'ERROR',
-                'code': response.status_code,
-                'response_time': f"{elapsed_time:.2f} сек",
-                'data_received': True if response.status_code == 200 and response.text else False
-            }
-        except requests.exceptions.Timeout:
-            log("⏱ Тайм-аут при проверке API статистики")
-            results['statistics_api'] = {
-                'status': 'ERROR',
-                'error': "Тайм-аут запроса (превышено время ожидания)"
-            }
-        except requests.exceptions.ConnectionError:
-            log("🌐 Ошибка соединения при проверке API статистики")
-            results['statistics_api'] = {
-                'status': 'ERROR',
-                'error': "Ошибка соединения с сервером"
-            }
-        except Exception as e:
-            log(f"❌ Ошибка при проверке API статистики: {e}")
-            log(f"📋 Стек вызовов: {traceback.format_exc()}")
-            results['statistics_api'] = {
-                'status': 'ERROR',
-                'error': str(e)
-            }
+        Если проверка потока уже выполняется (по расписанию или по кнопке), вызов не запускает
+        новую выборку, а ждет текущую и возвращает ее результат. Отмена ожидающего
+        проверку не прерывает; остановить ее можно только через cancel_checks().
+        """
+        task = self._inflight.get(stream)
+        if task is None:
+            task = asyncio.create_task(check())
+            task.add_done_callback(lambda done: self._finish_check(stream, done))
+            self._inflight[stream] = task
+        else:
+            log(f"🔗 Проверка потока {stream} уже выполняется, ожидаем ее результат")
+        # shield: отмена одного ожидающего не прерывает проверку для остальных
+        return await asyncio.shield(task)
+    
+    async def cancel_checks(self):
+        """Отмена выполняемых проверок с ожиданием их завершения.
         
-        # Проверка API отзывов
+        Нужна перед закрытием HTTP-сессий и освобождением кабинета: иначе проверка под shield
+        продолжила бы писать курсоры и очередь уведомлений, пока кабинет опрашивает другой обработчик.
+        """
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _finish_check(self, stream, task):
+        """Завершение общей проверки потока"""
+        if self._inflight.get(stream) is task:
+            del self._inflight[stream]
+        if not task.cancelled():
+            task.exception()  # Ошибку получают ожидающие; без них она не попадет в журнал asyncio
+    
+    def _record_health(self, client, url, code=None, elapsed=None, error=None):
+        """Учет результата запроса к API: /status показывает его без отдельных запросов"""
+        api = 'statistics_api' if client is self.stats_client else 'feedback_api'
+        health = {
+            'status': 'OK' if code == 200 else 'ERROR',
+            'endpoint': url,
+            'checked_at': time.time()
+        }
+        if code is not None:
+            health['code'] = code
+        if elapsed is not None:
+            health['response_time'] = f"{elapsed:.2f} сек"
+        if error is not None:
+            health['error'] = error
+        self.api_health[api] = health
+    
+    async def check_api_status(self):
+        """Проверка работоспособности API.
+        
+        Используются результаты регулярных проверок, а если они устарели - запрос /ping,
+        который не расходует квоту методов статистики. Оба API проверяются одновременно.
+        Результат кешируется на STATUS_CACHE_TTL секунд и общий для всех пользователей,
+        а одновременные вызовы ждут одну и ту же проверку.
+        """
+        if self._status_cache is not None and time.monotonic() - self._status_cache[0] < STATUS_CACHE_TTL:
+            log("📦 Состояние API взято из кеша")
+            return self._status_cache[1]
+        
+        if self._status_task is None:
+            log("🔍 Запуск проверки API")
+            self._status_task = asyncio.create_task(self._collect_api_status())
+            self._status_task.add_done_callback(self._finish_status_check)
+        # shield: отмена одного обработчика не прерывает проверку для остальных
+        return await asyncio.shield(self._status_task)
+    
+    def _finish_status_check(self, task):
+        """Сохранение результата проверки API в кеш"""
+        self._status_task = None
+        if not task.cancelled() and task.exception() is None:
+            self._status_cache = (time.monotonic(), task.result())
+    
+    async def _collect_api_status(self):
+        """Состояние обоих API, проверяемых одновременно"""
+        statistics_api, feedback_api = await asyncio.gather(
+            self._get_api_health('statistics_api', self.stats_client, self.stats_token),
+            self._get_api_health('feedback_api', self.feedback_client, self.feedback_token)
+        )
+        log("✅ Проверка API завершена")
+        return {'statistics_api': statistics_api, 'feedback_api': feedback_api}
+    
+    async def _get_api_health(self, api, client, token):
+        """Свежий результат регулярных проверок или результат запроса /ping"""
+        health = self.api_health.get(api)
+        if health is not None and time.time() - health['checked_at'] < STATUS_HEALTH_MAX_AGE:
+            log(f"📊 Состояние {api} по данным регулярной проверки")
+            return health
+        
+        log(f"🔄 Проверка {api} запросом /ping")
         try:
-            log("🔄 Проверка API отзывов...")
-            url = f"{WB_FEEDBACK_API_URL}/api/v1/new-feedbacks-questions"
-            log(f"🔤 URL запроса: {url}")
-            log(f"🔤 Заголовки: Authorization=Bearer {self.feedback_token[:10]}...")
-            
-            start_time = datetime.now()
-            response = requests.get(url, headers=self.feedback_headers, timeout=10)
-            elapsed_time = (datetime.now() - start_time).total_seconds()
-            
-            log(f"📊 Статус ответа API отзывов: {response.status_code}")
-            log(f"⏱ Время ответа: {elapsed_time:.2f} сек")
-            
-            # Проверяем содержимое ответа
-            try:
-                response_data = response.json()
-                error = response_data.get('error', False)
-                if error:
-                    log(f"⚠️ API вернул ошибку: {response_data.get('errorText')}")
-                    additional_errors = response_data.get('additionalErrors', [])
-                    if additional_errors:
-                        log(f"⚠️ Дополнительные ошибки: {', '.join(additional_errors)}")
-            except ValueError:
-                log("❌ Ответ не содержит валидного JSON")
-            
-            results['feedback_api'] = {
-                'status': 'OK' if response.status_code == 200 and not error else 'ERROR',
-                'code': response.status_code,
-                'response_time': f"{elapsed_time:.2f} сек"
-            }
-            
-            if error:
-                results['feedback_api']['error'] = response_data.get('errorText', 'Неизвестная ошибка')
-                
-        except requests.exceptions.Timeout:
-            log("⏱ Тайм-аут при проверке API отзывов")
-            results['feedback_api'] = {
-                'status': 'ERROR',
-                'error': "Тайм-аут запроса (превышено время ожидания)"
-            }
-        except requests.exceptions.ConnectionError:
-            log("🌐 Ошибка соединения при проверке API отзывов")
-            results['feedback_api'] = {
-                'status': 'ERROR',
-                'error': "Ошибка соединения с сервером"
-            }
+            response = await self._send(client, token, WB_PING_RATE, '/ping', 'status', timeout=10, retries=0)
+            log(f"📊 Статус ответа {api}: {response.status_code}")
+        except httpx.RequestError:
+            pass  # Ошибка уже учтена в api_health
         except Exception as e:
-            log(f"❌ Ошибка при проверке API отзывов: {e}")
+            log(f"❌ Ошибка при проверке {api}: {e}")
             log(f"📋 Стек вызовов: {traceback.format_exc()}")
-            results['feedback_api'] = {
-                'status': 'ERROR',
-                'error': str(e)
-            }
-        
-        log("✅ Проверка API завершена")
-        return results
+            self._record_health(client, '/ping', error=str(e))
+        return self.api_health[api]
+
+def format_seller_prefix(seller, seller_count):
+    """Заголовок уведомления с именем кабинета (только если кабинетов несколько)"""
+    if seller_count > 1 and seller.name:
+        return f"🏪 <b>{html.escape(seller.name)}</b>\n"
+    return ""
+
+class OutboxNotifier:
+    """Постановка уведомлений в общую очередь без Telegram: для обработчиков раздельного режима.
+    
+    Повторяет методы TelegramBot, которыми пользуются проверки (send_notification, seller_prefix),
+    а доставку выполняет процесс бота, читающий ту же очередь.
+    """
+    
+    def __init__(self, store, seller_count):
+        self.store = store
+        self.seller_count = seller_count
+    
+    def seller_prefix(self, seller):
+        """Заголовок уведомления с именем кабинета"""
+        return format_seller_prefix(seller, self.seller_count)
+    
+    async def send_notification(self, message, chat_ids, event_at=None):
+        """Постановка уведомления в очередь отправки для чатов кабинета"""
+        log("📤 Постановка уведомления в общую очередь", level=logging.DEBUG)
+        self.store.enqueue_messages(chat_ids, message, event_at)
 
 class TelegramBot:
-    def __init__(self, bot_token, chat_id, wb_api):
+    def __init__(self, bot_token, wb_apis, store, split_mode=False):
         log("🔧 Инициализация TelegramBot")
         self.bot_token = bot_token
         log(f"🔑 Токен бота: {bot_token[:10]}...")
-        self.chat_ids = [id.strip() for id in chat_id.split(',')]
+        self.wb_apis = wb_apis  # По одному WildberriesAPI на кабинет продавца
+        # В раздельном режиме данные WB получают обработчики, бот только передает им запросы
+        self.split_mode = split_mode
+        # Доступ к боту имеют все чаты всех кабинетов
+        self.chat_ids = list(dict.fromkeys(
+            chat_id for wb_api in wb_apis for chat_id in wb_api.seller.chat_ids
+        ))
         log(f"👥 ID чатов: {self.chat_ids}")
-        self.wb_api = wb_api
+        # Служебные команды: только администраторам, если они заданы
+        self.admin_ids = parse_chat_ids(ADMIN_IDS) or self.chat_ids
+        self._backfills = {}  # Имя кабинета -> задача загрузки истории
+        self.store = store  # Постоянная очередь исходящих уведомлений
+        self._outbox_event = asyncio.Event()
+        
+        # Ограничители частоты отправки по лимитам Telegram: общий и для каждого чата
+        self.global_limiter = TokenBucket(TELEGRAM_GLOBAL_RATE)
+        self.chat_limiters = {}
         
         log("🔄 Создание приложения Telegram...")
-        self.app = Application.builder().token(bot_token).build()
+        # Адрес Bot API можно заменить, например, на локальный сервер для тестов
+        self.app = (
+            Application.builder()
+            .token(bot_token)
+            .base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+            .base_file_url(f"{TELEGRAM_API_URL.rstrip('/')}/file/bot")
+            .build()
+        )
         
         # Добавляем обработчик для всех сообщений (не только команд)
         log("📱 Настройка обработчика всех сообщений...")
@@ -439,6 +955,14 @@ class TelegramBot:
             log("✅ Команда /help зарегистрирована")
             self.app.add_handler(CommandHandler("test", self.test_command))
             log("✅ Команда /test зарегистрирована")
+            self.app.add_handler(CommandHandler("metrics", self.metrics_command))
+            log("✅ Команда /metrics зарегистрирована")
+            self.app.add_handler(CommandHandler("report", self.report_command))
+            log("✅ Команда /report зарегистрирована")
+            self.app.add_handler(CommandHandler("history", self.history_command))
+            log("✅ Команда /history зарегистрирована")
+            self.app.add_handler(CommandHandler("backfill", self.backfill_command))
+            log("✅ Команда /backfill зарегистрирована")
             
             # Добавляем обработчик для inline-кнопок
             self.app.add_handler(CallbackQueryHandler(self.button_handler))
@@ -479,6 +1003,10 @@ class TelegramBot:
             # Показываем главное меню
             log(f"🔄 Запуск команды start из кнопки для пользователя {query.from_user.id}")
             await self.start_callback(query)
+        elif query.data.startswith("report_"):
+            # Показываем отчет за период
+            log(f"🔄 Построение отчета из кнопки для пользователя {query.from_user.id}")
+            await self.report_callback(query, query.data.removeprefix("report_"))
         elif query.data == "check_now":
             # Выполняем внеплановую проверку
             log(f"🔄 Запуск внеплановой проверки для пользователя {query.from_user.id}")
@@ -549,6 +1077,7 @@ class TelegramBot:
                 InlineKeyboardButton("📊 Статус API", callback_data="status"),
                 InlineKeyboardButton("🔍 Проверить сейчас", callback_data="check_now")
             ],
+            REPORT_BUTTONS,
             [
                 InlineKeyboardButton("❓ Помощь", callback_data="help"),
                 InlineKeyboardButton("🧪 Тест", callback_data="test")
@@ -577,13 +1106,32 @@ class TelegramBot:
             
             log(f"🔍 Начало внеплановой проверки для пользователя {query.from_user.id}")
             
-            # Выполняем проверки в отдельных задачах
-            orders_task = asyncio.create_task(check_orders_async(self, self.wb_api))
-            feedbacks_task = asyncio.create_task(check_feedbacks_async(self, self.wb_api))
-            sales_task = asyncio.create_task(check_sales_async(self, self.wb_api))
+            if self.split_mode:
+                # Проверку выполнит обработчик, арендующий кабинет, уведомления придут через очередь
+                for wb_api in self._apis_for(query.from_user.id):
+                    self.store.request_check(wb_api.seller.name)
+                await status_message.edit_text(
+                    "✅ <b>Внеплановая проверка запрошена!</b>\n\n"
+                    "Если появятся новые заказы, выкупы или отзывы, "
+                    "вы получите соответствующие уведомления в ближайшие секунды.",
+                    parse_mode='HTML',
+                    reply_markup=InlineKeyboardMarkup([[
+                        InlineKeyboardButton("🏠 На главную", callback_data="start")
+                    ]])
+                )
+                return
+            
+            # Выполняем проверки кабинетов пользователя в отдельных задачах.
+            # Уже идущая проверка потока (по расписанию или от другого пользователя) не
+            # дублируется: ждем ее результат
+            tasks = []
+            for wb_api in self._apis_for(query.from_user.id):
+                tasks.append(asyncio.create_task(check_orders_async(self, wb_api)))
+                tasks.append(asyncio.create_task(check_feedbacks_async(self, wb_api)))
+                tasks.append(asyncio.create_task(check_sales_async(self, wb_api)))
             
             # Ждем завершения всех проверок
-            await asyncio.gather(orders_task, feedbacks_task, sales_task)
+            await asyncio.gather(*tasks)
             
             log(f"✅ Внеплановая проверка завершена для пользователя {query.from_user.id}")
             
@@ -628,23 +1176,25 @@ class TelegramBot:
                 reply_markup=reply_markup
             )
     
-    async def status_callback(self, query):
-        """Обработка нажатия на кнопку статуса"""
-        try:
-            # Изменяем текст сообщения на сообщение о проверке
-            status_message = await query.message.edit_text(
-                "🔍 Проверяю состояние API Wildberries...",
-                reply_markup=None  # Убираем кнопки на время проверки
-            )
-            
-            # Проверка статуса API
-            log(f"🔄 Запуск проверки API для пользователя {query.from_user.id}")
-            api_status = self.wb_api.check_api_status()
-            log(f"📊 Результаты проверки API: {api_status}")
-            
-            # Формируем сообщение о статусе
-            log("📝 Формирование сообщения о статусе")
-            result_message = "📊 <b>Состояние API Wildberries</b>\n\n"
+    def _apis_for(self, user_id):
+        """Кабинеты, в чаты которых входит пользователь"""
+        return [wb_api for wb_api in self.wb_apis if str(user_id) in wb_api.seller.chat_ids]
+    
+    def seller_prefix(self, seller):
+        """Заголовок уведомления с именем кабинета (только если кабинетов несколько)"""
+        return format_seller_prefix(seller, len(self.wb_apis))
+    
+    async def _build_status_message(self, user_id):
+        """Сообщение о состоянии API кабинетов пользователя"""
+        wb_apis = self._apis_for(user_id)
+        statuses = await asyncio.gather(*(wb_api.check_api_status() for wb_api in wb_apis))
+        
+        log("📝 Формирование сообщения о статусе")
+        result_message = "📊 <b>Состояние API Wildberries</b>\n\n"
+        for wb_api, api_status in zip(wb_apis, statuses):
+            log("📊 Результаты проверки API: %s", api_status, level=logging.DEBUG)
+            if len(self.wb_apis) > 1:
+                result_message += f"🏪 <b>Кабинет «{html.escape(wb_api.seller.name)}»</b>\n"
             
             # Статус API статистики
             stats_api = api_status.get('statistics_api', {})
@@ -670,10 +1220,29 @@ class TelegramBot:
                 else:
                     result_message += f"⚠️ Код ответа: {feedback_api.get('code')}\n\n"
             
-            # Информация о боте
-            result_message += "🤖 <b>Состояние бота</b>\n"
-            result_message += f"⏰ Время проверки: {get_moscow_time().strftime('%d.%m.%Y %H:%M:%S')}\n"
-            result_message += f"🔄 Интервал проверки данных: {CHECK_INTERVAL // 60} минут\n"
+            # Данные могут быть взяты из регулярных проверок: показываем их возраст
+            checked = [api.get('checked_at') for api in (stats_api, feedback_api) if api.get('checked_at')]
+            if checked:
+                result_message += f"🕒 Данные получены {format_seconds(time.time() - min(checked))} назад\n\n"
+        
+        # Информация о боте
+        result_message += "🤖 <b>Состояние бота</b>\n"
+        result_message += f"⏰ Время проверки: {get_moscow_time().strftime('%d.%m.%Y %H:%M:%S')}\n"
+        result_message += f"🔄 Интервал проверки данных: {format_check_intervals()}\n"
+        return result_message
+    
+    async def status_callback(self, query):
+        """Обработка нажатия на кнопку статуса"""
+        try:
+            # Изменяем текст сообщения на сообщение о проверке
+            status_message = await query.message.edit_text(
+                "🔍 Проверяю состояние API Wildberries...",
+                reply_markup=None  # Убираем кнопки на время проверки
+            )
+            
+            # Проверка статуса API по кабинетам пользователя
+            log(f"🔄 Запуск проверки API для пользователя {query.from_user.id}")
+            result_message = await self._build_status_message(query.from_user.id)
             
             # Создаем клавиатуру с кнопками
             keyboard = [
@@ -689,7 +1258,7 @@ class TelegramBot:
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             log(f"📤 Редактирование сообщения о статусе для пользователя {query.from_user.id}")
-            log(f"📝 Содержимое: {result_message}")
+            log("📝 Содержимое: %s", result_message, level=logging.DEBUG)
             
             try:
                 # Редактируем предыдущее сообщение вместо отправки нового
@@ -744,6 +1313,10 @@ class TelegramBot:
             "/start - Запуск бота и показ кнопок\n"
             "/status - Проверка статуса API\n"
             "/test - Отправка тестовых уведомлений\n"
+            "/metrics - Метрики производительности\n"
+            "/report today|week|month - Отчет о заказах и выкупах за период\n"
+            "/history АРТИКУЛ [дней] - История заказов и выкупов артикула\n"
+            "/backfill ДАТА ДАТА - Загрузка истории за период без уведомлений\n"
             "/help - Показ этой справки\n\n"
             "<b>Или используйте кнопки под сообщениями!</b>\n\n"
             "🔍 <b>Кнопка \"Проверить сейчас\"</b> позволяет выполнить внеплановую проверку "
@@ -756,6 +1329,7 @@ class TelegramBot:
                 InlineKeyboardButton("📊 Статус API", callback_data="status"),
                 InlineKeyboardButton("🔍 Проверить сейчас", callback_data="check_now")
             ],
+            REPORT_BUTTONS,
             [
                 InlineKeyboardButton("🏠 На главную", callback_data="start"),
                 InlineKeyboardButton("🧪 Тест", callback_data="test")
@@ -801,7 +1375,7 @@ class TelegramBot:
         """Обработчик ошибок для бота Telegram"""
         log(f"❌ Ошибка при обработке обновления: {context.error}")
         log(f"📋 Стек вызовов: {traceback.format_exc()}")
-        log(f"🔍 Данные обновления: {update}")
+        log("🔍 Данные обновления: %s", update, level=logging.DEBUG)
     
     async def start_command(self, update: Update, context: CallbackContext):
         """Обработчик команды /start"""
@@ -820,6 +1394,7 @@ class TelegramBot:
                 InlineKeyboardButton("📊 Статус API", callback_data="status"),
                 InlineKeyboardButton("🔍 Проверить сейчас", callback_data="check_now")
             ],
+            REPORT_BUTTONS,
             [
                 InlineKeyboardButton("❓ Помощь", callback_data="help"),
                 InlineKeyboardButton("🧪 Тест", callback_data="test")
@@ -857,6 +1432,10 @@ class TelegramBot:
             "/start - Запуск бота и показ кнопок\n"
             "/status - Проверка статуса API\n"
             "/test - Отправка тестовых уведомлений\n"
+            "/metrics - Метрики производительности\n"
+            "/report today|week|month - Отчет о заказах и выкупах за период\n"
+            "/history АРТИКУЛ [дней] - История заказов и выкупов артикула\n"
+            "/backfill ДАТА ДАТА - Загрузка истории за период без уведомлений\n"
             "/help - Показ этой справки\n\n"
             "<b>Или используйте кнопки под сообщениями!</b>\n\n"
             "🔍 <b>Кнопка \"Проверить сейчас\"</b> позволяет выполнить внеплановую проверку "
@@ -869,6 +1448,7 @@ class TelegramBot:
                 InlineKeyboardButton("📊 Статус API", callback_data="status"),
                 InlineKeyboardButton("🔍 Проверить сейчас", callback_data="check_now")
             ],
+            REPORT_BUTTONS,
             [
                 InlineKeyboardButton("🏠 На главную", callback_data="start"),
                 InlineKeyboardButton("🧪 Тест", callback_data="test")
@@ -904,43 +1484,9 @@ class TelegramBot:
             log(f"🔄 Отправка сообщения о начале проверки для пользователя {user_id}")
             status_message = await update.message.reply_text("🔍 Проверяю состояние API Wildberries...")
             
-            # Проверка статуса API
+            # Проверка статуса API по кабинетам пользователя
             log(f"🔄 Запуск проверки API для пользователя {user_id}")
-            api_status = self.wb_api.check_api_status()
-            log(f"📊 Результаты проверки API: {api_status}")
-            
-            # Формируем сообщение о статусе
-            log("📝 Формирование сообщения о статусе")
-            result_message = "📊 <b>Состояние API Wildberries</b>\n\n"
-            
-            # Статус API статистики
-            stats_api = api_status.get('statistics_api', {})
-            if stats_api.get('status') == 'OK':
-                result_message += "✅ <b>API статистики:</b> Работает\n"
-                result_message += f"⏱ Время ответа: {stats_api.get('response_time')}\n\n"
-            else:
-                result_message += "❌ <b>API статистики:</b> Ошибка\n"
-                if 'error' in stats_api:
-                    result_message += f"⚠️ Ошибка: {stats_api.get('error')}\n\n"
-                else:
-                    result_message += f"⚠️ Код ответа: {stats_api.get('code')}\n\n"
-            
-            # Статус API отзывов
-            feedback_api = api_status.get('feedback_api', {})
-            if feedback_api.get('status') == 'OK':
-                result_message += "✅ <b>API отзывов:</b> Работает\n"
-                result_message += f"⏱ Время ответа: {feedback_api.get('response_time')}\n\n"
-            else:
-                result_message += "❌ <b>API отзывов:</b> Ошибка\n"
-                if 'error' in feedback_api:
-                    result_message += f"⚠️ Ошибка: {feedback_api.get('error')}\n\n"
-                else:
-                    result_message += f"⚠️ Код ответа: {feedback_api.get('code')}\n\n"
-            
-            # Информация о боте
-            result_message += "🤖 <b>Состояние бота</b>\n"
-            result_message += f"⏰ Время проверки: {get_moscow_time().strftime('%d.%m.%Y %H:%M:%S')}\n"
-            result_message += f"🔄 Интервал проверки данных: {CHECK_INTERVAL // 60} минут\n"
+            result_message = await self._build_status_message(user_id)
             
             # Создаем клавиатуру с кнопками
             keyboard = [
@@ -956,7 +1502,7 @@ class TelegramBot:
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             log(f"📤 Редактирование сообщения о статусе для пользователя {user_id}")
-            log(f"📝 Содержимое: {result_message}")
+            log("📝 Содержимое: %s", result_message, level=logging.DEBUG)
             
             try:
                 # Редактируем предыдущее сообщение вместо отправки нового
@@ -1003,6 +1549,171 @@ class TelegramBot:
             except Exception as e2:
                 log(f"❌ Ошибка при отправке сообщения об ошибке: {e2}")
     
+    async def metrics_command(self, update: Update, context: CallbackContext):
+        """Обработчик команды /metrics - сводка метрик производительности"""
+        user_id = update.effective_user.id
+        log(f"📥 Получена команда /metrics от пользователя {user_id}")
+        
+        # Проверяем права доступа
+        if str(user_id) not in self.chat_ids:
+            log(f"❌ Доступ запрещен для пользователя {user_id}")
+            await update.message.reply_text("❌ У вас нет доступа к этой команде.")
+            return
+        
+        await update.message.reply_text(format_metrics_summary(), parse_mode='HTML')
+        log(f"📤 Отправлена сводка метрик пользователю {user_id}")
+    
+    def _build_report_messages(self, user_id, period):
+        """Отчеты за период по кабинетам пользователя из агрегатов истории"""
+        started = time.perf_counter()
+        date_from, date_to = report_period(period)
+        messages = []
+        for wb_api in self._apis_for(user_id):
+            prefix = self.seller_prefix(wb_api.seller)
+            if wb_api.history is None:
+                messages.append(f"{prefix}⚠️ История заказов и выкупов отключена (HISTORY_DB_PATH)")
+                continue
+            orders = wb_api.history.rollup('orders', wb_api.seller.name, date_from, date_to)
+            sales = wb_api.history.rollup('sales', wb_api.seller.name, date_from, date_to)
+            returns = wb_api.history.rollup('returns', wb_api.seller.name, date_from, date_to)
+            messages.append(prefix + format_report(period, date_from, date_to, orders, sales, returns))
+        log(f"📈 Отчет за {period} построен за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return messages
+    
+    async def report_command(self, update: Update, context: CallbackContext):
+        """Обработчик команды /report today|week|month - отчет о заказах и выкупах"""
+        user_id = update.effective_user.id
+        log(f"📥 Получена команда /report от пользователя {user_id}")
+        
+        # Проверяем права доступа
+        if str(user_id) not in self.chat_ids:
+            log(f"❌ Доступ запрещен для пользователя {user_id}")
+            await update.message.reply_text("❌ У вас нет доступа к этой команде.")
+            return
+        
+        period = context.args[0].lower() if context.args else 'today'
+        if period not in REPORT_PERIODS:
+            await update.message.reply_text("ℹ️ Использование: /report today|week|month")
+            return
+        
+        messages = self._build_report_messages(user_id, period)
+        for index, message in enumerate(messages):
+            await update.message.reply_text(
+                message,
+                parse_mode='HTML',
+                reply_markup=report_keyboard() if index == len(messages) - 1 else None
+            )
+        log(f"📤 Отправлен отчет за {period} пользователю {user_id}")
+    
+    async def history_command(self, update: Update, context: CallbackContext):
+        """Обработчик команды /history АРТИКУЛ [дней] - заказы и выкупы артикула из истории"""
+        user_id = update.effective_user.id
+        log(f"📥 Получена команда /history от пользователя {user_id}")
+        
+        # Проверяем права доступа
+        if str(user_id) not in self.chat_ids:
+            log(f"❌ Доступ запрещен для пользователя {user_id}")
+            await update.message.reply_text("❌ У вас нет доступа к этой команде.")
+            return
+        
+        args = context.args or []
+        try:
+            days = int(args[1]) if len(args) > 1 else HISTORY_DEFAULT_DAYS
+        except ValueError:
+            days = 0
+        if not args or len(args) > 2 or days <= 0:
+            await update.message.reply_text(f"ℹ️ Использование: /history АРТИКУЛ [дней, по умолчанию {HISTORY_DEFAULT_DAYS}]")
+            return
+        
+        article = args[0]
+        date_to = get_moscow_time()
+        date_from = date_to - timedelta(days=days)
+        started = time.perf_counter()
+        for wb_api in self._apis_for(user_id):
+            prefix = self.seller_prefix(wb_api.seller)
+            if wb_api.history is None:
+                message = f"{prefix}⚠️ История заказов и выкупов отключена (HISTORY_DB_PATH)"
+            else:
+                name = wb_api.seller.name
+                message = prefix + format_history(
+                    article, days,
+                    wb_api.history.summary('orders', name, date_from, date_to, supplier_article=article),
+                    wb_api.history.summary('sales', name, date_from, date_to, supplier_article=article),
+                    wb_api.history.summary('returns', name, date_from, date_to, supplier_article=article),
+                    wb_api.history.find(
+                        'orders', name, date_from, date_to, limit=HISTORY_RECENT_ORDERS, supplier_article=article
+                    )
+                )
+            await update.message.reply_text(message, parse_mode='HTML')
+        log(f"📤 История артикула отправлена пользователю {user_id} "
+            f"(запросы к истории {(time.perf_counter() - started) * 1000:.0f} мс)")
+    
+    async def backfill_command(self, update: Update, context: CallbackContext):
+        """Обработчик команды /backfill ДАТА ДАТА - загрузка истории за период без уведомлений"""
+        user_id = update.effective_user.id
+        log(f"📥 Получена команда /backfill от пользователя {user_id}")
+        
+        # Проверяем права доступа
+        if str(user_id) not in self.chat_ids or str(user_id) not in self.admin_ids:
+            log(f"❌ Доступ запрещен для пользователя {user_id}")
+            await update.message.reply_text("❌ У вас нет доступа к этой команде.")
+            return
+        
+        try:
+            date_from, date_to = (date.fromisoformat(value) for value in context.args)
+        except ValueError:
+            await update.message.reply_text("ℹ️ Использование: /backfill 2025-03-01 2025-03-31")
+            return
+        error = backfill_range_error(date_from, date_to)
+        if error:
+            await update.message.reply_text(f"❌ {error}")
+            return
+        
+        chat_id = str(update.effective_chat.id)
+        if self.split_mode:
+            # Загрузку выполнит обработчик, арендующий кабинет: у него общий с проверками регулятор квот
+            for wb_api in self._apis_for(user_id):
+                self.store.request_backfill(wb_api.seller.name, date_from.isoformat(), date_to.isoformat(), chat_id)
+            await update.message.reply_text(
+                f"⏳ Загрузка истории с {date_from.strftime('%d.%m.%Y')} по {date_to.strftime('%d.%m.%Y')} "
+                "передана обработчикам. Уведомления о загруженных событиях не отправляются, итог придет сообщением."
+            )
+            log(f"📤 Загрузка истории передана обработчикам по запросу пользователя {user_id}")
+            return
+        
+        started = []
+        for wb_api in self._apis_for(user_id):
+            name = wb_api.seller.name
+            if name in self._backfills:
+                await update.message.reply_text(
+                    f"{self.seller_prefix(wb_api.seller)}⏳ Загрузка истории уже выполняется"
+                )
+                continue
+            task = asyncio.create_task(backfill_and_report(self, wb_api, date_from, date_to, chat_id))
+            self._backfills[name] = task
+            task.add_done_callback(lambda _, name=name: self._backfills.pop(name, None))
+            started.append(wb_api)
+        if started:
+            await update.message.reply_text(
+                f"⏳ Загрузка истории с {date_from.strftime('%d.%m.%Y')} по {date_to.strftime('%d.%m.%Y')} "
+                "запущена. Уведомления о загруженных событиях не отправляются, итог придет сообщением."
+            )
+        log(f"📤 Запущена загрузка истории для {len(started)} кабинетов пользователя {user_id}")
+    
+    async def report_callback(self, query, period):
+        """Обработка нажатия на кнопку отчета"""
+        if period not in REPORT_PERIODS:
+            return
+        messages = self._build_report_messages(query.from_user.id, period)
+        # Первый отчет заменяет меню, отчеты остальных кабинетов приходят следом
+        for index, message in enumerate(messages):
+            reply_markup = report_keyboard() if index == len(messages) - 1 else None
+            if index == 0:
+                await query.message.edit_text(message, parse_mode='HTML', reply_markup=reply_markup)
+            else:
+                await query.message.reply_text(message, parse_mode='HTML', reply_markup=reply_markup)
+        log(f"✅ Отчет за {period} отправлен пользователю {query.from_user.id}")
+    
     async def test_command(self, update: Update, context: CallbackContext):
         """Обработчик команды /test для отправки тестовых уведомлений"""
         user_id = update.effective_user.id
@@ -1052,7 +1763,7 @@ class TelegramBot:
                 "warehouseName": "Коледино",
                 "warehouseType": "Dropoff/Доставка"
             }
-            message = format_order_message(test_order)
+            message = format_order_message(Order.from_api(test_order))
             
         elif notification_type == "sale":
             # Тестовый выкуп
@@ -1066,28 +1777,29 @@ class TelegramBot:
                 "finishedPrice": "1800.00",
                 "regionName": "Санкт-Петербург"
             }
-            message = format_sale_message(test_sale)
+            message = format_sale_message(Sale.from_api(test_sale))
             
         elif notification_type == "feedback":
             # Тестовый отзыв
-            feedback_data = {
-                "has_new_feedbacks": True,
-                "has_new_questions": True,
-                "feedbacks_count": 2,
-                "questions_count": 1
+            test_feedback = {
+                "id": "TEST-FEEDBACK",
+                "createdDate": datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                "productValuation": 2,
+                "text": "Размер меньше заявленного, пришлось вернуть.",
+                "cons": "Маломерит",
+                "productDetails": {
+                    "supplierArticle": "TEST-ARTICLE-789",
+                    "productName": "Тестовый товар",
+                    "nmId": 123456789
+                }
             }
-            message = (
-                "❗️ <b>Пришел новый отзыв или вопрос!</b>\n\n"
-                "Проверьте портал продавца.\n\n"
-                "<i>Это тестовое уведомление.</i>"
-            )
+            message = format_feedback_message(Feedback.from_api(test_feedback, 'feedback'))
         else:
             log(f"❌ Неизвестный тип уведомления: {notification_type}")
             return
         
         # Добавляем пометку о тестовом характере уведомления
-        if notification_type != "feedback":  # Для feedback уже добавили
-            message += "\n\n<i>Это тестовое уведомление.</i>"
+        message += "\n\n<i>Это тестовое уведомление.</i>"
         
         # Отправляем уведомление в чат
         for chat_id in self.chat_ids:
@@ -1107,12 +1819,7 @@ class TelegramBot:
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
                 # Отправляем сообщение с кнопками навигации
-                await self.app.bot.send_message(
-                    chat_id=chat_id,
-                    text=message,
-                    parse_mode='HTML',
-                    reply_markup=reply_markup
-                )
+                await self._send_to_chat(chat_id, message, reply_markup=reply_markup)
                 log(f"✅ Тестовое уведомление с кнопками отправлено в чат {chat_id}")
             except Exception as e:
                 log(f"❌ Ошибка при отправке тестового уведомления в чат {chat_id}: {e}")
@@ -1121,22 +1828,126 @@ class TelegramBot:
         log(f"✅ Тестовое уведомление типа {notification_type} успешно отправлено")
         return True
     
-    async def send_notification(self, message):
-        """Отправка уведомления в Telegram"""
-        log("📤 Отправка уведомления")
+    def _get_chat_limiter(self, chat_id):
+        """Ограничитель частоты для чата: группы (отрицательный ID) имеют более строгий лимит"""
+        limiter = self.chat_limiters.get(chat_id)
+        if limiter is None:
+            if str(chat_id).startswith('-'):
+                limiter = TokenBucket(TELEGRAM_GROUP_RATE, capacity=1)
+            else:
+                limiter = TokenBucket(TELEGRAM_CHAT_RATE, capacity=1)
+            self.chat_limiters[chat_id] = limiter
+        return limiter
+    
+    async def _send_to_chat(self, chat_id, message, reply_markup=None):
+        """Отправка сообщения в один чат с соблюдением лимитов Telegram"""
+        await self._get_chat_limiter(chat_id).acquire()
+        await self.global_limiter.acquire()
+        started = time.perf_counter()
         try:
-            for chat_id in self.chat_ids:
-                log(f"📤 Отправка уведомления в чат {chat_id}")
-                await self.app.bot.send_message(
-                    chat_id=chat_id,
-                    text=message,
-                    parse_mode='HTML'
-                )
-                log(f"✅ Уведомление отправлено в чат {chat_id}")
-                await asyncio.sleep(0.1)  # Небольшая задержка между отправками
-        except Exception as e:
-            log(f"❌ Ошибка при отправке уведомления: {e}")
-            log(f"📋 Стек вызовов: {traceback.format_exc()}")
+            await self.app.bot.send_message(
+                chat_id=chat_id,
+                text=message,
+                parse_mode='HTML',
+                reply_markup=reply_markup
+            )
+        except Exception:
+            TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, result='error')
+            raise
+        TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started, result='ok')
+    
+    async def send_notification(self, message, chat_ids=None, event_at=None):
+        """Постановка уведомления в постоянную очередь отправки (по умолчанию для всех чатов).
+        
+        Сообщение сохраняется на диск и доставляется фоновым обработчиком очереди,
+        поэтому медленная отправка в Telegram не задерживает проверки Wildberries.
+        """
+        log("📤 Постановка уведомления в очередь", level=logging.DEBUG)
+        self.store.enqueue_messages(chat_ids or self.chat_ids, message, event_at)
+        self._outbox_event.set()
+    
+    async def run_delivery_worker(self, idle_timeout=OUTBOX_IDLE_TIMEOUT):
+        """Фоновая доставка сообщений из очереди с повторами при ошибках.
+        
+        idle_timeout - как часто заглядывать в очередь без событий: в раздельном режиме
+        сообщения ставят другие процессы, и событие этого процесса о них не узнает.
+        """
+        log(f"📮 Запуск обработчика очереди уведомлений (в очереди: {self.store.outbox_size()})")
+        try:
+            while True:
+                self._outbox_event.clear()
+                batch = self.store.fetch_due_messages(OUTBOX_BATCH_SIZE)
+                if batch:
+                    # Чаты обрабатываются параллельно, сообщения внутри чата - по порядку
+                    by_chat = {}
+                    for message_id, chat_id, text, attempts, event_at in batch:
+                        by_chat.setdefault(chat_id, []).append((message_id, text, attempts, event_at))
+                    await asyncio.gather(*(
+                        self._deliver_chat(chat_id, messages) for chat_id, messages in by_chat.items()
+                    ))
+                    continue
+                
+                # Ждем новых сообщений или наступления времени повтора
+                next_due = self.store.next_message_due()
+                timeout = idle_timeout if next_due is None else min(idle_timeout, max(0.0, next_due - time.time()))
+                try:
+                    await asyncio.wait_for(self._outbox_event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            log(f"🛑 Обработчик очереди уведомлений остановлен (в очереди: {self.store.outbox_size()})")
+            raise
+    
+    async def _deliver_chat(self, chat_id, messages):
+        """Доставка сообщений одного чата. При ошибке оставшиеся сообщения ждут повтора"""
+        for message_id, text, attempts, event_at in messages:
+            try:
+                log("📤 Отправка уведомления в чат %s", chat_id, level=logging.DEBUG)
+                await self._send_to_chat(chat_id, text)
+                self.store.delete_message(message_id)
+                if event_at:
+                    ALERT_LAG_SECONDS.observe(time.time() - event_at)
+                log("✅ Уведомление отправлено в чат %s", chat_id, level=logging.DEBUG, chat_id=chat_id)
+            except RetryAfter as e:
+                # Telegram сообщает, сколько ждать до следующей отправки
+                delay = retry_after_seconds(e)
+                log(f"⏳ Превышен лимит Telegram для чата {chat_id}, повтор через {delay:.0f} сек")
+                self.store.retry_message(message_id, attempts + 1, time.time() + delay)
+                return
+            except (BadRequest, Forbidden) as e:
+                # Повтор не поможет: неверный текст, чат не найден или бот заблокирован
+                log(f"❌ Уведомление в чат {chat_id} отброшено: {e}")
+                self.store.delete_message(message_id)
+            except Exception as e:
+                attempts += 1
+                if attempts >= OUTBOX_MAX_ATTEMPTS:
+                    log(f"❌ Уведомление в чат {chat_id} отброшено после {attempts} попыток: {e}")
+                    self.store.delete_message(message_id)
+                    continue
+                delay = min(OUTBOX_MAX_BACKOFF, 2 ** attempts) * random.uniform(0.5, 1.0)
+                log(f"⚠️ Ошибка при отправке уведомления в чат {chat_id}: {e}. Повтор через {delay:.0f} сек")
+                self.store.retry_message(message_id, attempts, time.time() + delay)
+                return
+    
+    async def _start_webhook(self):
+        """Прием обновлений через webhook: Telegram сам присылает их во встроенный HTTP-сервер.
+        
+        Запросы без правильного секретного токена (заголовок X-Telegram-Bot-Api-Secret-Token)
+        отклоняются сервером.
+        """
+        # Без заданного токена генерируем новый: он передается Telegram при каждом запуске
+        secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+        webhook_url = f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}"
+        log(f"🌐 Режим webhook: {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}, внешний адрес {webhook_url}")
+        await self.app.updater.start_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=webhook_url,
+            secret_token=secret_token,
+            allowed_updates=TELEGRAM_ALLOWED_UPDATES,
+            drop_pending_updates=False
+        )
     
     async def start_bot(self):
         """Запуск бота Telegram"""
@@ -1160,15 +1971,18 @@ class TelegramBot:
             # Улучшенные настройки для получения обновлений
             log("🔄 Настройка параметров для получения обновлений")
             log("📋 Допустимые типы обновлений: message, edited_message, channel_post, edited_channel_post, message_reaction, message_reaction_count, callback_query")
-            log("⚙️ Таймаут чтения: 30 сек, таймаут подключения: 10 сек")
             log("⚙️ Пропуск ожидающих обновлений: Нет")
             
-            await self.app.updater.start_polling(
-                drop_pending_updates=False,
-                allowed_updates=["message", "edited_message", "channel_post", "edited_channel_post", "message_reaction", "message_reaction_count", "callback_query"],
-                read_timeout=30,
-                connect_timeout=10
-            )
+            if WEBHOOK_URL:
+                await self._start_webhook()
+            else:
+                log("⚙️ Таймаут чтения: 30 сек, таймаут подключения: 10 сек")
+                await self.app.updater.start_polling(
+                    drop_pending_updates=False,
+                    allowed_updates=TELEGRAM_ALLOWED_UPDATES,
+                    read_timeout=30,
+                    connect_timeout=10
+                )
             log("✅ Получение обновлений запущено")
             
             # Дополнительное уведомление о готовности бота
@@ -1182,6 +1996,7 @@ class TelegramBot:
                             InlineKeyboardButton("📊 Статус API", callback_data="status"),
                             InlineKeyboardButton("🔍 Проверить сейчас", callback_data="check_now")
                         ],
+                        REPORT_BUTTONS,
                         [
                             InlineKeyboardButton("❓ Помощь", callback_data="help"),
                             InlineKeyboardButton("🧪 Тест", callback_data="test")
@@ -1232,64 +2047,307 @@ class TelegramBot:
         )
         log(f"✅ Меню тестовых уведомлений отправлено пользователю {query.from_user.id}")
 
+def format_amount(value):
+    """Форматирование суммы: без лишних нулей после запятой"""
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+def telegram_length(text):
+    """Длина текста так, как ее считает Telegram (в единицах UTF-16)"""
+    return len(text.encode('utf-16-le')) // 2
+
+def format_seconds(value):
+    """Длительность для сводки метрик"""
+    if value is None:
+        return "нет данных"
+    if value < 1:
+        return f"{value * 1000:.0f} мс"
+    if value < 120:
+        return f"{value:.1f} сек"
+    return f"{value / 60:.0f} мин"
+
+def format_metrics_summary():
+    """Сводка метрик процесса для команды /metrics"""
+    lines = ["📈 <b>Метрики бота</b>\n"]
+    
+    lines.append("🌐 <b>API Wildberries</b> (p50 / p99):")
+    endpoints = WB_REQUEST_SECONDS.label_values('endpoint')
+    for endpoint in endpoints:
+        lines.append(
+            f"• {html.escape(endpoint)}: {WB_REQUEST_SECONDS.count(endpoint=endpoint)} запр., "
+            f"{format_seconds(WB_REQUEST_SECONDS.quantile(0.5, endpoint=endpoint))} / "
+            f"{format_seconds(WB_REQUEST_SECONDS.quantile(0.99, endpoint=endpoint))}"
+        )
+    if not endpoints:
+        lines.append("• запросов еще не было")
+    
+    for stream, title in (('orders', 'Заказы'), ('sales', 'Выкупы')):
+        hits = WB_DEDUP.value(stream=stream, result='hit')
+        total = hits + WB_DEDUP.value(stream=stream, result='miss')
+        rows = WB_PAGE_ROWS.mean(stream=stream)
+        pages = WB_POLL_PAGES.mean(stream=stream)
+        lines.append(
+            f"📦 {title}: строк на странице {rows or 0:.0f}, страниц за проверку {pages or 0:.1f}, "
+            f"повторы {hits / total if total else 0:.0%}"
+        )
+    
+    lines.append(
+        f"\n📤 <b>Telegram</b>: отправлено {TELEGRAM_SEND_SECONDS.count(result='ok')}, "
+        f"ошибок {TELEGRAM_SEND_SECONDS.count(result='error')}, "
+        f"send_message p50 {format_seconds(TELEGRAM_SEND_SECONDS.quantile(0.5))}, "
+        f"p99 {format_seconds(TELEGRAM_SEND_SECONDS.quantile(0.99))}"
+    )
+    lines.append(f"📮 В очереди отправки: {OUTBOX_DEPTH.value()}")
+    lines.append(
+        f"⏱ Задержка от события до доставки: p50 {format_seconds(ALERT_LAG_SECONDS.quantile(0.5))}, "
+        f"p99 {format_seconds(ALERT_LAG_SECONDS.quantile(0.99))}"
+    )
+    return "\n".join(lines)
+
+def report_period(period, now=None):
+    """Начало и конец периода отчета: сегодня, текущая неделя или текущий месяц (по Москве)"""
+    now = now or get_moscow_time()
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'week':
+        start -= timedelta(days=start.weekday())
+    elif period == 'month':
+        start = start.replace(day=1)
+    return start, now
+
+def report_keyboard():
+    """Кнопки под отчетом: другие периоды и главное меню"""
+    return InlineKeyboardMarkup([
+        REPORT_BUTTONS,
+        [InlineKeyboardButton("🏠 На главную", callback_data="start")]
+    ])
+
+def format_report(period, date_from, date_to, orders, sales, returns=()):
+    """Отчет: итоги заказов, выкупов и возвратов и разбивка по артикулам и складам (строки из HistoryStore.rollup)"""
+    # (артикул, склад) -> [заказов, сумма заказов, выкупов, сумма выкупов, к выплате, комиссия, возвратов, сумма возвратов]
+    groups = {}
+    for row in orders:
+        group = groups.setdefault((row['supplier_article'], row['warehouse_name']), [0, 0.0, 0, 0.0, 0.0, 0.0, 0, 0.0])
+        group[0] += row['count']
+        group[1] += row['finished_price']
+    for row in sales:
+        group = groups.setdefault((row['supplier_article'], row['warehouse_name']), [0, 0.0, 0, 0.0, 0.0, 0.0, 0, 0.0])
+        group[2] += row['count']
+        group[3] += row['finished_price']
+        group[4] += row['for_pay']
+        group[5] += row['fee_wb']
+    for row in returns:
+        group = groups.setdefault((row['supplier_article'], row['warehouse_name']), [0, 0.0, 0, 0.0, 0.0, 0.0, 0, 0.0])
+        group[6] += row['count']
+        group[7] += row['finished_price']
+    totals = [sum(group[i] for group in groups.values()) for i in range(8)]
+    
+    text = (
+        f"📈 <b>Отчет за {REPORT_PERIODS[period]}</b>\n"
+        f"🗓 {date_from.strftime('%d.%m.%Y %H:%M')} – {date_to.strftime('%d.%m.%Y %H:%M')}\n\n"
+        f"🛍 Заказы: {totals[0]} шт. на {format_amount(totals[1])} ₽\n"
+        f"💰 Выкупы: {totals[2]} шт. на {format_amount(totals[3])} ₽\n"
+        f"↩️ Возвраты: {totals[6]} шт. на {format_amount(totals[7])} ₽\n"
+        f"💸 К выплате: {format_amount(totals[4])} ₽ · 🧮 Комиссия: {format_amount(totals[5])} ₽\n"
+    )
+    if not groups:
+        return text + "\n📭 За период данных нет"
+    
+    text += "\n<b>По артикулам и складам:</b>\n"
+    ordered = sorted(groups.items(), key=lambda item: (item[1][0] + item[1][2], item[1][1]), reverse=True)
+    for index, ((article, warehouse), group) in enumerate(ordered):
+        line = (
+            f"📝 {html.escape(str(article or 'Не указан'))} · 🏪 {html.escape(str(warehouse or 'Не указан'))}: "
+            f"🛍 {group[0]} / {format_amount(group[1])} ₽"
+        )
+        if group[2]:
+            line += (
+                f" · 💰 {group[2]} / {format_amount(group[3])} ₽ "
+                f"(к выплате {format_amount(group[4])} ₽, комиссия {format_amount(group[5])} ₽)"
+            )
+        if group[6]:
+            line += f" · ↩️ {group[6]} / {format_amount(group[7])} ₽"
+        rest = f"… и еще {len(ordered) - index} позиций"
+        # Оставляем место для префикса кабинета и строки об оставшихся позициях
+        if telegram_length(text + line + "\n" + rest) > TELEGRAM_MESSAGE_LIMIT - 200:
+            return text + rest
+        text += line + "\n"
+    return text
+
+def format_history(article, days, orders, sales, returns, recent):
+    """История артикула: итоги заказов, выкупов и возвратов (HistoryStore.summary) и последние заказы (find)"""
+    lines = [
+        f"🗂 <b>История артикула {html.escape(article)} за {days} дн.</b>",
+        "",
+        f"🛍 Заказы: {orders['count']} шт. на {format_amount(orders['finished_price'])} ₽",
+        f"💰 Выкупы: {sales['count']} шт. на {format_amount(sales['finished_price'])} ₽",
+        f"↩️ Возвраты: {returns['count']} шт. на {format_amount(returns['finished_price'])} ₽"
+    ]
+    if recent:
+        lines.extend(["", "<b>Последние заказы:</b>"])
+        for row in recent:
+            ordered_at = datetime.fromtimestamp(row['date'], MOSCOW_TZ) if row['date'] is not None else None
+            cancel = " · ❌ отменен" if row['is_cancel'] else ""
+            lines.append(
+                f"📅 {format_date(ordered_at)} · {format_amount(row['finished_price'])} ₽ · "
+                f"🏪 {html.escape(str(row['warehouse_name'] or 'Не указан'))} · "
+                f"📍 {html.escape(str(row['region_name'] or 'Не указан'))}{cancel}"
+            )
+    return "\n".join(lines)
+
+def backfill_range_error(date_from, date_to):
+    """Текст ошибки для неверного диапазона загрузки истории (или None)"""
+    if date_from > date_to:
+        return "Дата начала позже даты окончания"
+    if date_to > get_moscow_time().date():
+        return "Дата окончания в будущем"
+    return None
+
+def format_backfill_result(date_from, date_to, results):
+    """Итог загрузки истории по потокам"""
+    names = {'orders': "🛍 Заказы", 'sales': "💰 Выкупы"}
+    lines = [
+        f"📥 <b>Загрузка истории с {date_from.strftime('%d.%m.%Y')} по {date_to.strftime('%d.%m.%Y')} завершена</b>",
+        ""
+    ]
+    failed = 0
+    for stream, result in results.items():
+        lines.append(f"{names.get(stream, stream)}: {result['rows']} записей за {result['days']} дн.")
+        failed += result['failed']
+    if failed:
+        lines.append("")
+        lines.append(f"⚠️ Не загружено дней: {failed}. Повторите команду, загрузка продолжится с места остановки")
+    return "\n".join(lines)
+
+def event_time(event):
+    """Время события в unix time (или None, если дата неизвестна)"""
+    return event.date.timestamp() if event.date else None
+
+def format_date(value):
+    """Форматирование даты события для уведомления"""
+    return value.astimezone(MOSCOW_TZ).strftime('%d.%m.%Y %H:%M') if value else "Не указана"
+
 def format_order_message(order):
     """Форматирование сообщения о новом заказе (товар заказан, но еще не получен)"""
-    # Парсим дату
-    try:
-        # Используем вспомогательную функцию для парсинга даты
-        order_date = parse_date_string(order['date'])
-    except Exception as e:
-        log(f"❌ Ошибка при парсинге даты заказа: {e}")
-        order_date = datetime.now()
-    
     return (
         f"🛍 <b>Новый заказ!</b>\n\n"
-        f"📝 Артикул: {order.get('supplierArticle')}\n"
-        f"💳 Заплатил покупатель: {order.get('finishedPrice')} ₽\n"
-        f"💵 Цена продажи: {order.get('priceWithDisc')} ₽\n"
-        f"📍 Регион: {order.get('regionName')} обл., {order.get('oblastOkrugName')}\n"
-        f"🏪 Склад: {order.get('warehouseName')} ({order.get('warehouseType')})\n"
-        f"📅 Дата: {order_date.strftime('%d.%m.%Y %H:%M')}"
+        f"📝 Артикул: {order.supplier_article}\n"
+        f"💳 Заплатил покупатель: {format_amount(order.finished_price)} ₽\n"
+        f"💵 Цена продажи: {format_amount(order.price_with_disc)} ₽\n"
+        f"📍 Регион: {order.region_name} обл., {order.oblast_okrug_name}\n"
+        f"🏪 Склад: {order.warehouse_name} ({order.warehouse_type})\n"
+        f"📅 Дата: {format_date(order.date)}"
     )
 
-def format_sale_message(sale):
-    """Форматирование сообщения о выкупе (товар получен и принят покупателем)"""
-    # Парсим дату
-    try:
-        # Выбираем поле date или lastChangeDate, если date отсутствует
-        date_string = sale.get('date', sale.get('lastChangeDate'))
-        sale_date = parse_date_string(date_string)
-    except Exception as e:
-        log(f"❌ Ошибка при парсинге даты продажи: {e}")
-        sale_date = datetime.now()
+def format_duration(seconds):
+    """Длительность в днях, часах и минутах: "2 дн. 5 ч", "3 ч 20 мин", "15 мин"""
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 1440)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days} дн. {hours} ч" if hours else f"{days} дн."
+    if hours:
+        return f"{hours} ч {minutes} мин" if minutes else f"{hours} ч"
+    return f"{minutes} мин"
+
+def format_percent(value):
+    return "нет данных" if value is None else f"{value * 100:.0f}%"
+
+def format_sale_message(sale, since_order=None, stats=None):
+    """Форматирование сообщения о выкупе (товар получен и принят покупателем).
     
-    return (
+    since_order - секунд от заказа до выкупа, stats - статистика артикула из индекса заказов.
+    """
+    message = (
         f"💰 <b>Новый выкуп!</b>\n\n"
-        f"📝 Артикул: {sale.get('supplierArticle')}\n"
-        f"💵 Цена продажи: {sale.get('finishedPrice', 0)} ₽\n"
-        f"🧮 Комиссия: {sale.get('feeWB', 0)} ₽\n"
-        f"💸 К выплате: {sale.get('forPay', 0)} ₽\n"
-        f"📍 Регион: {sale.get('regionName', 'Не указан')}\n"
-        f"📅 Дата: {sale_date.strftime('%d.%m.%Y %H:%M')}"
+        f"📝 Артикул: {sale.supplier_article}\n"
+        f"💵 Цена продажи: {format_amount(sale.finished_price)} ₽\n"
+        f"🧮 Комиссия: {format_amount(sale.fee_wb)} ₽\n"
+        f"💸 К выплате: {format_amount(sale.for_pay)} ₽\n"
+        f"📍 Регион: {sale.region_name}\n"
+        f"📅 Дата: {format_date(sale.date)}"
     )
+    if since_order is not None:
+        message += f"\n⏱ Через {format_duration(since_order)} после заказа"
+    if stats and stats['orders']:
+        message += (
+            f"\n📊 По артикулу: выкуп {format_percent(stats['buyout_rate'])}, "
+            f"отмены {format_percent(stats['cancel_rate'])} из {stats['orders']} заказов"
+        )
+    return message
 
-def parse_date_string(date_str):
-    """Парсинг даты из API с поддержкой разных форматов"""
-    formats = [
-        '%Y-%m-%dT%H:%M:%S.%fZ',  # С миллисекундами
-        '%Y-%m-%dT%H:%M:%S',      # Без миллисекунд
-        '%Y-%m-%dT%H:%M:%SZ'      # С Z, но без миллисекунд
-    ]
+def format_sale_alert(sale, order_index):
+    """Уведомление о выкупе с временем от заказа и статистикой артикула"""
+    return format_sale_message(
+        sale,
+        since_order=order_index.since_order(sale.srid, event_time(sale)),
+        stats=order_index.article_stats(sale.supplier_article or '')
+    )
+
+def format_feedback_message(item):
+    """Форматирование уведомления о новом отзыве (с оценкой) или вопросе покупателя"""
+    if item.kind == 'feedback':
+        rating = max(0, min(5, item.rating or 0))
+        lines = [f"⭐️ <b>Новый отзыв: {'★' * rating}{'☆' * (5 - rating)} ({rating})</b>", ""]
+    else:
+        lines = ["❓ <b>Новый вопрос</b>", ""]
+    lines.append(f"📝 Артикул: {html.escape(str(item.supplier_article or 'Не указан'))}")
+    if item.product_name:
+        lines.append(f"🏷 Товар: {html.escape(item.product_name)}")
+    # Тексты покупателей экранируем и укорачиваем, чтобы уложиться в лимит сообщения
+    for label, value in (("💬", item.text), ("👍 Достоинства:", item.pros), ("👎 Недостатки:", item.cons)):
+        if value:
+            if len(value) > FEEDBACK_TEXT_LIMIT:
+                value = value[:FEEDBACK_TEXT_LIMIT].rstrip() + "…"
+            lines.append(f"{label} {html.escape(value)}")
+    lines.append(f"📅 Дата: {format_date(item.date)}")
+    return "\n".join(lines)
+
+class EventDigest:
+    """Сводка по множеству событий, сгруппированная по артикулу и складу"""
     
-    for fmt in formats:
-        try:
-            return datetime.strptime(date_str, fmt)
-        except ValueError:
-            continue
-            
-    # Если ни один формат не подошел, логируем ошибку и возвращаем текущее время
-    log(f"⚠️ Неподдерживаемый формат даты: {date_str}. Используем текущее время.")
-    return datetime.now()
+    def __init__(self, title, amount_label, amount_of):
+        self.title = title  # Заголовок сводки, например "🛍 Новые заказы"
+        self.amount_label = amount_label  # Подпись суммы, например "💳 Сумма"
+        self.amount_of = amount_of  # Функция: сумма, которую учитываем для события
+        self.count = 0
+        self.total = 0.0
+        self.groups = {}  # (артикул, склад) -> [количество, сумма]
+        self.first_event_at = None  # Время самого раннего события (unix time)
+    
+    def add(self, event):
+        """Учет события в сводке (память не растет с числом событий одной группы)"""
+        amount = self.amount_of(event)
+        event_at = event_time(event)
+        if event_at is not None and (self.first_event_at is None or event_at < self.first_event_at):
+            self.first_event_at = event_at
+        self.count += 1
+        self.total += amount
+        group = self.groups.setdefault((event.supplier_article, event.warehouse_name), [0, 0.0])
+        group[0] += 1
+        group[1] += amount
+    
+    def format_messages(self):
+        """Сообщения сводки, каждое не длиннее лимита Telegram"""
+        header = (
+            f"{self.title}: {self.count}</b>\n"
+            f"{self.amount_label}: {format_amount(self.total)} ₽\n\n"
+        )
+        continuation = f"{self.title} (продолжение)</b>\n\n"
+        
+        messages = []
+        current = header
+        for (article, warehouse), (count, amount) in sorted(
+            self.groups.items(), key=lambda item: item[1][0], reverse=True
+        ):
+            line = (
+                f"📝 {html.escape(str(article))} · 🏪 {html.escape(str(warehouse or 'Не указан'))}: "
+                f"{count} шт., {format_amount(amount)} ₽\n"
+            )
+            if telegram_length(current + line) > TELEGRAM_MESSAGE_LIMIT:
+                messages.append(current)
+                current = continuation
+            current += line
+        messages.append(current)
+        return messages
 
 def signal_handler(signum, frame):
     """Обработчик сигналов для корректного завершения работы"""
@@ -1299,7 +2357,17 @@ def signal_handler(signum, frame):
 
 def main():
     """Основная функция приложения"""
+    if sys.argv[1:2] == ['backfill']:
+        backfill_main(sys.argv[2:])
+        return
+    setup_logging(
+        'wb_bot', LOG_LEVEL, LOG_FILE,
+        max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, rotate_when=LOG_ROTATE_WHEN
+    )
     log("🚀 Запуск основной функции")
+    if BOT_MODE not in ('all', 'frontend', 'worker'):
+        log(f"❌ Неизвестный режим работы BOT_MODE={BOT_MODE}: ожидается all, frontend или worker")
+        sys.exit(1)
     try:
         # Регистрируем обработчик сигналов
         log("🔄 Регистрация обработчиков сигналов")
@@ -1308,7 +2376,7 @@ def main():
         log("✅ Обработчики сигналов зарегистрированы")
         
         log("📢 Запуск мониторинга заказов и отзывов Wildberries...")
-        log(f"⏰ Интервал проверки данных: каждые {CHECK_INTERVAL // 60} минут")
+        log(f"⏰ Интервал проверки данных: {format_check_intervals()}")
         
         # Инициализируем асинхронный бот и запускаем его
         try:
@@ -1319,7 +2387,10 @@ def main():
             log("✅ Event loop создан и настроен")
             
             # Запускаем асинхронную основную функцию
-            loop.run_until_complete(run_bot())
+            if BOT_MODE == 'worker':
+                loop.run_until_complete(run_worker())
+            else:
+                loop.run_until_complete(run_bot(split_mode=BOT_MODE == 'frontend'))
             
         except Exception as e:
             log(f"❌ Ошибка при запуске бота: {e}")
@@ -1336,18 +2407,178 @@ def main():
         log(f"📋 Стек вызовов: {traceback.format_exc()}")
         sys.exit(1)
 
-async def run_bot():
-    """Единая точка входа для асинхронной работы бота"""
+async def start_metrics_server(store):
+    """Запуск HTTP-сервера метрик (None, если он отключен или порт занят)"""
+    OUTBOX_DEPTH.function = store.outbox_size
+    if not METRICS_PORT:
+        return None
+    try:
+        server = await serve_metrics(metrics, METRICS_HOST, METRICS_PORT)
+    except OSError as e:
+        # Например, порт уже занят другим процессом раздельного режима
+        log(f"⚠️ Не удалось запустить сервер метрик на {METRICS_HOST}:{METRICS_PORT}: {e}")
+        return None
+    log(f"📈 Метрики доступны по адресу http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return server
+
+def open_history():
+    """История заказов и выкупов (или None, если HISTORY_DB_PATH не задан)"""
+    if not HISTORY_DB_PATH:
+        log("📚 История заказов и выкупов отключена")
+        return None
+    log(f"📚 История заказов и выкупов: {HISTORY_DB_PATH}")
+    return HistoryStore(HISTORY_DB_PATH)
+
+async def backfill_and_report(notifier, wb_api, date_from, date_to, chat_id):
+    """Загрузка истории кабинета в фоне с итоговым сообщением в чат (notifier - TelegramBot или OutboxNotifier)"""
+    prefix = notifier.seller_prefix(wb_api.seller)
+    try:
+        results = await wb_api.backfill(date_from, date_to)
+        message = prefix + format_backfill_result(date_from, date_to, results)
+    except Exception as e:
+        log(f"❌ Ошибка загрузки истории: {e}")
+        log(f"📋 Стек вызовов: {traceback.format_exc()}")
+        message = f"{prefix}❌ Загрузка истории прервана: {html.escape(str(e))}"
+    await notifier.send_notification(message, [chat_id])
+
+def service_running(store):
+    """Работает ли на той же базе состояния процесс, опрашивающий API.
+    
+    Бот в режиме all и обработчики раздельного режима отмечаются в базе каждые WORKER_TICK
+    секунд и снимают отметку при остановке. После аварийной остановки отметка считается
+    живой еще LEASE_TTL секунд.
+    """
+    return store.live_workers(LEASE_TTL) > 0
+
+async def run_backfill(date_from, date_to, seller_name=None, streams=('orders', 'sales'), force=False):
+    """Загрузка истории всех (или одного) кабинетов без Telegram и уведомлений.
+    
+    Рассчитано на остановленного бота: у этого процесса свой регулятор квот, и вместе
+    с живыми проверками он быстро исчерпал бы общую квоту токена. Пока бот работает,
+    историю загружает команда /backfill. Без force загрузка при работающем боте не начинается.
+    """
+    store = StateStore(
+        STATE_DB_PATH, retention_days=DEDUP_RETENTION_DAYS, link_retention_days=ORDER_INDEX_RETENTION_DAYS
+    )
+    sellers = load_sellers(SELLERS_FILE, WB_API_TOKEN, WB_FEEDBACK_TOKEN, TELEGRAM_CHAT_ID)
+    if seller_name is not None:
+        sellers = [seller for seller in sellers if seller.name == seller_name]
+        if not sellers:
+            log(f"❌ Кабинет «{seller_name}» не найден")
+            store.close()
+            return False
+    if service_running(store):
+        if not force:
+            log(f"❌ Бот или обработчики запущены на этой базе состояния: остановите их или используйте команду "
+                f"/backfill. После аварийной остановки отметка держится до {LEASE_TTL} сек, запуск без проверки - "
+                "с флагом --force")
+            store.close()
+            return False
+        log("⚠️ Бот запущен: загрузка истории делит с ним квоту API без согласования")
+    history = open_history()
+    governor = RequestGovernor(max_backoff=WB_MAX_BACKOFF)
+    wb_apis = [
+        WildberriesAPI(
+            seller.stats_token, seller.feedback_token, store,
+            seller=seller, governor=governor, history=history
+        )
+        for seller in sellers
+    ]
+    try:
+        log(f"📥 Загрузка истории с {date_from.isoformat()} по {date_to.isoformat()}: {', '.join(streams)}")
+        results = await asyncio.gather(*(
+            wb_api.backfill(date_from, date_to, streams) for wb_api in wb_apis
+        ))
+    finally:
+        for wb_api in wb_apis:
+            await wb_api.close()
+        store.close()
+        if history is not None:
+            history.close()
+    
+    complete = True
+    for wb_api, result in zip(wb_apis, results):
+        for stream, totals in result.items():
+            label = f"«{wb_api.seller.name}» " if wb_api.seller.name else ""
+            log(f"✅ {label}{stream}: {totals['rows']} записей, "
+                f"дней загружено {totals['days']}, с ошибкой {totals['failed']}")
+            complete = complete and not totals['failed']
+    if not complete:
+        log("⚠️ Загружены не все дни: повторный запуск продолжит с контрольной точки")
+    return complete
+
+def backfill_main(argv):
+    """Точка входа: python main.py backfill --from ДАТА --to ДАТА [--seller ИМЯ] [--stream orders|sales] [--force]
+    
+    Для запуска при остановленном боте; при работающем боте - команда /backfill.
+    """
+    parser = argparse.ArgumentParser(
+        prog='main.py backfill',
+        description="Загрузка заказов и выкупов за прошедшие дни в историю без уведомлений"
+    )
+    parser.add_argument('--from', dest='date_from', required=True, type=date.fromisoformat,
+                        help="первый день (ГГГГ-ММ-ДД)")
+    parser.add_argument('--to', dest='date_to', required=True, type=date.fromisoformat,
+                        help="последний день включительно (ГГГГ-ММ-ДД)")
+    parser.add_argument('--seller', help="имя кабинета из SELLERS_FILE (по умолчанию все)")
+    parser.add_argument('--stream', dest='streams', action='append', choices=('orders', 'sales'),
+                        help="поток (можно повторить, по умолчанию orders и sales)")
+    parser.add_argument('--force', action='store_true',
+                        help="загружать, даже если бот отмечен в базе как работающий: квота API делится без "
+                             f"согласования; после аварийной остановки отметка держится до {LEASE_TTL} сек")
+    args = parser.parse_args(argv)
+    error = backfill_range_error(args.date_from, args.date_to)
+    if error:
+        parser.error(error)
+    
+    setup_logging(
+        'wb_bot', LOG_LEVEL, LOG_FILE,
+        max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, rotate_when=LOG_ROTATE_WHEN
+    )
+    complete = asyncio.run(run_backfill(
+        args.date_from, args.date_to, args.seller, tuple(args.streams or ('orders', 'sales')), args.force
+    ))
+    sys.exit(0 if complete else 1)
+
+async def run_bot(split_mode=False):
+    """Единая точка входа для асинхронной работы бота.
+    
+    В раздельном режиме (split_mode) процесс только обслуживает Telegram и доставляет
+    уведомления из общей очереди, а данные Wildberries получают обработчики (run_worker).
+    """
     log("🚀 Запуск асинхронной работы бота")
+    store = None
+    history = None
+    wb_apis = []
+    delivery_task = None
+    heartbeat_task = None
+    metrics_server = None
+    bot_id = f"bot:{socket.gethostname()}:{os.getpid()}"
     
     try:
         # Инициализация API и бота
-        log("🔄 Инициализация WildberriesAPI")
-        wb_api = WildberriesAPI(WB_API_TOKEN, WB_FEEDBACK_TOKEN)
+        log(f"🔄 Открытие хранилища состояния: {STATE_DB_PATH}")
+        store = StateStore(
+            STATE_DB_PATH, retention_days=DEDUP_RETENTION_DAYS, link_retention_days=ORDER_INDEX_RETENTION_DAYS
+        )
+        history = open_history()
+        metrics_server = await start_metrics_server(store)
+        
+        sellers = load_sellers(SELLERS_FILE, WB_API_TOKEN, WB_FEEDBACK_TOKEN, TELEGRAM_CHAT_ID)
+        log(f"🏪 Кабинетов продавцов: {len(sellers)}")
+        
+        # Общий регулятор квот: бюджеты запросов раздельные, так как ключи квот включают токен
+        governor = RequestGovernor(max_backoff=WB_MAX_BACKOFF)
+        for seller in sellers:
+            log(f"🔄 Инициализация WildberriesAPI {seller.name}".rstrip())
+            wb_apis.append(WildberriesAPI(
+                seller.stats_token, seller.feedback_token, store,
+                seller=seller, governor=governor, history=history
+            ))
         log("✅ WildberriesAPI инициализирован")
         
         log("🔄 Инициализация TelegramBot")
-        telegram_bot = TelegramBot(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, wb_api)
+        telegram_bot = TelegramBot(TELEGRAM_BOT_TOKEN, wb_apis, store, split_mode=split_mode)
         log("✅ TelegramBot инициализирован")
         
         # Отправляем уведомление о запуске
@@ -1356,7 +2587,7 @@ async def run_bot():
             await telegram_bot.send_notification(
                 "🟢 <b>Мониторинг запущен</b>\n\n"
                 f"⏱ Время запуска: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
-                f"🔄 Интервал проверки данных: {CHECK_INTERVAL // 60} минут\n"
+                f"🔄 Интервал проверки данных: {format_check_intervals()}\n"
                 "ℹ️ Данные будут проверяться автоматически и вы получите уведомление только о новых событиях.\n"
                 "📱 Используйте команду /status для проверки работы бота и API.\n"
                 "🧪 Используйте команду /test для отправки тестовых уведомлений."
@@ -1368,16 +2599,28 @@ async def run_bot():
         
         # Проверяем токен бота
         log(f"🔑 Проверка токена бота: {TELEGRAM_BOT_TOKEN[:10]}...")
-        log(f"👥 Чат ID для уведомлений: {TELEGRAM_CHAT_ID}")
+        log(f"👥 Чат ID для уведомлений: {', '.join(telegram_bot.chat_ids)}")
         
         # Запускаем бота
         log("🔄 Запуск бота")
         await telegram_bot.start_bot()
         log("✅ Бот успешно стартовал и ожидает команд")
         
+        log("🔄 Запуск обработчика очереди уведомлений")
+        if split_mode:
+            # Уведомления ставят обработчики в других процессах: чаще заглядываем в очередь
+            delivery_task = asyncio.create_task(telegram_bot.run_delivery_worker(SPLIT_OUTBOX_POLL_INTERVAL))
+            log("🔀 Раздельный режим: проверки Wildberries выполняют обработчики")
+            await delivery_task
+            return
+        delivery_task = asyncio.create_task(telegram_bot.run_delivery_worker())
+        # Бот сам опрашивает API: отмечается в базе, как обработчик, чтобы загрузка истории
+        # из командной строки не делила с ним квоту
+        heartbeat_task = asyncio.create_task(keep_heartbeat(store, bot_id))
+        
         log("🔄 Запуск задачи периодических проверок")
         # Запускаем основной цикл проверок
-        await run_periodic_checks(telegram_bot, wb_api)
+        await run_periodic_checks(telegram_bot, wb_apis)
     
     except asyncio.CancelledError:
         log("🛑 Задача была отменена")
@@ -1385,94 +2628,333 @@ async def run_bot():
         log(f"❌ Ошибка в run_bot: {e}")
         log(f"📋 Стек вызовов: {traceback.format_exc()}")
         raise
+    finally:
+        if delivery_task is not None:
+            delivery_task.cancel()
+            await asyncio.gather(delivery_task, return_exceptions=True)
+        if heartbeat_task is not None:
+            heartbeat_task.cancel()
+            await asyncio.gather(heartbeat_task, return_exceptions=True)
+        if metrics_server is not None:
+            metrics_server.close()
+        for wb_api in wb_apis:
+            await wb_api.close()
+        if heartbeat_task is not None:
+            store.remove_worker(bot_id)
+        if store is not None:
+            store.close()
+        if history is not None:
+            history.close()
+
+async def run_stream_checks(name, check, interval, last_poll, slots, initial_delay=0, wake=None):
+    """Периодический запуск проверки одного потока данных с адаптивным интервалом.
+    
+    check() возвращает количество новых событий, last_poll() - итоги последней проверки
+    (число запросов к API и было ли ограничение частоты). slots - общий для всех кабинетов
+    семафор: ограничивает число одновременных проверок и выдает места в порядке очереди.
+    Установка события wake запускает проверку, не дожидаясь окончания интервала.
+    """
+    log(f"🔄 Запуск проверок потока «{name}», начальный интервал {interval.interval:.0f} сек")
+    await asyncio.sleep(initial_delay)
+    while True:
+        started = time.monotonic()
+        events = 0
+        try:
+            async with slots:
+                events = await check() or 0
+        except Exception as e:
+            log(f"❌ Ошибка при проверке потока «{name}»: {e}")
+            log(f"📋 Стек вызовов: {traceback.format_exc()}")
+        
+        poll = last_poll()
+        next_interval = interval.update(events, poll['requests'], poll['rate_limited'])
+        elapsed = time.monotonic() - started
+        delay = max(0.0, next_interval - elapsed)
+        log(f"✅ Проверка потока «{name}» заняла {elapsed:.1f} сек, событий: {events}, следующая через {delay:.0f} сек")
+        if wake is None:
+            await asyncio.sleep(delay)
+            continue
+        try:
+            await asyncio.wait_for(wake.wait(), delay)
+            log(f"⏰ Внеплановая проверка потока «{name}»")
+        except asyncio.TimeoutError:
+            pass
+        wake.clear()
 
-async def run_periodic_checks(telegram_bot, wb_api):
-    """Запуск периодических проверок в асинхронном режиме"""
-    log("🔄 Запуск периодических проверок")
+def start_seller_checks(notifier, wb_api, slots, share=0.0, wakes=None):
+    """Задачи периодических проверок заказов, отзывов и выкупов одного кабинета.
+    
+    notifier - TelegramBot или OutboxNotifier, share - доля интервала, на которую сдвигается
+    первая проверка, wakes - события внеплановой проверки по потокам (или None).
+    """
+    wakes = wakes or {}
+    # У каждого кабинета свои интервалы: квоты API считаются по токенам
+    # Заказы и выкупы используют API статистики: поминутная квота токена общая на категорию
+    orders_interval = AdaptiveInterval(
+        CHECK_INTERVAL, ORDERS_MIN_INTERVAL, ORDERS_MAX_INTERVAL, WB_STATS_REQUESTS_PER_MINUTE
+    )
+    sales_interval = AdaptiveInterval(
+        SALES_CHECK_INTERVAL, SALES_MIN_INTERVAL, SALES_MAX_INTERVAL, WB_STATS_REQUESTS_PER_MINUTE
+    )
+    feedbacks_interval = AdaptiveInterval(
+        FEEDBACK_CHECK_INTERVAL, FEEDBACK_MIN_INTERVAL, FEEDBACK_MAX_INTERVAL
+    )
+    suffix = f" ({wb_api.seller.name})" if wb_api.seller.name else ""
+    
+    return [
+        asyncio.create_task(run_stream_checks(
+            f"заказы{suffix}", lambda: check_orders_async(notifier, wb_api),
+            orders_interval, lambda: wb_api.last_poll['orders'],
+            slots, orders_interval.interval * share, wakes.get('orders')
+        )),
+        asyncio.create_task(run_stream_checks(
+            f"отзывы{suffix}", lambda: check_feedbacks_async(notifier, wb_api),
+            feedbacks_interval, lambda: wb_api.last_poll['feedbacks'],
+            slots, feedbacks_interval.interval * share, wakes.get('feedbacks')
+        )),
+        asyncio.create_task(run_stream_checks(
+            f"выкупы{suffix}", lambda: check_sales_async(notifier, wb_api),
+            sales_interval, lambda: wb_api.last_poll['sales'],
+            slots, sales_interval.interval * share, wakes.get('sales')
+        ))
+    ]
+
+async def run_periodic_checks(telegram_bot, wb_apis):
+    """Запуск периодических проверок: заказы, выкупы и отзывы каждого кабинета проверяются независимо.
+    
+    Старты кабинетов равномерно разнесены по интервалу проверки, а число одновременных
+    проверок ограничено MAX_CONCURRENT_POLLS, чтобы кабинеты не мешали друг другу.
+    """
+    log(f"🔄 Запуск периодических проверок (кабинетов: {len(wb_apis)})")
+    slots = asyncio.Semaphore(MAX_CONCURRENT_POLLS)
+    
+    tasks = []
+    for index, wb_api in enumerate(wb_apis):
+        tasks += start_seller_checks(telegram_bot, wb_api, slots, index / len(wb_apis))
     
     try:
-        while True:
-            log(f"🔍 Запуск проверок ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})")
-            
-            # Проверяем новые заказы
-            try:
-                log("🔍 Проверка новых заказов")
-                await check_orders_async(telegram_bot, wb_api)
-            except Exception as e:
-                log(f"❌ Ошибка при проверке заказов: {e}")
-                log(f"📋 Стек вызовов: {traceback.format_exc()}")
-            
-            # Проверяем отзывы
-            try:
-                log("👀 Проверка отзывов")
-                await check_feedbacks_async(telegram_bot, wb_api)
-            except Exception as e:
-                log(f"❌ Ошибка при проверке отзывов: {e}")
-                log(f"📋 Стек вызовов: {traceback.format_exc()}")
-            
-            # Проверяем продажи
-            try:
-                log("💰 Проверка продаж")
-                await check_sales_async(telegram_bot, wb_api)
-            except Exception as e:
-                log(f"❌ Ошибка при проверке продаж: {e}")
-                log(f"📋 Стек вызовов: {traceback.format_exc()}")
-            
-            log(f"✅ Проверки завершены, следующий запуск через {CHECK_INTERVAL} секунд")
-            # Ждем до следующего интервала проверки
-            await asyncio.sleep(CHECK_INTERVAL)
-            
+        await asyncio.gather(*tasks)
     except asyncio.CancelledError:
         log("🛑 Периодические проверки остановлены")
     except Exception as e:
         log(f"❌ Ошибка в run_periodic_checks: {e}")
         log(f"📋 Стек вызовов: {traceback.format_exc()}")
         raise
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def keep_heartbeat(store, worker_id):
+    """Отметка процесса в базе состояния каждые WORKER_TICK секунд"""
+    while True:
+        try:
+            store.heartbeat(worker_id)
+        except sqlite3.Error as e:
+            log(f"⚠️ Ошибка базы состояния при отметке {worker_id}: {e}")
+        await asyncio.sleep(WORKER_TICK)
+
+async def run_worker():
+    """Обработчик раздельного режима: опрашивает API Wildberries без Telegram.
+    
+    Кабинеты распределяются между запущенными обработчиками через аренду в общей базе
+    состояния: каждый берет не больше своей доли и продлевает аренду, а кабинеты упавшего
+    обработчика подхватываются после истечения ее срока. Курсоры и отметки об обработке
+    хранятся в общей базе, поэтому новый владелец продолжает с того же места.
+    Уведомления ставятся в общую очередь, которую доставляет процесс бота.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    log(f"🚀 Запуск обработчика {worker_id}")
+    store = StateStore(
+        STATE_DB_PATH, retention_days=DEDUP_RETENTION_DAYS, link_retention_days=ORDER_INDEX_RETENTION_DAYS
+    )
+    history = open_history()
+    metrics_server = await start_metrics_server(store)
+    sellers = load_sellers(SELLERS_FILE, WB_API_TOKEN, WB_FEEDBACK_TOKEN, TELEGRAM_CHAT_ID)
+    notifier = OutboxNotifier(store, len(sellers))
+    governor = RequestGovernor(max_backoff=WB_MAX_BACKOFF)
+    slots = asyncio.Semaphore(MAX_CONCURRENT_POLLS)
+    owned = {}  # Имя кабинета -> (WildberriesAPI, задачи проверок, события внеплановой проверки)
+    backfills = {}  # Имя кабинета -> задача загрузки истории
+    
+    async def release(seller):
+        wb_api, tasks, _ = owned.pop(seller.name)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await wb_api.close()  # Сначала останавливает выполняемые проверки кабинета
+        store.release_lease(seller.name, worker_id)
+        log(f"📤 Кабинет «{seller.name}» освобожден обработчиком {worker_id}")
+    
+    async def rebalance():
+        store.heartbeat(worker_id)
+        # Доля кабинетов на обработчик: так новые обработчики получают работу
+        share = math.ceil(len(sellers) / max(1, store.live_workers(LEASE_TTL)))
+        
+        for seller in sellers:
+            if seller.name in owned:
+                if len(owned) > share:
+                    await release(seller)
+                elif not store.acquire_lease(seller.name, worker_id, LEASE_TTL):
+                    log(f"⚠️ Аренда кабинета «{seller.name}» потеряна")
+                    await release(seller)
+            elif len(owned) < share and store.acquire_lease(seller.name, worker_id, LEASE_TTL):
+                log(f"📥 Кабинет «{seller.name}» взят обработчиком {worker_id}")
+                wb_api = WildberriesAPI(
+                    seller.stats_token, seller.feedback_token, store,
+                    seller=seller, governor=governor, history=history
+                )
+                wakes = {stream: asyncio.Event() for stream in ('orders', 'sales', 'feedbacks')}
+                owned[seller.name] = (wb_api, start_seller_checks(notifier, wb_api, slots, wakes=wakes), wakes)
+        
+        for name in store.pop_check_requests(owned):
+            log(f"🔍 Запрошена внеплановая проверка кабинета «{name}»")
+            for wake in owned[name][2].values():
+                wake.set()
+        
+        for name, date_from, date_to, chat_id in store.pop_backfill_requests(owned):
+            wb_api, tasks, _ = owned[name]
+            if name in backfills:
+                await notifier.send_notification(
+                    f"{notifier.seller_prefix(wb_api.seller)}⏳ Загрузка истории уже выполняется", [chat_id]
+                )
+                continue
+            log(f"📥 Запрошена загрузка истории кабинета «{name}» с {date_from} по {date_to}")
+            # Задача кабинета: при освобождении аренды она отменяется вместе с проверками
+            task = asyncio.create_task(backfill_and_report(
+                notifier, wb_api, date.fromisoformat(date_from), date.fromisoformat(date_to), chat_id
+            ))
+            backfills[name] = task
+            task.add_done_callback(lambda _, name=name: backfills.pop(name, None))
+            tasks.append(task)
+    
+    try:
+        while True:
+            try:
+                await rebalance()
+            except sqlite3.Error as e:
+                # База занята другим процессом: аренды продлим на следующем шаге
+                log(f"⚠️ Ошибка базы состояния в обработчике {worker_id}: {e}")
+            await asyncio.sleep(WORKER_TICK)
+    except asyncio.CancelledError:
+        log(f"🛑 Обработчик {worker_id} остановлен")
+    finally:
+        for seller in sellers:
+            if seller.name in owned:
+                await release(seller)
+        if metrics_server is not None:
+            metrics_server.close()
+        store.remove_worker(worker_id)
+        store.close()
+        if history is not None:
+            history.close()
 
 # Асинхронные версии функций проверки
+async def send_events(notify, events, format_message, digest, ack):
+    """Отправка событий из асинхронного потока. Возвращает количество событий.
+    
+    Пока событий не больше DIGEST_THRESHOLD, каждое уходит отдельным уведомлением.
+    При превышении порога события собираются в сводку, сгруппированную по артикулу и складу.
+    ack() вызывается после постановки уведомлений в очередь: только тогда события
+    считаются обработанными, поэтому сбой до этого момента не приводит к их потере.
+    notify(message, event_at) ставит уведомление в очередь для чатов кабинета; event_at - время
+    события (для сводки - самого раннего), по нему измеряется задержка доставки.
+    """
+    buffered = []
+    count = 0
+    async for event in events:
+        count += 1
+        if digest.count:
+            digest.add(event)
+            continue
+        buffered.append(event)
+        if DIGEST_THRESHOLD and len(buffered) > DIGEST_THRESHOLD:
+            log(f"📚 Событий больше {DIGEST_THRESHOLD}, переключаемся на сводные уведомления")
+            for buffered_event in buffered:
+                digest.add(buffered_event)
+            buffered.clear()
+        elif not DIGEST_THRESHOLD:
+            # Сводки отключены: отправляем сразу, не дожидаясь конца выборки
+            await notify(format_message(event), event_time(event))
+            buffered.clear()
+            ack()
+    
+    if digest.count:
+        for message in digest.format_messages():
+            await notify(message, digest.first_event_at)
+    else:
+        for event in buffered:
+            await notify(format_message(event), event_time(event))
+    ack()
+    return count
+
 async def check_orders_async(telegram_bot, wb_api):
-    """Проверка новых заказов и отправка уведомлений"""
+    """Проверка новых заказов и отправка уведомлений (одна на все одновременные вызовы)"""
+    return await wb_api.single_flight('orders', lambda: _check_orders(telegram_bot, wb_api))
+
+async def _check_orders(telegram_bot, wb_api):
     log(f"🔍 Проверка новых заказов ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})...")
     
-    new_orders = wb_api.get_new_orders()
-    if new_orders:
-        log(f"📬 Найдено {len(new_orders)} новых заказов")
-        for order in new_orders:
-            message = format_order_message(order)
-            await telegram_bot.send_notification(message)
-            await asyncio.sleep(0.5)
+    prefix = telegram_bot.seller_prefix(wb_api.seller)
+    digest = EventDigest(f"{prefix}🛍 <b>Новые заказы", "💳 Заплатили покупатели", lambda order: order.finished_price)
+    orders_count = await send_events(
+        lambda message, event_at: telegram_bot.send_notification(message, wb_api.seller.chat_ids, event_at),
+        wb_api.get_new_orders(),
+        lambda order: prefix + format_order_message(order),
+        digest,
+        lambda: wb_api.ack('orders')
+    )
+    
+    if orders_count:
+        log(f"📬 Обработано {orders_count} новых заказов")
     else:
         log("📭 Новых заказов нет")
+    return orders_count
 
 async def check_feedbacks_async(telegram_bot, wb_api):
-    """Проверка новых отзывов и вопросов"""
+    """Проверка новых отзывов и вопросов (одна на все одновременные вызовы)"""
+    return await wb_api.single_flight('feedbacks', lambda: _check_feedbacks(telegram_bot, wb_api))
+
+async def _check_feedbacks(telegram_bot, wb_api):
     log(f"👀 Проверка отзывов и вопросов ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})...")
     
-    feedback_data = wb_api.check_new_feedbacks()
-    if feedback_data is not None:
-        has_new = feedback_data['has_new_feedbacks'] or feedback_data['has_new_questions']
-        if has_new:
-            message = (
-                "❗️ <b>Пришел новый отзыв или вопрос!</b>\n\n"
-                "Проверьте портал продавца."
-            )
-            await telegram_bot.send_notification(message)
-            log(f"📢 Обнаружено: {feedback_data['feedbacks_count']} отзывов, {feedback_data['questions_count']} вопросов")
+    items = await wb_api.get_new_feedbacks()
+    prefix = telegram_bot.seller_prefix(wb_api.seller)
+    # Список уже упорядочен: отзывы с низкой оценкой уходят первыми
+    for item in items:
+        await telegram_bot.send_notification(
+            prefix + format_feedback_message(item), wb_api.seller.chat_ids, event_time(item)
+        )
+    wb_api.ack('feedbacks')
+    wb_api.ack('questions')
+    
+    if items:
+        feedbacks = sum(1 for item in items if item.kind == 'feedback')
+        log(f"📢 Обнаружено: {feedbacks} отзывов, {len(items) - feedbacks} вопросов")
+    return len(items)
 
 async def check_sales_async(telegram_bot, wb_api):
-    """Проверка новых выкупов"""
+    """Проверка новых выкупов (одна на все одновременные вызовы)"""
+    return await wb_api.single_flight('sales', lambda: _check_sales(telegram_bot, wb_api))
+
+async def _check_sales(telegram_bot, wb_api):
     log(f"💰 Проверка выкупов ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})...")
     
-    sales = wb_api.get_sales()
+    prefix = telegram_bot.seller_prefix(wb_api.seller)
+    digest = EventDigest(f"{prefix}💰 <b>Новые выкупы", "💸 К выплате", lambda sale: sale.for_pay)
+    sales_count = await send_events(
+        lambda message, event_at: telegram_bot.send_notification(message, wb_api.seller.chat_ids, event_at),
+        wb_api.get_sales(),
+        lambda sale: prefix + format_sale_alert(sale, wb_api.order_index),
+        digest,
+        lambda: wb_api.ack('sales')
+    )
     
-    if sales:
-        log(f"📈 Найдено {len(sales)} новых выкупов")
-        for sale in sales:
-            message = format_sale_message(sale)
-            await telegram_bot.send_notification(message)
-            await asyncio.sleep(0.5)
+    if sales_count:
+        log(f"📈 Обработано {sales_count} новых выкупов")
     else:
         log("📉 Новых выкупов нет")
+    return sales_count
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,221 @@
+import asyncio
+import bisect
+import math
+
+
+def _label_key(label_names, labels):
+    """Ключ серии: значения меток в порядке объявления"""
+    return tuple(str(labels.get(name, '')) for name in label_names)
+
+
+def _escape(value):
+    """Экранирование значения метки для текстового формата Prometheus"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, key, extra=()):
+    pairs = list(zip(label_names, key)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Счетчик: только растет"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.label_names, labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Значение серии; без меток - сумма по всем сериям"""
+        if labels:
+            return self._values.get(_label_key(self.label_names, labels), 0)
+        return sum(self._values.values())
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.label_names, key), value
+
+
+class Gauge(Counter):
+    """Текущее значение: задается явно или вычисляется при чтении"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, label_names=(), function=None):
+        super().__init__(name, documentation, label_names)
+        self.function = function
+
+    def set(self, value, **labels):
+        self._values[_label_key(self.label_names, labels)] = value
+
+    def value(self, **labels):
+        if self.function is not None:
+            return self.function()
+        return super().value(**labels)
+
+    def samples(self):
+        if self.function is not None:
+            yield self.name, '', self.function()
+            return
+        yield from super().samples()
+
+
+class Histogram:
+    """Гистограмма: количество наблюдений по корзинам, их сумма и число"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}  # Ключ меток -> [счетчики корзин, сумма, количество]
+
+    def observe(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _merged(self, labels):
+        """Корзины, сумма и количество по сериям, подходящим под метки"""
+        wanted = {name: str(value) for name, value in labels.items()}
+        counts = [0] * len(self.buckets)
+        total = 0.0
+        count = 0
+        for key, (bucket_counts, series_sum, series_count) in self._series.items():
+            values = dict(zip(self.label_names, key))
+            if any(values.get(name) != value for name, value in wanted.items()):
+                continue
+            counts = [a + b for a, b in zip(counts, bucket_counts)]
+            total += series_sum
+            count += series_count
+        return counts, total, count
+
+    def label_values(self, label):
+        """Значения метки, встречавшиеся в наблюдениях"""
+        index = self.label_names.index(label)
+        return sorted({key[index] for key in self._series})
+
+    def count(self, **labels):
+        return self._merged(labels)[2]
+
+    def mean(self, **labels):
+        """Среднее значение (или None без наблюдений)"""
+        _, total, count = self._merged(labels)
+        return total / count if count else None
+
+    def quantile(self, q, **labels):
+        """Оценка квантиля по корзинам с линейной интерполяцией (или None без наблюдений)"""
+        counts, _, count = self._merged(labels)
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for bound, bucket_count in zip(self.buckets, counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if bound == math.inf:
+                    return lower  # Выше последней границы точнее оценить нельзя
+                return lower + (bound - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = bound if bound != math.inf else lower
+        return lower
+
+    def samples(self):
+        for key, (bucket_counts, series_sum, series_count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [('le', _format_value(bound))])
+                yield f'{self.name}_bucket', labels, cumulative
+            yield f'{self.name}_sum', _format_labels(self.label_names, key), series_sum
+            yield f'{self.name}_count', _format_labels(self.label_names, key), series_count
+
+
+class MetricsRegistry:
+    """Набор метрик процесса с выводом в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=(), function=None):
+        return self._register(Gauge(name, documentation, label_names, function))
+
+    def histogram(self, name, documentation, label_names=(), buckets=None):
+        if buckets is None:
+            return self._register(Histogram(name, documentation, label_names))
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+async def _read_request_line(reader):
+    """Строка запроса; заголовки не нужны, но их нужно дочитать до пустой строки"""
+    request_line = await reader.readline()
+    while (await reader.readline()).strip():
+        pass
+    return request_line
+
+
+async def serve_metrics(registry, host, port, request_timeout=10):
+    """Запуск HTTP-сервера с метриками по адресу http://host:port/metrics.
+
+    Соединение, не приславшее запрос за request_timeout секунд, закрывается.
+    """
+
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(_read_request_line(reader), request_timeout)
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, content_type, body = '200 OK', 'text/plain; version=0.0.4; charset=utf-8', registry.render()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', 'Not Found\n'
+            payload = body.encode('utf-8')
+            writer.write(
+                f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + payload
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
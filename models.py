@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+
+# Даты API Wildberries без часового пояса указаны по московскому времени
+MOSCOW_TZ = timezone(timedelta(hours=3), 'MSK')
+
+
+def parse_date_string(date_str):
+    """Парсинг даты из API в datetime с часовым поясом.
+
+    Даты без пояса считаются московскими, суффикс Z означает UTC.
+    При неизвестном формате выбрасывает ValueError.
+    """
+    if date_str.endswith('Z'):
+        date_str = date_str[:-1]
+        tz = timezone.utc
+    else:
+        tz = MOSCOW_TZ
+
+    try:
+        value = datetime.fromisoformat(date_str)
+    except ValueError:
+        # Python 3.10 принимает только 3 или 6 знаков долей секунды
+        try:
+            value = datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%f')
+        except ValueError:
+            raise ValueError(f"Неподдерживаемый формат даты: {date_str}") from None
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=tz)
+    return value
+
+
+def _parse_optional_date(date_str):
+    """Дата из API или None, если поле пустое или в неизвестном формате"""
+    if not date_str:
+        return None
+    try:
+        return parse_date_string(date_str)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_timestamp(value):
+    """datetime в unix time (или None)"""
+    return value.timestamp() if value is not None else None
+
+
+def _to_number(value):
+    """Числовое значение из API (строки и None приводятся к float)"""
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass(slots=True)
+class Order:
+    """Заказ: только поля, нужные для уведомлений, истории и агрегатов"""
+    srid: str
+    date: datetime | None
+    last_change_date: str
+    supplier_article: str
+    nm_id: int
+    finished_price: float
+    price_with_disc: float
+    region_name: str
+    oblast_okrug_name: str
+    warehouse_name: str
+    warehouse_type: str
+    is_cancel: bool
+    cancel_date: datetime | None
+
+    @classmethod
+    def from_api(cls, data):
+        """Создание заказа из записи API /supplier/orders"""
+        return cls(
+            srid=data.get('srid'),
+            date=_parse_optional_date(data.get('date')),
+            last_change_date=data.get('lastChangeDate'),
+            supplier_article=data.get('supplierArticle'),
+            nm_id=data.get('nmId'),
+            finished_price=_to_number(data.get('finishedPrice')),
+            price_with_disc=_to_number(data.get('priceWithDisc')),
+            region_name=data.get('regionName'),
+            oblast_okrug_name=data.get('oblastOkrugName'),
+            warehouse_name=data.get('warehouseName'),
+            warehouse_type=data.get('warehouseType'),
+            is_cancel=bool(data.get('isCancel')),
+            cancel_date=_parse_optional_date(data.get('cancelDate'))
+        )
+
+
+@dataclass(slots=True)
+class Sale:
+    """Выкуп: только поля, нужные для уведомлений, истории и агрегатов"""
+    sale_id: str
+    srid: str
+    date: datetime | None
+    last_change_date: str
+    supplier_article: str
+    nm_id: int
+    finished_price: float
+    price_with_disc: float
+    fee_wb: float
+    for_pay: float
+    region_name: str
+    warehouse_name: str
+
+    @classmethod
+    def from_api(cls, data):
+        """Создание выкупа из записи API /supplier/sales"""
+        return cls(
+            sale_id=data.get('saleID'),
+            srid=data.get('srid'),
+            # Выбираем поле date или lastChangeDate, если date отсутствует
+            date=_parse_optional_date(data.get('date', data.get('lastChangeDate'))),
+            last_change_date=data.get('lastChangeDate'),
+            supplier_article=data.get('supplierArticle'),
+            nm_id=data.get('nmId'),
+            finished_price=_to_number(data.get('finishedPrice')),
+            price_with_disc=_to_number(data.get('priceWithDisc')),
+            fee_wb=_to_number(data.get('feeWB')),
+            for_pay=_to_number(data.get('forPay')),
+            region_name=data.get('regionName') or 'Не указан',
+            warehouse_name=data.get('warehouseName')
+        )
+
+
+@dataclass(slots=True)
+class Feedback:
+    """Отзыв или вопрос покупателя (kind: 'feedback' или 'question')"""
+    id: str
+    kind: str
+    rating: int | None
+    text: str
+    pros: str
+    cons: str
+    supplier_article: str
+    product_name: str
+    nm_id: int | None
+    date: datetime | None
+
+    @classmethod
+    def from_api(cls, data, kind):
+        """Создание из записи API /api/v1/feedbacks или /api/v1/questions"""
+        product = data.get('productDetails') or {}
+        return cls(
+            id=data.get('id'),
+            kind=kind,
+            # У вопросов оценки нет
+            rating=data.get('productValuation') if kind == 'feedback' else None,
+            text=data.get('text') or '',
+            pros=data.get('pros') or '',
+            cons=data.get('cons') or '',
+            supplier_article=product.get('supplierArticle'),
+            product_name=product.get('productName'),
+            nm_id=product.get('nmId'),
+            date=_parse_optional_date(data.get('createdDate'))
+        )
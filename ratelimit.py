@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import random
+import time
+
+
+class TokenBucket:
+    """Асинхронный ограничитель частоты запросов (алгоритм token bucket)"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate  # Пополнение: токенов в секунду
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()  # Ожидающие получают токены в порядке очереди
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, tokens=1):
+        """Через сколько секунд в корзине будет нужное количество токенов"""
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    async def acquire(self, tokens=1):
+        """Ожидание, пока в корзине не появится нужное количество токенов"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+def _header_seconds(headers, name):
+    """Числовое значение заголовка в секундах (или None)"""
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class RequestGovernor:
+    """Регулятор запросов к API с квотами.
+
+    Запросы с одним токеном к одной категории API (статистика, отзывы и вопросы)
+    выстраиваются в общую очередь и идут не чаще квоты токена. Заголовки X-Ratelimit-*
+    и Retry-After из ответов блокируют категорию до восстановления квоты, а повторы
+    после 429/5xx выполняются с экспоненциальной паузой и случайным разбросом.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_backoff=1.0, max_backoff=300.0):
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._buckets = {}
+        self._blocked_until = {}
+
+    @staticmethod
+    def key(token, category):
+        """Ключ квоты: отпечаток токена и категория API (сам токен не хранится)"""
+        return hashlib.sha256((token or '').encode()).hexdigest()[:12], category
+
+    def _bucket(self, key, rate):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity=1)
+        return bucket
+
+    def delay(self, key, rate):
+        """Через сколько секунд категория будет доступна для запроса"""
+        blocked = self._blocked_until.get(key, 0.0) - time.monotonic()
+        return max(0.0, blocked, self._bucket(key, rate).delay())
+
+    async def acquire(self, key, rate):
+        """Ожидание очереди и квоты для запроса к категории"""
+        while True:
+            blocked = self._blocked_until.get(key, 0.0) - time.monotonic()
+            if blocked <= 0:
+                break
+            await asyncio.sleep(blocked)
+        await self._bucket(key, rate).acquire()
+
+    def block(self, key, seconds):
+        """Запрет запросов к категории на указанное время"""
+        until = time.monotonic() + seconds
+        if until > self._blocked_until.get(key, 0.0):
+            self._blocked_until[key] = until
+
+    def observe(self, key, response):
+        """Учет заголовков ответа. Возвращает паузу перед повтором или None, если повтор не нужен"""
+        headers = response.headers
+        remaining = _header_seconds(headers, 'X-Ratelimit-Remaining')
+        reset = _header_seconds(headers, 'X-Ratelimit-Reset')
+        if remaining is not None and remaining <= 0 and reset:
+            self.block(key, reset)
+
+        if response.status_code not in self.RETRY_STATUSES:
+            return None
+        retry = _header_seconds(headers, 'X-Ratelimit-Retry') or _header_seconds(headers, 'Retry-After') or 0.0
+        if retry:
+            self.block(key, retry)
+        return retry
+
+    def backoff(self, attempt):
+        """Экспоненциальная пауза с разбросом для повтора номер attempt (начиная с 1): base_backoff * 2 ** attempt"""
+        return min(self.max_backoff, self.base_backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
@@ -0,0 +1,31 @@
+class AdaptiveInterval:
+    """Адаптивный интервал опроса одного потока данных.
+
+    Интервал сокращается, когда проверки приносят данные, и растет, когда они пустые
+    или API ответил ограничением частоты. Интервал не выходит за границы [min, max]
+    и не позволяет превысить поминутную квоту API с учетом числа запросов за проверку.
+    """
+
+    SPEEDUP = 0.5  # Множитель после проверки с новыми данными
+    SLOWDOWN = 1.5  # Множитель после пустой проверки
+    RATE_LIMIT_SLOWDOWN = 2.0  # Множитель после ответа 429
+
+    def __init__(self, base, min_interval, max_interval, requests_per_minute=None):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        # Минимальная пауза на один запрос, чтобы уложиться в квоту API
+        self.request_cost = 60 / requests_per_minute if requests_per_minute else 0
+        self.interval = self._clamp(base)
+
+    def _clamp(self, value):
+        return min(self.max_interval, max(self.min_interval, value))
+
+    def update(self, events, requests=1, rate_limited=False):
+        """Пересчет интервала по итогам проверки. Возвращает паузу до следующей проверки"""
+        if rate_limited:
+            self.interval = self._clamp(self.interval * self.RATE_LIMIT_SLOWDOWN)
+        elif events:
+            self.interval = self._clamp(self.interval * self.SPEEDUP)
+        else:
+            self.interval = self._clamp(self.interval * self.SLOWDOWN)
+        return max(self.interval, requests * self.request_cost)
@@ -0,0 +1,56 @@
+import json
+from dataclasses import dataclass
+
+
+def parse_chat_ids(value):
+    """Список ID чатов из строки через запятую или из списка"""
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(chat_id).strip() for chat_id in value or [] if str(chat_id).strip()]
+
+
+@dataclass(slots=True)
+class Seller:
+    """Кабинет продавца Wildberries: токены API и чаты для уведомлений"""
+    name: str
+    stats_token: str
+    feedback_token: str
+    chat_ids: list[str]
+
+    @classmethod
+    def from_config(cls, data):
+        """Создание продавца из записи файла кабинетов"""
+        name = str(data.get('name') or '').strip()
+        if not name:
+            raise ValueError("У кабинета продавца не указано имя (name)")
+        chat_ids = parse_chat_ids(data.get('chat_ids'))
+        if not chat_ids:
+            raise ValueError(f"Для кабинета «{name}» не указаны чаты (chat_ids)")
+        return cls(
+            name=name,
+            stats_token=data.get('wb_api_token'),
+            feedback_token=data.get('wb_feedback_token'),
+            chat_ids=chat_ids
+        )
+
+
+def load_sellers(path, stats_token, feedback_token, chat_ids):
+    """Список кабинетов продавцов.
+
+    Без файла кабинетов используется один кабинет из WB_API_TOKEN, WB_FEEDBACK_TOKEN
+    и TELEGRAM_CHAT_ID. Его имя пустое, поэтому состояние хранится под прежними ключами.
+    """
+    if not path:
+        return [Seller('', stats_token, feedback_token, parse_chat_ids(chat_ids))]
+
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list) or not data:
+        raise ValueError(f"Файл кабинетов {path} должен содержать непустой JSON-массив")
+
+    sellers = [Seller.from_config(item) for item in data]
+    names = [seller.name for seller in sellers]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Повторяющиеся имена кабинетов: {', '.join(duplicates)}")
+    return sellers
@@ -0,0 +1,402 @@
+import sqlite3
+import time
+
+
+class StateStore:
+    """Хранилище состояния бота в SQLite (переживает перезапуски службы)"""
+
+    def __init__(self, path, retention_days=30, link_retention_days=90):
+        self.path = path
+        self.retention_seconds = retention_days * 86400
+        self.link_retention_seconds = link_retention_days * 86400
+        self._conn = None
+        self._last_eviction = 0.0
+
+    @property
+    def conn(self):
+        """Ленивое открытие базы: соединение создается при первом обращении"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_schema()
+        return self._conn
+
+    def _create_schema(self):
+        """Создание таблиц, если их еще нет"""
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS processed (
+                    stream TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    seen_at REAL NOT NULL,
+                    PRIMARY KEY (stream, key)
+                ) WITHOUT ROWID
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_processed_seen_at ON processed (seen_at)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    event_at REAL
+                )
+                """
+            )
+            # Базы прежних версий: время события нужно для замера задержки доставки
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+            if 'event_at' not in columns:
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN event_at REAL")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_chat ON outbox (chat_id, id)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON outbox (next_attempt_at)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cursors (
+                    stream TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            # Раздельный режим: аренда кабинетов обработчиками и запросы внеплановых проверок
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS leases (
+                    seller TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS workers (
+                    id TEXT PRIMARY KEY,
+                    seen_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS check_requests (
+                    seller TEXT PRIMARY KEY,
+                    requested_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS backfill_requests (
+                    seller TEXT PRIMARY KEY,
+                    date_from TEXT NOT NULL,
+                    date_to TEXT NOT NULL,
+                    chat_id TEXT NOT NULL,
+                    requested_at REAL NOT NULL
+                )
+                """
+            )
+            # Связь заказа с выкупом, возвратом или отменой и счетчики по артикулам
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS order_links (
+                    seller TEXT NOT NULL,
+                    srid TEXT NOT NULL,
+                    ordered_at REAL,
+                    supplier_article TEXT,
+                    outcome TEXT,
+                    outcome_at REAL,
+                    PRIMARY KEY (seller, srid)
+                ) WITHOUT ROWID
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS article_stats (
+                    seller TEXT NOT NULL,
+                    supplier_article TEXT NOT NULL,
+                    orders INTEGER NOT NULL,
+                    sales INTEGER NOT NULL,
+                    returns INTEGER NOT NULL,
+                    cancels INTEGER NOT NULL,
+                    PRIMARY KEY (seller, supplier_article)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def is_processed(self, stream, key):
+        """Проверка, было ли событие уже обработано"""
+        row = self.conn.execute(
+            "SELECT 1 FROM processed WHERE stream = ? AND key = ?",
+            (stream, key)
+        ).fetchone()
+        return row is not None
+
+    def mark_processed(self, stream, keys):
+        """Отметка событий как обработанных"""
+        now = time.time()
+        rows = [(stream, key, now) for key in keys if key]
+        if rows:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO processed (stream, key, seen_at) VALUES (?, ?, ?)",
+                    rows
+                )
+        self._maybe_evict(now)
+
+    def evict_expired(self):
+        """Удаление записей старше срока хранения. Возвращает количество удаленных"""
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM processed WHERE seen_at < ?", (now - self.retention_seconds,)
+            )
+            # Заказы без исхода за срок хранения уже не выкупят; статистика артикулов остается
+            self.conn.execute(
+                "DELETE FROM order_links WHERE COALESCE(outcome_at, ordered_at) < ?",
+                (now - self.link_retention_seconds,)
+            )
+        self._last_eviction = time.time()
+        return cursor.rowcount
+
+    def _maybe_evict(self, now):
+        """Очистка устаревших записей не чаще раза в час"""
+        if now - self._last_eviction >= 3600:
+            self.evict_expired()
+
+    def get_order_link(self, seller, srid):
+        """Связь заказа: (время заказа, артикул, исход, время исхода) или None"""
+        return self.conn.execute(
+            "SELECT ordered_at, supplier_article, outcome, outcome_at FROM order_links "
+            "WHERE seller = ? AND srid = ?",
+            (seller, srid)
+        ).fetchone()
+
+    def get_order_links(self, seller, srids):
+        """Связи заказов из набора srids: словарь srid -> (время заказа, артикул, исход, время исхода)"""
+        srids = list(srids)
+        links = {}
+        # Не больше 500 параметров в запросе (ограничение SQLite на число переменных)
+        for start in range(0, len(srids), 500):
+            chunk = srids[start:start + 500]
+            rows = self.conn.execute(
+                "SELECT srid, ordered_at, supplier_article, outcome, outcome_at FROM order_links "
+                f"WHERE seller = ? AND srid IN ({', '.join('?' * len(chunk))})",
+                (seller, *chunk)
+            )
+            for srid, *link in rows:
+                links[srid] = link
+        return links
+
+    def get_article_stats(self, seller, article):
+        """Счетчики артикула: (заказов, выкупов, возвратов, отмен) или None"""
+        return self.conn.execute(
+            "SELECT orders, sales, returns, cancels FROM article_stats "
+            "WHERE seller = ? AND supplier_article = ?",
+            (seller, article)
+        ).fetchone()
+
+    def save_correlation(self, seller, links, stats):
+        """Запись измененных связей заказов и счетчиков артикулов одной транзакцией"""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO order_links "
+                "(seller, srid, ordered_at, supplier_article, outcome, outcome_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(seller, *link) for link in links]
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO article_stats "
+                "(seller, supplier_article, orders, sales, returns, cancels) VALUES (?, ?, ?, ?, ?, ?)",
+                [(seller, *row) for row in stats]
+            )
+
+    def get_cursor(self, stream):
+        """Получение сохраненного курсора потока (или None)"""
+        row = self.conn.execute(
+            "SELECT value FROM cursors WHERE stream = ?", (stream,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, stream, value):
+        """Сохранение курсора потока"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cursors (stream, value, updated_at) VALUES (?, ?, ?)",
+                (stream, value, time.time())
+            )
+
+    def enqueue_messages(self, chat_ids, text, event_at=None):
+        """Постановка сообщения в очередь отправки для каждого чата.
+
+        event_at - время события (unix time), о котором сообщение, если оно известно.
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO outbox (chat_id, text, next_attempt_at, created_at, event_at) VALUES (?, ?, ?, ?, ?)",
+                [(str(chat_id), text, now, now, event_at) for chat_id in chat_ids]
+            )
+
+    def fetch_due_messages(self, limit):
+        """Сообщения, готовые к отправке, в порядке постановки.
+
+        Сообщения чата пропускаются, пока более раннее сообщение этого чата ждет повтора,
+        чтобы не нарушать порядок уведомлений.
+        """
+        now = time.time()
+        return self.conn.execute(
+            """
+            SELECT id, chat_id, text, attempts, event_at FROM outbox AS o
+            WHERE o.next_attempt_at <= ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox AS p
+                  WHERE p.chat_id = o.chat_id AND p.id < o.id AND p.next_attempt_at > ?
+              )
+            ORDER BY o.id
+            LIMIT ?
+            """,
+            (now, now, limit)
+        ).fetchall()
+
+    def next_message_due(self):
+        """Время ближайшей попытки отправки (или None, если очередь пуста)"""
+        row = self.conn.execute("SELECT MIN(next_attempt_at) FROM outbox").fetchone()
+        return row[0]
+
+    def delete_message(self, message_id):
+        """Удаление сообщения из очереди (доставлено или отброшено)"""
+        with self.conn:
+            self.conn.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+
+    def retry_message(self, message_id, attempts, next_attempt_at):
+        """Перенос сообщения на повторную попытку"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                (attempts, next_attempt_at, message_id)
+            )
+
+    def outbox_size(self):
+        """Количество сообщений в очереди отправки"""
+        return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def heartbeat(self, worker_id):
+        """Отметка, что обработчик жив"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO workers (id, seen_at) VALUES (?, ?)",
+                (worker_id, time.time())
+            )
+
+    def live_workers(self, ttl):
+        """Количество обработчиков, подававших признаки жизни за последние ttl секунд"""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM workers WHERE seen_at >= ?", (time.time() - ttl,)
+        ).fetchone()[0]
+
+    def remove_worker(self, worker_id):
+        """Удаление обработчика и освобождение всех его аренд"""
+        with self.conn:
+            self.conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+            self.conn.execute("DELETE FROM leases WHERE owner = ?", (worker_id,))
+
+    def acquire_lease(self, seller, owner, ttl):
+        """Получение или продление аренды кабинета. Возвращает True, если аренда за owner.
+
+        Чужая аренда перехватывается только после истечения срока.
+        """
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.execute(
+                """
+                INSERT INTO leases (seller, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (seller) DO UPDATE
+                SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+                """,
+                (seller, owner, now + ttl, now)
+            )
+        return cursor.rowcount == 1
+
+    def release_lease(self, seller, owner):
+        """Освобождение аренды кабинета"""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM leases WHERE seller = ? AND owner = ?", (seller, owner)
+            )
+
+    def request_check(self, seller):
+        """Запрос внеплановой проверки кабинета у обработчика, который его арендует"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO check_requests (seller, requested_at) VALUES (?, ?)",
+                (seller, time.time())
+            )
+
+    def pop_check_requests(self, sellers):
+        """Запросы внеплановых проверок для указанных кабинетов (удаляются при получении)"""
+        sellers = list(sellers)
+        if not sellers:
+            return []
+        placeholders = ', '.join('?' * len(sellers))
+        rows = self.conn.execute(
+            f"SELECT seller, requested_at FROM check_requests WHERE seller IN ({placeholders})",
+            sellers
+        ).fetchall()
+        if rows:
+            # Удаляем только прочитанные запросы: повторный запрос, пришедший после чтения, сохранится
+            with self.conn:
+                self.conn.executemany(
+                    "DELETE FROM check_requests WHERE seller = ? AND requested_at = ?", rows
+                )
+        return [row[0] for row in rows]
+
+    def request_backfill(self, seller, date_from, date_to, chat_id):
+        """Запрос загрузки истории кабинета у обработчика, который его арендует (итог - в чат chat_id)"""
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO backfill_requests (seller, date_from, date_to, chat_id, requested_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (seller, date_from, date_to, chat_id, time.time())
+            )
+
+    def pop_backfill_requests(self, sellers):
+        """Запросы загрузки истории для указанных кабинетов: (кабинет, с, по, чат), удаляются при получении"""
+        sellers = list(sellers)
+        if not sellers:
+            return []
+        placeholders = ', '.join('?' * len(sellers))
+        rows = self.conn.execute(
+            f"""
+            SELECT seller, date_from, date_to, chat_id, requested_at FROM backfill_requests
+            WHERE seller IN ({placeholders})
+            """,
+            sellers
+        ).fetchall()
+        if rows:
+            # Как и у внеплановых проверок: новый запрос, пришедший после чтения, сохранится
+            with self.conn:
+                self.conn.executemany(
+                    "DELETE FROM backfill_requests WHERE seller = ? AND requested_at = ?",
+                    [(row[0], row[4]) for row in rows]
+                )
+        return [row[:4] for row in rows]
+
+    def close(self):
+        """Закрытие соединения с базой"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from storage import StateStore  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Хранилище состояния в отдельной базе для каждого теста"""
+    store = StateStore(str(tmp_path / 'state.db'))
+    yield store
+    store.close()
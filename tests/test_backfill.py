@@ -0,0 +1,107 @@
+import asyncio
+import json
+from datetime import date
+
+import httpx
+import pytest
+
+from history import HistoryStore
+from main import OutboxNotifier, WildberriesAPI, backfill_and_report, service_running
+
+DAYS = (date(2025, 3, 1), date(2025, 3, 3))
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = HistoryStore(str(tmp_path / 'history.db'))
+    yield history
+    history.close()
+
+
+def orders_for(day):
+    return [
+        {'srid': f'{day}-{i}', 'date': f'{day}T10:0{i}:00', 'lastChangeDate': f'{day}T10:0{i}:00',
+         'supplierArticle': 'A'}
+        for i in range(2)
+    ]
+
+
+def backfill(store, history, broken=()):
+    """Загрузка orders за DAYS; дни из broken обрываются после первой записи.
+
+    Возвращает итоги, запрошенные дни и итоги проверок (last_poll).
+    """
+    requested = []
+
+    def handler(request):
+        day = request.url.params['dateFrom']
+        requested.append(day)
+        body = json.dumps(orders_for(day))
+        if day in broken:
+            body = body[:body.index('},') + 2]  # Ответ оборван посередине массива
+        return httpx.Response(200, content=body.encode())
+
+    async def run():
+        wb_api = WildberriesAPI('stats-token-0000', 'feedback-token-0000', store, history=history)
+        wb_api.stats_rate = 1000
+        wb_api.stats_client = httpx.AsyncClient(base_url='https://stats.test', transport=httpx.MockTransport(handler))
+        try:
+            return await wb_api.backfill(*DAYS, streams=('orders',)), wb_api.last_poll
+        finally:
+            await wb_api.close()
+
+    results, last_poll = asyncio.run(run())
+    return results, sorted(requested), last_poll
+
+
+def test_failed_day_is_resumed_from_checkpoint(store, history):
+    results, requested, _ = backfill(store, history, broken=('2025-03-02',))
+    assert requested == ['2025-03-01', '2025-03-02', '2025-03-03']
+    assert results['orders']['failed'] == 1
+    assert results['orders']['days'] == 2
+
+    # Точка стоит на последнем непрерывно загруженном дне: 3 марта загружается повторно
+    results, requested, _ = backfill(store, history)
+    assert requested == ['2025-03-02', '2025-03-03']
+    assert results['orders'] == {'rows': 4, 'days': 2, 'failed': 0}
+
+    # Диапазон загружен целиком: запросов нет, строки в истории без повторов
+    results, requested, _ = backfill(store, history)
+    assert requested == []
+    assert history.summary('orders')['count'] == 6
+
+
+def test_backfill_does_not_touch_live_polls(store, history):
+    _, _, last_poll = backfill(store, history)
+    # Запросы загрузки не влияют на интервалы проверок orders
+    assert last_poll['backfill']['requests'] == 3
+    assert last_poll['orders']['requests'] == 0
+    assert store.get_cursor('orders') is None
+    assert not store.is_processed('orders', '2025-03-01-0')
+
+
+def test_service_running_follows_heartbeats(store):
+    assert not service_running(store)
+    store.heartbeat('bot:host:1')
+    assert service_running(store)
+    store.remove_worker('bot:host:1')
+    assert not service_running(store)
+
+
+def test_worker_reports_backfill_through_outbox(store, history):
+    def handler(request):
+        return httpx.Response(200, json=orders_for(request.url.params['dateFrom']))
+
+    async def run():
+        wb_api = WildberriesAPI('stats-token-0000', 'feedback-token-0000', store, history=history)
+        wb_api.stats_rate = 1000
+        wb_api.stats_client = httpx.AsyncClient(base_url='https://stats.test', transport=httpx.MockTransport(handler))
+        try:
+            await backfill_and_report(OutboxNotifier(store, 1), wb_api, *DAYS, '100')
+        finally:
+            await wb_api.close()
+
+    asyncio.run(run())
+    messages = store.fetch_due_messages(10)
+    assert [message[1] for message in messages] == ['100']
+    assert 'Заказы: 6 записей за 3 дн.' in messages[0][2]
@@ -0,0 +1,62 @@
+from correlation import OrderIndex
+from models import Order, Sale
+
+
+def order(srid, cancelled=False):
+    return Order.from_api({
+        'srid': srid, 'date': '2024-05-01T10:00:00', 'supplierArticle': 'A-1',
+        'isCancel': cancelled, 'cancelDate': '2024-05-01T12:00:00' if cancelled else None
+    })
+
+
+def sale(srid, sale_id, date='2024-05-03T10:00:00'):
+    return Sale.from_api({'srid': srid, 'saleID': sale_id, 'date': date, 'supplierArticle': 'A-1'})
+
+
+def test_returned_sale_is_not_a_buyout(store):
+    index = OrderIndex(store, 'seller')
+    index.observe('orders', order('o1'))
+    index.observe('orders', order('o2'))
+    index.observe('sales', sale('o1', 'S1'))
+    index.observe('sales', sale('o1', 'R1', '2024-05-05T10:00:00'))
+    index.observe('orders', order('o2', cancelled=True))
+    index.flush()
+    stats = index.article_stats('A-1')
+    assert (stats['orders'], stats['sales'], stats['returns'], stats['cancels']) == (2, 0, 1, 1)
+    assert stats['buyout_rate'] == 0
+    assert stats['cancel_rate'] == 0.5
+
+
+def test_repeated_events_are_counted_once(store):
+    index = OrderIndex(store, 'seller')
+    for _ in range(2):
+        index.observe('orders', order('o1'))
+        index.observe('sales', sale('o1', 'S1'))
+        index.flush()
+    stats = index.article_stats('A-1')
+    assert (stats['orders'], stats['sales']) == (1, 1)
+    assert stats['buyout_rate'] == 1
+
+
+def test_sale_before_order_is_counted_once_order_arrives(store):
+    index = OrderIndex(store, 'seller')
+    index.observe('sales', sale('o1', 'S1'))
+    index.flush()
+    assert index.article_stats('A-1')['orders'] == 0
+    index.observe('orders', order('o1'))
+    index.flush()
+    stats = index.article_stats('A-1')
+    assert (stats['orders'], stats['sales']) == (1, 1)
+
+
+def test_links_outlive_lru_eviction(store):
+    index = OrderIndex(store, 'seller', capacity=1)
+    index.observe('orders', order('o1'))
+    index.observe('orders', order('o2'))
+    index.flush()
+    assert index.pending == 0
+    # o1 вытеснен из памяти, но связь читается из базы
+    assert index.since_order('o1', order('o1').date.timestamp() + 60) == 60
+    index.observe('sales', sale('o1', 'S1'))
+    index.flush()
+    assert index.article_stats('A-1')['sales'] == 1
@@ -0,0 +1,66 @@
+import asyncio
+
+import httpx
+
+from main import WildberriesAPI
+
+
+def make_api(store, pages):
+    """WildberriesAPI, которому API статистики по очереди отдает страницы pages"""
+    wb_api = WildberriesAPI('stats-token-0000', 'feedback-token-0000', store)
+    wb_api.stats_rate = 1000
+    responses = iter(pages)
+
+    def handler(request):
+        return httpx.Response(200, json=next(responses))
+
+    wb_api.stats_client = httpx.AsyncClient(base_url='https://stats.test', transport=httpx.MockTransport(handler))
+    return wb_api
+
+
+def order(srid, change_date):
+    return {'srid': srid, 'date': change_date, 'lastChangeDate': change_date, 'supplierArticle': 'A-1'}
+
+
+def poll(wb_api, ack=True):
+    async def run():
+        items = [item async for item in wb_api.get_new_orders()]
+        if ack:
+            wb_api.ack('orders')
+        await wb_api.close()
+        return items
+
+    return asyncio.run(run())
+
+
+def test_empty_page_keeps_cursor(store):
+    store.set_cursor('orders', '2024-05-01T10:00:00')
+    assert poll(make_api(store, [[]])) == []
+    assert store.get_cursor('orders') == '2024-05-01T10:00:00'
+
+
+def test_cursor_moves_to_max_change_date_after_ack(store):
+    store.set_cursor('orders', '2024-05-01T10:00:00')
+    page = [order('o2', '2024-05-01T10:07:00'), order('o1', '2024-05-01T10:05:00')]
+    wb_api = make_api(store, [page])
+    items = poll(wb_api, ack=False)
+    assert [item.srid for item in items] == ['o2', 'o1']
+    # Записи отданы, но не подтверждены: курсор и отметки не меняются
+    assert store.get_cursor('orders') == '2024-05-01T10:00:00'
+    assert not store.is_processed('orders', 'o1')
+    wb_api.ack('orders')
+    assert store.get_cursor('orders') == '2024-05-01T10:07:00'
+    assert store.is_processed('orders', 'o1')
+
+
+def test_cursor_never_moves_back(store):
+    store.set_cursor('orders', '2024-05-01T10:00:00')
+    poll(make_api(store, [[order('o1', '2024-05-01T09:50:00')]]))
+    assert store.get_cursor('orders') == '2024-05-01T10:00:00'
+
+
+def test_processed_records_are_not_repeated(store):
+    store.set_cursor('orders', '2024-05-01T10:00:00')
+    page = [order('o1', '2024-05-01T10:05:00')]
+    assert len(poll(make_api(store, [page]))) == 1
+    assert poll(make_api(store, [page])) == []
@@ -0,0 +1,49 @@
+import asyncio
+
+import httpx
+
+from main import WildberriesAPI
+
+
+def record(key, created, rating=None):
+    return {
+        'id': key, 'createdDate': created, 'text': key, 'productValuation': rating,
+        'productDetails': {'supplierArticle': 'A-1', 'productName': 'Товар', 'nmId': 1}
+    }
+
+
+def fetch(store, pages):
+    """Новые отзывы и вопросы; pages - записи по потокам ('feedbacks', 'questions')"""
+    def handler(request):
+        stream = request.url.path.rsplit('/', 1)[-1]
+        return httpx.Response(200, json={'error': False, 'data': {stream: pages[stream]}})
+
+    async def run():
+        wb_api = WildberriesAPI('stats-token-0000', 'feedback-token-0000', store)
+        wb_api.feedback_rate = 1000
+        wb_api.feedback_client = httpx.AsyncClient(base_url='https://feedbacks.test', transport=httpx.MockTransport(handler))
+        try:
+            return await wb_api.get_new_feedbacks()
+        finally:
+            await wb_api.close()
+
+    return asyncio.run(run())
+
+
+def test_low_ratings_come_first_then_questions(store):
+    items = fetch(store, {
+        'feedbacks': [
+            record('f5', '2024-05-01T10:00:00Z', 5),
+            record('f1-late', '2024-05-01T12:00:00Z', 1),
+            record('f3', '2024-05-01T11:00:00Z', 3),
+            record('f1-early', '2024-05-01T09:00:00Z', 1),
+        ],
+        'questions': [
+            record('q2', '2024-05-01T08:00:00Z'),
+            record('q1', '2024-05-01T07:00:00Z'),
+        ],
+    })
+    # Отзывы по возрастанию оценки (при равной - по времени), вопросы в конце
+    assert [item.id for item in items] == ['f1-early', 'f1-late', 'f3', 'f5', 'q1', 'q2']
+    assert [item.kind for item in items] == ['feedback'] * 4 + ['question'] * 2
+    assert items[-1].rating is None
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from history import HistoryStore
+from models import MOSCOW_TZ, Order, Sale
+
+DAY = datetime(2025, 3, 10, tzinfo=MOSCOW_TZ)
+
+
+def order(srid, at, article='A', warehouse='Коледино', price=100, changed=None):
+    return Order.from_api({
+        'srid': srid, 'date': at.strftime('%Y-%m-%dT%H:%M:%S'),
+        'lastChangeDate': changed or at.strftime('%Y-%m-%dT%H:%M:%S'),
+        'supplierArticle': article, 'warehouseName': warehouse, 'finishedPrice': price
+    })
+
+
+def sale(sale_id, at, price=100, for_pay=80, fee=20):
+    return Sale.from_api({
+        'saleID': sale_id, 'srid': sale_id, 'date': at.strftime('%Y-%m-%dT%H:%M:%S'),
+        'lastChangeDate': at.strftime('%Y-%m-%dT%H:%M:%S'), 'supplierArticle': 'A',
+        'warehouseName': 'Коледино', 'finishedPrice': price, 'forPay': for_pay, 'feeWB': fee
+    })
+
+
+@pytest.fixture
+def history(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    yield store
+    store.close()
+
+
+def ingest(history, stream, items, seller=''):
+    history.ingest(stream, seller, [history.row(stream, item) for item in items])
+
+
+def totals(rows):
+    return {(row['supplier_article'], row['warehouse_name']): (row['count'], row['finished_price']) for row in rows}
+
+
+def test_rollup_combines_whole_days_and_hour_edges(history):
+    ingest(history, 'orders', [
+        order('1', DAY - timedelta(hours=1)),  # До периода
+        order('2', DAY + timedelta(hours=10, minutes=30)),  # Начальный неполный день
+        order('3', DAY + timedelta(days=1, hours=5)),  # Целый день
+        order('4', DAY + timedelta(days=1, hours=23), warehouse='Казань', price=50),
+        order('5', DAY + timedelta(days=2, hours=2)),  # Конечный неполный день
+        order('6', DAY + timedelta(days=2, hours=9)),  # После периода
+    ])
+    rows = history.rollup('orders', '', DAY + timedelta(hours=10), DAY + timedelta(days=2, hours=3))
+    assert totals(rows) == {('A', 'Коледино'): (3, 300), ('A', 'Казань'): (1, 50)}
+
+
+def test_rollup_within_one_day_uses_hours(history):
+    ingest(history, 'orders', [order('1', DAY + timedelta(hours=1)), order('2', DAY + timedelta(hours=5))])
+    rows = history.rollup('orders', '', DAY, DAY + timedelta(hours=2))
+    assert totals(rows) == {('A', 'Коледино'): (1, 100)}
+
+
+def test_rollup_follows_updates_and_ignores_repeats(history):
+    ingest(history, 'orders', [order('1', DAY), order('2', DAY)])
+    ingest(history, 'orders', [order('1', DAY)])  # Тот же lastChangeDate: без изменений
+    ingest(history, 'orders', [order('2', DAY, warehouse='Казань', price=70, changed='2025-03-11T00:00:00')])
+    rows = history.rollup('orders', '', DAY, DAY + timedelta(days=1))
+    assert totals(rows) == {('A', 'Коледино'): (1, 100), ('A', 'Казань'): (1, 70)}
+
+
+def test_rollup_is_per_seller_and_stream(history):
+    ingest(history, 'orders', [order('1', DAY)], seller='a')
+    ingest(history, 'sales', [sale('S1', DAY)], seller='a')
+    ingest(history, 'orders', [order('1', DAY)], seller='b')
+    rows = history.rollup('sales', 'a', DAY, DAY + timedelta(days=1))
+    assert [(row['count'], row['for_pay'], row['fee_wb']) for row in rows] == [(1, 80, 20)]
+    assert totals(history.rollup('orders', 'b', DAY, DAY + timedelta(days=1))) == {('A', 'Коледино'): (1, 100)}
+
+
+def test_rebuild_matches_triggers(history):
+    ingest(history, 'orders', [order(str(i), DAY + timedelta(hours=i * 5), price=i) for i in range(20)])
+    ingest(history, 'sales', [sale(f'S{i}', DAY + timedelta(hours=i * 7)) for i in range(10)])
+    tables = ('rollup_hourly', 'rollup_daily')
+    before = {table: sorted(map(tuple, history.conn.execute(f"SELECT * FROM {table}"))) for table in tables}
+    with history.conn:
+        history._rebuild_rollups()
+    after = {table: sorted(map(tuple, history.conn.execute(f"SELECT * FROM {table}"))) for table in tables}
+    assert before == after
+
+
+def test_summary_and_find_filter_by_article(history):
+    ingest(history, 'orders', [
+        order('1', DAY, article='A', price=10),
+        order('2', DAY + timedelta(hours=1), article='A', price=20),
+        order('3', DAY, article='B', price=40),
+    ])
+    assert history.summary('orders', '', DAY, DAY + timedelta(days=1), supplier_article='A') == {
+        'count': 2, 'finished_price': 30
+    }
+    recent = history.find('orders', '', DAY, DAY + timedelta(days=1), limit=1, supplier_article='A')
+    assert [row['srid'] for row in recent] == ['2']
+    with pytest.raises(ValueError):
+        history.find('orders', '', finished_price=10)
+
+
+def test_returns_are_rolled_up_apart_from_sales(history):
+    ingest(history, 'sales', [sale('S1', DAY), sale('S2', DAY), sale('R1', DAY, price=100, for_pay=-80, fee=0)])
+    period = (DAY, DAY + timedelta(days=1))
+    assert [(row['count'], row['finished_price'], row['for_pay']) for row in history.rollup('sales', '', *period)] == [
+        (2, 200, 160)
+    ]
+    assert [(row['count'], row['finished_price']) for row in history.rollup('returns', '', *period)] == [(1, 100)]
+
+
+def test_rollups_are_rebuilt_for_older_versions(tmp_path):
+    path = str(tmp_path / 'history.db')
+    history = HistoryStore(path)
+    ingest(history, 'sales', [sale('S1', DAY), sale('R1', DAY)])
+    # База прежней версии: возвраты лежали в агрегатах вместе с выкупами
+    with history.conn:
+        for table in ('rollup_hourly', 'rollup_daily'):
+            history.conn.execute(f"DELETE FROM {table} WHERE stream = 'returns'")
+            history.conn.execute(f"UPDATE {table} SET count = 2 WHERE stream = 'sales'")
+        history.conn.execute("PRAGMA user_version = 0")
+    history.close()
+    history = HistoryStore(path)
+    period = (DAY, DAY + timedelta(days=1))
+    assert [row['count'] for row in history.rollup('sales', '', *period)] == [1]
+    assert [row['count'] for row in history.rollup('returns', '', *period)] == [1]
+    history.close()
+
+
+def test_summary_keeps_returns_apart_from_sales(history):
+    ingest(history, 'sales', [sale('S1', DAY, price=100), sale('S2', DAY, price=50), sale('R1', DAY, price=100)])
+    period = (DAY, DAY + timedelta(days=1))
+    assert history.summary('sales', '', *period, supplier_article='A') == {'count': 2, 'finished_price': 150}
+    assert history.summary('returns', '', *period, supplier_article='A') == {'count': 1, 'finished_price': 100}
+    assert [row['sale_id'] for row in history.find('returns', '', *period)] == ['R1']
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import pytest
+
+from jsonstream import JSONArrayParser, iter_json_array
+
+
+def parse_chunks(chunks):
+    parser = JSONArrayParser()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    items.extend(parser.close())
+    return items
+
+
+SAMPLES = [
+    '[]',
+    '[1.5, 2, -3e-2, 1.5e3, 10]',
+    '[true, false, null, "строка", 0]',
+    '[{"srid": "a", "finishedPrice": 1.5}, {"srid": "б", "items": [1, 2.25]}]',
+    ' [ 12345 , {"a": [1e10]} , "x" ] ',
+]
+
+
+@pytest.mark.parametrize('text', SAMPLES)
+def test_every_split_point(text):
+    data = text.encode('utf-8')
+    expected = json.loads(text)
+    for cut in range(len(data) + 1):
+        assert parse_chunks([data[:cut], data[cut:]]) == expected, cut
+
+
+@pytest.mark.parametrize('text', SAMPLES)
+def test_byte_by_byte(text):
+    data = text.encode('utf-8')
+    assert parse_chunks([data[i:i + 1] for i in range(len(data))]) == json.loads(text)
+
+
+def test_number_cut_at_chunk_boundary():
+    assert parse_chunks([b'[1.', b'5]']) == [1.5]
+    assert parse_chunks([b'[1.5e', b'3]']) == [1500.0]
+
+
+def test_empty_body_is_empty_array():
+    assert parse_chunks([b'']) == []
+
+
+@pytest.mark.parametrize('chunks', [[b'[1, 2'], [b'[{"a": 1}'], [b'[1.']])
+def test_truncated_array_raises(chunks):
+    with pytest.raises(ValueError):
+        parse_chunks(chunks)
+
+
+@pytest.mark.parametrize('text', ['[1 2]', '[,1]', '[1,,2]', '[1,]', '[{"a": 1} {"b": 2}]', '["a" "b"]'])
+def test_misplaced_comma_raises(text):
+    with pytest.raises(ValueError):
+        parse_chunks([text.encode('utf-8')])
+
+
+def test_not_an_array_raises():
+    with pytest.raises(ValueError):
+        parse_chunks([b'{"a": 1}'])
+
+
+def test_iter_json_array():
+    async def chunks():
+        for chunk in (b'[{"a"', b': 1}, 2', b'.5]'):
+            yield chunk
+
+    async def collect():
+        return [item async for item in iter_json_array(chunks())]
+
+    assert asyncio.run(collect()) == [{'a': 1}, 2.5]
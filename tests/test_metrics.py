@@ -0,0 +1,42 @@
+import asyncio
+
+from metrics import MetricsRegistry, serve_metrics
+
+
+def run_server(client, request_timeout=10):
+    async def main():
+        registry = MetricsRegistry()
+        registry.counter('wb_test_total', 'Тестовый счетчик').inc(3)
+        server = await serve_metrics(registry, '127.0.0.1', 0, request_timeout=request_timeout)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await client(port)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(main())
+
+
+def test_metrics_are_served():
+    async def client(port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        return response
+
+    response = run_server(client)
+    assert response.startswith(b'HTTP/1.1 200 OK')
+    assert b'wb_test_total 3' in response
+
+
+def test_idle_connection_is_closed():
+    async def client(port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        # Запрос не отправляется: сервер должен закрыть соединение сам
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+
+    assert run_server(client, request_timeout=0.1) == b''
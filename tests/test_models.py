@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from models import MOSCOW_TZ, Order, parse_date_string
+
+
+def test_naive_date_is_moscow_time():
+    value = parse_date_string('2024-05-01T10:00:00')
+    assert value == datetime(2024, 5, 1, 10, 0, tzinfo=MOSCOW_TZ)
+    assert value.astimezone(timezone.utc).hour == 7
+
+
+def test_z_suffix_is_utc():
+    value = parse_date_string('2024-05-01T10:00:00Z')
+    assert value == datetime(2024, 5, 1, 10, 0, tzinfo=timezone.utc)
+    # Одна и та же запись часов в MSK и UTC - разные моменты времени
+    assert value.timestamp() - parse_date_string('2024-05-01T10:00:00').timestamp() == 3 * 3600
+
+
+def test_explicit_offset_is_kept():
+    value = parse_date_string('2024-05-01T10:00:00+05:00')
+    assert value.utcoffset().total_seconds() == 5 * 3600
+
+
+def test_fractional_seconds():
+    assert parse_date_string('2024-05-01T10:00:00.12').microsecond == 120000
+    assert parse_date_string('2024-05-01T10:00:00.1234567Z').microsecond == 123456
+
+
+def test_unknown_format_raises():
+    with pytest.raises(ValueError):
+        parse_date_string('01.05.2024 10:00')
+
+
+def test_invalid_optional_date_becomes_none():
+    order = Order.from_api({'srid': 'o1', 'date': '2024-05-01T10:00:00', 'cancelDate': 'не дата'})
+    assert order.date == datetime(2024, 5, 1, 10, 0, tzinfo=MOSCOW_TZ)
+    assert order.cancel_date is None
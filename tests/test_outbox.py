@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from main import TelegramBot
+from storage import StateStore
+
+
+class FakeTelegram:
+    """Замена отправки в Telegram: запоминает доставленное, ошибки задаются по тексту сообщения"""
+
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = errors or {}
+
+    async def __call__(self, chat_id, text, reply_markup=None):
+        error = self.errors.pop(text, None)
+        if error is not None:
+            raise error
+        self.sent.append((chat_id, text))
+
+
+def make_bot(store, telegram):
+    bot = TelegramBot('123456:TEST', [], store)
+    bot._send_to_chat = telegram
+    return bot
+
+
+def deliver(bot, until, timeout=5):
+    """Работа обработчика очереди, пока until() не станет истинным"""
+    async def run():
+        worker = asyncio.create_task(bot.run_delivery_worker(idle_timeout=0.05))
+        try:
+            deadline = time.monotonic() + timeout
+            while not until():
+                assert time.monotonic() < deadline, "очередь не доставлена"
+                await asyncio.sleep(0.01)
+        finally:
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def test_message_is_removed_only_after_delivery(store):
+    telegram = FakeTelegram({'первое': ConnectionError('сеть недоступна')})
+    bot = make_bot(store, telegram)
+    asyncio.run(bot.send_notification('первое', ['1']))
+    deliver(bot, lambda: store.next_message_due() is not None and store.next_message_due() > time.time())
+    # Отправка не удалась: сообщение осталось в очереди с отложенным повтором
+    assert telegram.sent == []
+    assert store.outbox_size() == 1
+    with store.conn:
+        store.conn.execute("UPDATE outbox SET next_attempt_at = 0")
+    deliver(bot, lambda: store.outbox_size() == 0)
+    assert telegram.sent == [('1', 'первое')]
+
+
+def test_undelivered_messages_survive_restart(tmp_path):
+    path = str(tmp_path / 'state.db')
+    store = StateStore(path)
+    asyncio.run(make_bot(store, FakeTelegram()).send_notification('после перезапуска', ['1', '2']))
+    store.close()  # Процесс остановлен до доставки
+
+    store = StateStore(path)
+    telegram = FakeTelegram()
+    deliver(make_bot(store, telegram), lambda: store.outbox_size() == 0)
+    assert sorted(telegram.sent) == [('1', 'после перезапуска'), ('2', 'после перезапуска')]
+    store.close()
+
+
+def test_retry_after_delays_chat_and_keeps_order(store):
+    telegram = FakeTelegram({'a1': RetryAfter(30)})
+    bot = make_bot(store, telegram)
+    for text, chat_id in (('a1', 'a'), ('a2', 'a'), ('b1', 'b')):
+        asyncio.run(bot.send_notification(text, [chat_id]))
+    deliver(bot, lambda: ('b', 'b1') in telegram.sent)
+    # Чат a ждет указанное Telegram время и не получает a2 раньше a1, чат b не ждет
+    assert telegram.sent == [('b', 'b1')]
+    message_id, attempts, next_attempt_at = store.conn.execute(
+        "SELECT id, attempts, next_attempt_at FROM outbox WHERE text = 'a1'"
+    ).fetchone()
+    assert attempts == 1
+    assert 25 < next_attempt_at - time.time() <= 30
+    assert [row[2] for row in store.fetch_due_messages(10)] == []
+
+    store.retry_message(message_id, attempts, 0)
+    deliver(bot, lambda: store.outbox_size() == 0)
+    assert telegram.sent == [('b', 'b1'), ('a', 'a1'), ('a', 'a2')]
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import httpx
+
+from ratelimit import RequestGovernor, TokenBucket
+
+
+def test_token_bucket_spaces_requests():
+    async def run():
+        bucket = TokenBucket(20, capacity=1)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # Первый токен есть сразу, следующие два - через 1/20 сек каждый
+    assert 0.08 <= asyncio.run(run()) < 0.5
+
+
+def test_key_does_not_contain_token():
+    key = RequestGovernor.key('secret-token', 'statistics')
+    assert 'secret-token' not in key[0]
+    assert key == RequestGovernor.key('secret-token', 'statistics')
+    assert key != RequestGovernor.key('other-token', 'statistics')
+
+
+def test_quota_is_per_token_and_category():
+    governor = RequestGovernor()
+    statistics = governor.key('token', 'statistics')
+    feedbacks = governor.key('token', 'feedbacks')
+    other = governor.key('other-token', 'statistics')
+
+    async def run():
+        await governor.acquire(statistics, 1)
+
+    asyncio.run(run())
+    assert governor.delay(statistics, 1) > 0.9
+    assert governor.delay(feedbacks, 1) == 0
+    assert governor.delay(other, 1) == 0
+
+
+def test_retry_header_blocks_method():
+    governor = RequestGovernor()
+    key = governor.key('token', 'statistics')
+    response = httpx.Response(429, headers={'X-Ratelimit-Retry': '5'})
+    assert governor.observe(key, response) == 5
+    assert 4 < governor.delay(key, 100) <= 5
+
+
+def test_exhausted_quota_blocks_until_reset():
+    governor = RequestGovernor()
+    key = governor.key('token', 'statistics')
+    response = httpx.Response(200, headers={'X-Ratelimit-Remaining': '0', 'X-Ratelimit-Reset': '3'})
+    assert governor.observe(key, response) is None
+    assert 2 < governor.delay(key, 100) <= 3
+
+
+def test_success_needs_no_retry():
+    governor = RequestGovernor()
+    key = governor.key('token', 'statistics')
+    assert governor.observe(key, httpx.Response(200)) is None
+    assert governor.delay(key, 100) == 0
+
+
+def test_backoff_is_capped():
+    governor = RequestGovernor(base_backoff=1, max_backoff=10)
+    # Первый повтор - удвоенная базовая пауза с разбросом
+    assert 1 <= governor.backoff(1) <= 3
+    assert governor.backoff(20) <= 15
@@ -0,0 +1,40 @@
+from scheduler import AdaptiveInterval
+
+
+def test_base_interval_is_clamped():
+    assert AdaptiveInterval(5, 10, 60).interval == 10
+    assert AdaptiveInterval(100, 10, 60).interval == 60
+    # Максимум не может быть меньше минимума
+    assert AdaptiveInterval(30, 40, 20).interval == 40
+
+
+def test_empty_checks_back_off_up_to_max():
+    interval = AdaptiveInterval(40, 10, 100)
+    assert interval.update(0) == 60
+    assert interval.update(0) == 90
+    assert interval.update(0) == 100
+    assert interval.update(0) == 100
+
+
+def test_new_events_reset_towards_min():
+    interval = AdaptiveInterval(100, 10, 100)
+    assert interval.update(3) == 50
+    assert interval.update(1) == 25
+    assert interval.update(1) == 12.5
+    assert interval.update(1) == 10
+
+
+def test_rate_limit_doubles_interval_even_with_events():
+    interval = AdaptiveInterval(20, 10, 100)
+    assert interval.update(5, rate_limited=True) == 40
+    assert interval.update(0, rate_limited=True) == 80
+    assert interval.update(0, rate_limited=True) == 100
+
+
+def test_pause_respects_api_quota():
+    interval = AdaptiveInterval(10, 10, 100, requests_per_minute=6)
+    # Три запроса при квоте 6 в минуту требуют не меньше 30 секунд
+    assert interval.update(1, requests=3) == 30
+    # Сам интервал при этом остается у минимума
+    assert interval.interval == 10
+    assert interval.update(1, requests=1) == 10
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+import main
+from main import EventDigest, send_events
+from models import Order
+
+
+def order(i, article='A-1', warehouse='Коледино'):
+    return Order.from_api({
+        'srid': f'o{i}', 'date': f'2024-05-01T10:{i:02d}:00', 'supplierArticle': article,
+        'warehouseName': warehouse, 'finishedPrice': 100
+    })
+
+
+def send(orders):
+    """Прогон send_events по orders. Возвращает отправленные сообщения, число событий и число ack()"""
+    sent = []
+    acks = []
+
+    async def record(message, event_at):
+        sent.append((message, event_at))
+
+    async def events():
+        for item in orders:
+            yield item
+
+    digest = EventDigest("🛍 <b>Новые заказы", "💳 Сумма", lambda item: item.finished_price)
+    count = asyncio.run(send_events(
+        record, events(), lambda item: f"заказ {item.srid}", digest, lambda: acks.append(len(sent))
+    ))
+    return sent, count, acks
+
+
+def test_events_below_threshold_are_sent_one_by_one(monkeypatch):
+    monkeypatch.setattr(main, 'DIGEST_THRESHOLD', 3)
+    sent, count, acks = send([order(i) for i in range(3)])
+    assert count == 3
+    assert [message for message, _ in sent] == ['заказ o0', 'заказ o1', 'заказ o2']
+    assert sent[0][1] == order(0).date.timestamp()
+    # ack() только после постановки всех уведомлений
+    assert acks == [3]
+
+
+def test_events_above_threshold_become_digest(monkeypatch):
+    monkeypatch.setattr(main, 'DIGEST_THRESHOLD', 3)
+    orders = [order(i) for i in range(3)] + [order(3, warehouse='Тула'), order(4, article='B-2')]
+    sent, count, acks = send(orders)
+    assert count == 5
+    assert len(sent) == 1
+    message, event_at = sent[0]
+    assert message.startswith("🛍 <b>Новые заказы: 5</b>")
+    assert "📝 A-1 · 🏪 Коледино: 3 шт." in message
+    assert "📝 A-1 · 🏪 Тула: 1 шт." in message
+    assert "📝 B-2 · 🏪 Коледино: 1 шт." in message
+    # Задержка сводки считается от самого раннего события
+    assert event_at == order(0).date.timestamp()
+    assert acks == [1]
+
+
+def test_zero_threshold_sends_and_acks_each_event(monkeypatch):
+    monkeypatch.setattr(main, 'DIGEST_THRESHOLD', 0)
+    sent, count, acks = send([order(i) for i in range(12)])
+    assert count == 12
+    assert len(sent) == 12
+    assert acks[:12] == list(range(1, 13))
+
+
+def test_failed_notify_skips_ack(monkeypatch):
+    monkeypatch.setattr(main, 'DIGEST_THRESHOLD', 3)
+
+    async def broken(message, event_at):
+        raise ConnectionError('очередь недоступна')
+
+    acks = []
+
+    async def run():
+        async def events():
+            yield order(0)
+
+        digest = EventDigest("🛍 <b>Новые заказы", "💳 Сумма", lambda item: item.finished_price)
+        await send_events(broken, events(), lambda item: item.srid, digest, lambda: acks.append(True))
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    # События не подтверждены и будут выбраны повторно
+    assert acks == []
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from main import WildberriesAPI
+
+
+def test_concurrent_calls_share_one_check(store):
+    calls = []
+
+    async def check():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run():
+        wb_api = WildberriesAPI('stats-token-0000', 'feedback-token-0000', store)
+        try:
+            return await asyncio.gather(*(wb_api.single_flight('orders', check) for _ in range(3)))
+        finally:
+            await wb_api.close()
+
+    assert asyncio.run(run()) == [1, 1, 1]
+
+
+def test_cancelled_waiter_does_not_stop_check(store):
+    finished = []
+
+    async def check():
+        await asyncio.sleep(0.05)
+        finished.append(True)
+
+    async def run():
+        wb_api = WildberriesAPI('stats-token-0000', 'feedback-token-0000', store)
+        try:
+            waiter = asyncio.create_task(wb_api.single_flight('orders', check))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await wb_api.single_flight('orders', check)
+        finally:
+            await wb_api.close()
+
+    asyncio.run(run())
+    assert finished == [True]
+
+
+def test_close_stops_inflight_check(store):
+    state = {}
+
+    async def check():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state['cancelled'] = True
+            raise
+        state['finished'] = True
+
+    async def run():
+        wb_api = WildberriesAPI('stats-token-0000', 'feedback-token-0000', store)
+        waiter = asyncio.create_task(wb_api.single_flight('sales', check))
+        await asyncio.sleep(0.01)
+        await wb_api.close()
+        # Проверка остановлена до возврата из close(): клиенты и курсоры ей больше не нужны
+        assert state == {'cancelled': True}
+        assert not wb_api._inflight
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(run())
@@ -0,0 +1,51 @@
+
+
+
+def test_lease_is_exclusive_until_expiry(store):
+    assert store.acquire_lease('seller', 'worker-1', ttl=60)
+    assert not store.acquire_lease('seller', 'worker-2', ttl=60)
+    # Владелец продлевает свою аренду
+    assert store.acquire_lease('seller', 'worker-1', ttl=60)
+
+
+def test_expired_lease_is_taken_over(store):
+    assert store.acquire_lease('seller', 'worker-1', ttl=-1)
+    assert store.acquire_lease('seller', 'worker-2', ttl=60)
+    assert not store.acquire_lease('seller', 'worker-1', ttl=60)
+
+
+def test_released_lease_is_free(store):
+    store.acquire_lease('seller', 'worker-1', ttl=60)
+    store.release_lease('seller', 'worker-2')  # Чужая аренда не снимается
+    assert not store.acquire_lease('seller', 'worker-2', ttl=60)
+    store.release_lease('seller', 'worker-1')
+    assert store.acquire_lease('seller', 'worker-2', ttl=60)
+
+
+def test_removed_worker_frees_its_leases(store):
+    store.heartbeat('worker-1')
+    store.heartbeat('worker-2')
+    store.acquire_lease('a', 'worker-1', ttl=60)
+    store.acquire_lease('b', 'worker-1', ttl=60)
+    assert store.live_workers(ttl=60) == 2
+    store.remove_worker('worker-1')
+    assert store.live_workers(ttl=60) == 1
+    assert store.acquire_lease('a', 'worker-2', ttl=60)
+    assert store.acquire_lease('b', 'worker-2', ttl=60)
+
+
+def test_check_requests_are_popped_once(store):
+    store.request_check('a')
+    store.request_check('b')
+    assert sorted(store.pop_check_requests(['a', 'c'])) == ['a']
+    assert store.pop_check_requests(['a']) == []
+    assert store.pop_check_requests(['b']) == ['b']
+
+
+def test_backfill_requests_are_popped_per_seller(store):
+    store.request_backfill('a', '2025-03-01', '2025-03-02', '100')
+    store.request_backfill('a', '2025-03-05', '2025-03-06', '200')  # Заменяет прежний запрос
+    store.request_backfill('b', '2025-03-01', '2025-03-01', '100')
+    assert store.pop_backfill_requests(['a', 'c']) == [('a', '2025-03-05', '2025-03-06', '200')]
+    assert store.pop_backfill_requests(['a']) == []
+    assert [row[0] for row in store.pop_backfill_requests(['b'])] == ['b']